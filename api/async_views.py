@@ -0,0 +1,409 @@
+import asyncio
+import json
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.drone_async import AsyncDroneClient
+from api.drone_cache import async_cached_build, remember_build
+from api.events import hub, parse_cursor, start_listener, stream_events
+from api.idempotency import claim_key, request_hash, store_response
+from api.jobs import BLOCKING_STATUSES, JOB_NAMES, PROMOTE_TARGETS, UPGRADE_BLOCKING_STATUSES, NoDroneCIServer, \
+    enqueue_job, finish_job, get_or_create_placeholder, mark_submitted, same_config_build, \
+    save_drone_build
+from api.logs import parse_event_id, stream_build_logs
+from api.models import BlockChain, BlockChainBuildDeploy, DroneCIServer, LATEST_JOB_FIELDS
+from api.params import config_fingerprint, job_params
+from api.renderers import EventStreamRenderer
+from api.serializers import BlockChainBuildDeploySerializer
+from api.streaming import AsyncStreamingHttpResponse, is_asgi
+from api.views import TRUE_VALUES
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+STATUS_KEYS = {
+    BlockChainBuildDeploy.BUILD: 'build',
+    BlockChainBuildDeploy.DEPLOY: 'deploy',
+    BlockChainBuildDeploy.TERMINATE: 'terminate',
+}
+
+
+def async_view(*methods):
+    """
+    Marks a coroutine as api view
+    Only allows methods and leaves CSRF checks to the REST_FRAMEWORK
+    authentication classes like DRF views do
+    """
+    def decorator(view):
+        async def wrapped_view(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({"detail": 'Method "%s" not allowed.' % request.method},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED)
+            return await view(request, *args, **kwargs)
+
+        wrapped_view.csrf_exempt = True
+        wrapped_view.__name__ = view.__name__
+        wrapped_view.__doc__ = view.__doc__
+        return wrapped_view
+    return decorator
+
+
+@sync_to_async
+def authenticate(request, admin=True):
+    """
+    Authenticates request with REST_FRAMEWORK authentication classes
+    Returns the admin user, any user unless admin, and None or None and the error response
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException as e:
+        return None, JsonResponse({"detail": e.detail}, status=e.status_code)
+
+    if not user or not user.is_authenticated:
+        return None, JsonResponse({"detail": "Authentication credentials were not provided."},
+                                  status=status.HTTP_401_UNAUTHORIZED)
+    if admin and not user.is_staff:
+        return None, JsonResponse({"detail": "You do not have permission to perform this action."},
+                                  status=status.HTTP_403_FORBIDDEN)
+
+    return user, None
+
+
+@sync_to_async
+def get_or_none(queryset, **kwargs):
+    try:
+        return queryset.get(**kwargs)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+@sync_to_async
+def latest_jobs(block_chain, job_types):
+    """
+    Latest jobs of the types of a blockchain, fetched by the pointers of the blockchain in one query
+    """
+    ids = [getattr(block_chain, LATEST_JOB_FIELDS[job_type] + '_id') for job_type in job_types]
+    jobs = BlockChainBuildDeploy.objects.select_related('droneci_server').in_bulk([pk for pk in ids if pk])
+    return [jobs.get(pk) for pk in ids]
+
+
+def not_found():
+    return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+
+def drone_error_response(result):
+    """
+    Response for a failed Drone CI api call
+    """
+    return JsonResponse(result.as_dict(), status=result.http_status, safe=False)
+
+
+def refresh_requested(request):
+    return request.GET.get('refresh', '').lower() in TRUE_VALUES
+
+
+async def fetch_build(build_deploy):
+    """
+    Build details of a job from drone, None if it has not started on drone yet
+    """
+    if build_deploy is None or not build_deploy.build_no:
+        return None
+    return await async_cached_build(AsyncDroneClient(build_deploy.droneci_server), build_deploy.build_no)
+
+
+@sync_to_async
+def save_fetched_build(build_deploy, result):
+    """
+    Updates BlockChainBuildDeploy object with fetched build details
+    Returns the updated object
+    """
+    if result is None or not result.ok:
+        return build_deploy
+    return save_drone_build(build_deploy.id, result.data) or build_deploy
+
+
+@async_view('GET')
+async def build_deploy_detail(request, pk, job_type, format=None):
+    """
+    Retrieves build, deployment or termination details
+    ?refresh=true fetches them from the remote build server first
+    <pk> BlockChainBuildDeploy ID
+    """
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    queryset = BlockChainBuildDeploy.objects.select_related('droneci_server')
+    build_deploy = await get_or_none(queryset, id=pk, type=job_type)
+    if build_deploy is None:
+        return not_found()
+
+    if refresh_requested(request):
+        response = await fetch_build(build_deploy)
+        if response is not None and not response.ok:
+            return drone_error_response(response)
+        build_deploy = await save_fetched_build(build_deploy, response)
+
+    return JsonResponse(BlockChainBuildDeploySerializer(build_deploy).data)
+
+
+@async_view('GET')
+async def build_deploy_logs(request, pk, format=None):
+    """
+    Streams the log of a build, deployment or termination as server-sent events
+    Log lines of the job as line events until an end event, see stream_build_logs
+    <pk> BlockChainBuildDeploy ID
+
+    Every line has the id <stage>.<step>.<pos>, the Last-Event-ID header or
+    ?last_event_id= resumes after the line with the id. Streams are only served
+    under ASGI, under WSGI they would hold the worker.
+    """
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    build_deploy = await get_or_none(BlockChainBuildDeploy.objects.select_related('droneci_server'), id=pk)
+    if build_deploy is None:
+        return not_found()
+    if not build_deploy.build_no:
+        return JsonResponse({"detail": "Job has not started on Drone CI yet!"}, status=status.HTTP_404_NOT_FOUND)
+
+    after = None
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    if last_event_id:
+        after = parse_event_id(last_event_id)
+        if after is None:
+            return JsonResponse({"detail": "Invalid last event id %s!" % last_event_id},
+                                status=status.HTTP_400_BAD_REQUEST)
+    if not is_asgi(request):
+        return JsonResponse({"detail": "Log streams are only served under ASGI!"},
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
+
+    response = AsyncStreamingHttpResponse(
+        stream_build_logs(AsyncDroneClient(build_deploy.droneci_server), build_deploy.build_no, after),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # do not let proxies buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_view('POST')
+async def build_deploy_create(request, pk, job_type, format=None):
+    """
+    Starts build, deployment or termination of blockchain
+    Builds of an unchanged blockchain configuration are not run again unless ?force=true
+    Requests sent again with the same Idempotency-Key header get the first response
+    <pk> BlockChain ID
+    """
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+    if not key:
+        return await create_job(request, user, pk, job_type)
+    if len(key) > 255:
+        return JsonResponse({"detail": "Idempotency-Key is too long!"}, status=status.HTTP_400_BAD_REQUEST)
+
+    record, replay = await sync_to_async(claim_key)(user, key, request_hash(request))
+    if replay is not None:
+        status_code, data, location = replay
+        response = JsonResponse(data, status=status_code, safe=False)
+        response['Idempotent-Replayed'] = 'true'
+        if location:
+            response['Location'] = location
+        return response
+
+    try:
+        response = await create_job(request, user, pk, job_type)
+    except Exception:
+        await sync_to_async(record.delete)()
+        raise
+    await sync_to_async(store_response)(record, response.status_code, json.loads(response.content),
+                                        response.get('Location'))
+    return response
+
+
+async def create_job(request, user, pk, job_type):
+    block_chain = await get_or_none(BlockChain.objects, id=pk)
+    if block_chain is None:
+        return not_found()
+
+    build = None
+    if job_type != BlockChainBuildDeploy.BUILD:
+        build, = await latest_jobs(block_chain, [BlockChainBuildDeploy.BUILD])
+        if build is None:
+            return JsonResponse({"detail": "Blockchain has no build yet!"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # a build of the same configuration is not run again unless forced
+    force = job_type == BlockChainBuildDeploy.BUILD and request.GET.get('force', '').lower() in TRUE_VALUES
+    if job_type == BlockChainBuildDeploy.BUILD and not force:
+        same = await sync_to_async(same_config_build)(block_chain)
+        if same is not None:
+            return JsonResponse({
+                "detail": "Blockchain configuration did not change since build %s!" % same.id,
+                "build": BlockChainBuildDeploySerializer(same).data,
+            })
+
+    # a build replaces a successful build of another configuration
+    upgrade = job_type == BlockChainBuildDeploy.BUILD
+
+    # one request starts the job, concurrent and repeated ones get the job in progress
+    worker = 'async:%s' % uuid.uuid4().hex
+    drone_job = await sync_to_async(enqueue_job)(block_chain, job_type, user, upgrade=upgrade, worker=worker)
+    if drone_job.locked_by != worker:
+        url = request.build_absolute_uri(reverse('drone_job_detail', args=[drone_job.id]))
+        response = JsonResponse({"id": drone_job.id, "status": drone_job.status, "url": url},
+                                status=status.HTTP_202_ACCEPTED)
+        response['Location'] = url
+        return response
+
+    response, submitted = await submit_job(drone_job, block_chain, build, upgrade)
+    await sync_to_async(finish_job)(drone_job, submitted, json.loads(response.content))
+    return response
+
+
+async def submit_job(drone_job, block_chain, build, upgrade):
+    """
+    Starts the job of a DroneJob claimed by the request on drone
+    Returns the response and whether drone accepted the job
+    """
+    job_type = drone_job.type
+
+    # create placeholder object, an upgrade replaces a successful build
+    try:
+        build_deploy = await sync_to_async(get_or_create_placeholder)(block_chain, job_type, drone_job.created_by,
+                                                                      parent=build, upgrade=upgrade)
+    except NoDroneCIServer as exc:
+        return JsonResponse({"detail": exc.detail}, status=exc.status_code), False
+    drone_job.build_deploy = build_deploy
+    droneci_server = await get_or_none(DroneCIServer.objects, id=build_deploy.droneci_server_id)
+    if droneci_server is None:
+        return not_found(), False
+
+    # get remote status of the latest job with drone api
+    response_status = await AsyncDroneClient(droneci_server).build(build_deploy.build_no)
+    # a missing build is fine, an unreachable server is not
+    if response_status.status_code is None:
+        return drone_error_response(response_status), False
+    job_status = response_status.get('status')
+    if job_status in (UPGRADE_BLOCKING_STATUSES if upgrade else BLOCKING_STATUSES):
+        return JsonResponse({
+            "detail": "Can not start a new %s! Current status: %s" % (JOB_NAMES[job_type], job_status)
+        }), False
+
+    # submit to the server recorded on the placeholder, builds were scheduled when it was created
+    drone = AsyncDroneClient(droneci_server)
+
+    params = job_params(block_chain, build_deploy)
+    if job_type == BlockChainBuildDeploy.BUILD:
+        response = await drone.create_build(params)
+    else:
+        response = await drone.promote(build.build_no, PROMOTE_TARGETS[job_type], params)
+    if not response.ok:
+        return drone_error_response(response), False
+
+    # check if request returns None data
+    if response.data is None:
+        return JsonResponse({"detail": "Request returned %s! I have a bad feeling about this." % response.data}), \
+            False
+
+    # update placeholder BlockChainBuildDeploy object with real data
+    if job_type == BlockChainBuildDeploy.BUILD:
+        build_deploy.fingerprint = config_fingerprint(block_chain)
+    await sync_to_async(mark_submitted)(build_deploy, response.data, droneci_server)
+    await sync_to_async(remember_build)(droneci_server, response.data)
+
+    return JsonResponse(response.data, safe=False), True
+
+
+@async_view('GET')
+async def blockchain_status(request, pk, format=None):
+    """
+    Latest build, deployment and termination of blockchain with their status
+    ?refresh=true fetches their statuses from the remote build server first, concurrently
+    <pk> BlockChain ID
+    """
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    block_chain = await get_or_none(BlockChain.objects, id=pk)
+    if block_chain is None:
+        return not_found()
+
+    job_types = list(STATUS_KEYS)
+    jobs = await latest_jobs(block_chain, job_types)
+
+    if refresh_requested(request):
+        results = await asyncio.gather(*[fetch_build(job) for job in jobs])
+        jobs = [await save_fetched_build(job, result) for job, result in zip(jobs, results)]
+
+    data = {}
+    for job_type, build_deploy in zip(job_types, jobs):
+        name = STATUS_KEYS[job_type]
+        if build_deploy is None:
+            data[name] = None
+            continue
+        data[name] = {
+            'id': build_deploy.id,
+            'build_no': build_deploy.build_no,
+            'status': build_deploy.status,
+            'started_at': build_deploy.started_at,
+            'finished_at': build_deploy.finished_at,
+        }
+
+    return JsonResponse(data)
+
+
+@async_view('GET')
+async def event_list(request, owned=False, format=None):
+    """
+    Waits up to ?wait= seconds, EVENTS_WAIT at most, for status events after ?cursor=
+    and answers as soon as one arrives, see EventViewSet
+    Events of the user's blockchains if owned, every event for admins otherwise
+
+    With Accept: text/event-stream events are streamed as server-sent events,
+    the Last-Event-ID header resumes after a cursor. Waits and streams are only
+    served under ASGI, under WSGI they would hold the worker.
+    """
+    user, error = await authenticate(request, admin=not owned)
+    if error:
+        return error
+
+    def match(event):
+        return not owned or event.get('owner') == user.id
+
+    # waits up to 5 seconds for the first listener of the process, off the event loop thread
+    await sync_to_async(start_listener, thread_sensitive=False)()
+    try:
+        cursor = parse_cursor(request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('cursor'))
+        wait = max(min(float(request.GET.get('wait', env('EVENTS_WAIT'))), env('EVENTS_WAIT')), 0)
+    except ValueError:
+        return JsonResponse({"detail": "Invalid cursor or wait!"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if EventStreamRenderer.media_type in request.META.get('HTTP_ACCEPT', ''):
+        if not is_asgi(request):
+            return JsonResponse({"detail": "Event streams are only served under ASGI!"},
+                                status=status.HTTP_406_NOT_ACCEPTABLE)
+        response = AsyncStreamingHttpResponse(stream_events(cursor, match), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    events, next_cursor = await hub.async_wait(cursor, match, wait if is_asgi(request) else 0)
+    return JsonResponse({
+        "cursor": next_cursor if next_cursor is not None else hub.cursor(),
+        "events": events,
+        "reset": next_cursor is None,
+    })
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from backend.settings import env
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# weight of the latest call in the latency average
+EWMA_ALPHA = 0.2
+
+# one breaker and bulkhead per DroneCIServer and process
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker and bulkhead of one DroneCIServer
+
+    Opens after DRONE_BREAKER_FAILURES consecutive failed or slow calls, slow
+    meaning slower than the DRONE_BREAKER_SLOW_CALL latency SLO. An open
+    breaker rejects calls for DRONE_BREAKER_RESET_TIMEOUT seconds, then lets
+    DRONE_BREAKER_HALF_OPEN_CALLS probes through, closing again when they
+    succeed.
+
+    The bulkhead caps in-flight calls at DRONE_BULKHEAD_SIZE, callers wait up
+    to DRONE_BULKHEAD_TIMEOUT seconds for a free slot.
+    """
+
+    def __init__(self, droneci_server_id):
+        self.droneci_server_id = droneci_server_id
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+        self.latency = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.size = env('DRONE_BULKHEAD_SIZE')
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.async_slots = weakref.WeakKeyDictionary()
+
+    def allow(self):
+        """
+        Whether a call may go out now
+        A call that is allowed must be followed by record()
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < env('DRONE_BREAKER_RESET_TIMEOUT'):
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+
+            if self.state == HALF_OPEN:
+                if self.probes >= env('DRONE_BREAKER_HALF_OPEN_CALLS'):
+                    self.rejected += 1
+                    return False
+                self.probes += 1
+            return True
+
+    def record(self, failed, elapsed):
+        """
+        Records the outcome of an allowed call
+        """
+        failed = failed or elapsed > env('DRONE_BREAKER_SLOW_CALL')
+        with self.lock:
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += EWMA_ALPHA * (elapsed - self.latency)
+
+            if self.state == HALF_OPEN:
+                self.probes -= 1
+                if failed:
+                    self._open()
+                elif self.probes == 0:
+                    self.state = CLOSED
+                    self.failures = 0
+            elif failed:
+                self.failures += 1
+                if self.state == CLOSED and self.failures >= env('DRONE_BREAKER_FAILURES'):
+                    self._open()
+            else:
+                self.failures = 0
+
+    def forget(self):
+        """
+        Ends an allowed call without an outcome, like a cancelled one
+        """
+        with self.lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def acquire(self):
+        """
+        Takes a bulkhead slot, False if none got free in time
+        """
+        if not self.slots.acquire(timeout=env('DRONE_BULKHEAD_TIMEOUT')):
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    async def async_acquire(self):
+        """
+        acquire for the running event loop
+        Every loop gets its own slots, threads of sync calls do not block it
+        """
+        slots = self.async_slots.get(asyncio.get_running_loop())
+        if slots is None:
+            slots = self.async_slots[asyncio.get_running_loop()] = asyncio.BoundedSemaphore(self.size)
+        try:
+            await asyncio.wait_for(slots.acquire(), env('DRONE_BULKHEAD_TIMEOUT'))
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.in_flight += 1
+        return True
+
+    def async_release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.async_slots[asyncio.get_running_loop()].release()
+
+    def as_dict(self):
+        with self.lock:
+            state = self.state
+            if state == OPEN and time.monotonic() - self.opened_at >= env('DRONE_BREAKER_RESET_TIMEOUT'):
+                # the next call will probe
+                state = HALF_OPEN
+            return {
+                'state': state,
+                'failures': self.failures,
+                'open_for': round(time.monotonic() - self.opened_at, 3) if self.state == OPEN else None,
+                'latency': round(self.latency, 4) if self.latency is not None else None,
+                'in_flight': self.in_flight,
+                'bulkhead_size': self.size,
+                'rejected': self.rejected,
+            }
+
+
+def get_breaker(droneci_server_id):
+    with _breakers_lock:
+        breaker = _breakers.get(droneci_server_id)
+        if breaker is None:
+            breaker = _breakers[droneci_server_id] = CircuitBreaker(droneci_server_id)
+    return breaker
+
+
+def is_failure(result):
+    """
+    Whether a call result counts against the server
+    Answers about the request itself, like 404, do not
+    """
+    if result.ok:
+        return False
+    if result.status_code is None:
+        return True
+    return result.status_code >= 500 or result.status_code == 429
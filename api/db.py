@@ -0,0 +1,49 @@
+import time
+
+from django.db import connections
+
+from backend.settings import env
+
+
+def check_connections():
+    """
+    Closes persistent connections the database or a pooler dropped while they
+    were idle, they are opened again when next used
+
+    Costs one round trip per connection idle for more than
+    DATABASE_HEALTH_CHECK_IDLE seconds, connections of busy workers are used
+    unchecked. Connections are only open between requests with DATABASE_CONN_MAX_AGE.
+    """
+    if not env('DATABASE_HEALTH_CHECKS'):
+        return
+    idle = env('DATABASE_HEALTH_CHECK_IDLE')
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        # never used by a request, like the connections of warmup_connections
+        used_at = getattr(connection, 'used_at', None)
+        if used_at is not None and now - used_at < idle:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+def touch_connections():
+    """
+    Records when the open connections were last used, at the end of each request
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.used_at = now
+
+
+def warmup_connections():
+    """
+    Opens the database connections of the calling thread ahead of its first request
+    """
+    if not env('DATABASE_CONN_MAX_AGE'):
+        return
+    for connection in connections.all():
+        connection.ensure_connection()
@@ -0,0 +1,311 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api import ratelimit
+from api.breaker import get_breaker, is_failure
+from api.instrumentation import outbound
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+# methods that are safe to send again after a failed attempt
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# upstream answers worth retrying for idempotent methods
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+# errors of calls the breaker, bulkhead or rate limit of the server refused to send
+REJECTED_ERRORS = ('CircuitOpen', 'BulkheadFull', 'RateLimited')
+
+# drone build statuses of builds still in progress
+ACTIVE_STATUSES = ('pending', 'running', 'waiting_on_dependencies', 'blocked')
+# drone build statuses that do not change anymore
+FINISHED_STATUSES = ('success', 'failure', 'error', 'killed', 'skipped', 'declined')
+
+# one keep-alive session per DroneCIServer
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class DroneResult:
+    """
+    Result of a Drone CI api call
+
+    :status_code HTTP status code of the last answer, None if no answer
+    :data decoded JSON body of the answer
+    :error None on success, otherwise one of
+           TIMEOUT, HTTPError, ConnectTimeout, GENErr,
+           CircuitOpen, BulkheadFull, RateLimited
+    :message human readable error message
+    """
+
+    def __init__(self, status_code=None, data=None, error=None, message=''):
+        self.status_code = status_code
+        self.data = data
+        self.error = error
+        self.message = message
+
+    def __repr__(self):
+        return '<DroneResult %s %s>' % (self.status_code, self.error or 'ok')
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def http_status(self):
+        """
+        HTTP status code to answer api clients with on failure
+        """
+        if self.status_code == 404:
+            return 404
+        if self.error == 'TIMEOUT':
+            return 504
+        if self.error in REJECTED_ERRORS:
+            return 503
+        return 502
+
+    def get(self, key, default=None):
+        if isinstance(self.data, dict):
+            return self.data.get(key, default)
+        return default
+
+    def as_dict(self):
+        """
+        Body to return to api clients
+        """
+        if self.ok:
+            return self.data
+        return {
+            'status_code': self.error,
+            'status': 'failed',
+            'message': self.message,
+        }
+
+
+def _signature_params(header):
+    return dict(re.findall(r'(\w+)="([^"]*)"', header))
+
+
+def verify_webhook_signature(request):
+    """
+    Verifies the HTTP signature drone signs webhooks with DRONE_WEBHOOK_SECRET
+
+    Drone signs the date and digest headers with hmac-sha256, the digest is
+    the SHA-256 of the body and the date must be within DRONE_WEBHOOK_MAX_SKEW.
+    """
+    secret = env('DRONE_WEBHOOK_SECRET')
+    header = request.META.get('HTTP_SIGNATURE', '')
+    if not secret or not header:
+        return False
+
+    params = _signature_params(header)
+    if params.get('algorithm', 'hmac-sha256') != 'hmac-sha256' or 'signature' not in params:
+        return False
+    headers = params.get('headers', 'date').lower().split()
+    if 'date' not in headers or 'digest' not in headers:
+        return False
+
+    lines = []
+    for name in headers:
+        if name == '(request-target)':
+            lines.append('(request-target): %s %s' % (request.method.lower(), request.get_full_path()))
+        else:
+            value = request.META.get('HTTP_' + name.upper().replace('-', '_'))
+            if value is None:
+                return False
+            lines.append('%s: %s' % (name, value))
+    expected = base64.b64encode(hmac.new(secret.encode(), '\n'.join(lines).encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(expected, params['signature'].encode()):
+        return False
+
+    digest = 'SHA-256=' + base64.b64encode(hashlib.sha256(request.body).digest()).decode()
+    if not hmac.compare_digest(digest, request.META['HTTP_DIGEST']):
+        return False
+
+    try:
+        sent = parsedate_to_datetime(request.META['HTTP_DATE']).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return abs(time.time() - sent) <= env('DRONE_WEBHOOK_MAX_SKEW')
+
+
+def rejected_result(error, droneci_server):
+    if error == 'CircuitOpen':
+        message = 'Drone CI server %s is failing, not sending requests for now' % droneci_server.name
+    elif error == 'RateLimited':
+        message = 'Rate limit of Drone CI server %s reached' % droneci_server.name
+    else:
+        message = 'Too many requests in flight to Drone CI server %s' % droneci_server.name
+    return DroneResult(error=error, message=message)
+
+
+def _get_session(droneci_server):
+    """
+    Returns the pooled session of a DroneCIServer, creating it on first use
+    A changed server url or token gets a fresh session
+    """
+    key = (droneci_server.id, droneci_server.server, droneci_server.token)
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            # drop sessions of the same server with outdated url or token
+            for stale in [k for k in _sessions if k[0] == droneci_server.id]:
+                _sessions.pop(stale).close()
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=env('DRONE_POOL_MAXSIZE'),
+                                  max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({"Authorization": "Bearer %s" % droneci_server.token})
+            _sessions[key] = session
+
+    return session
+
+
+def _decode(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def _backoff(attempt):
+    """
+    Full jitter exponential backoff
+    """
+    ceiling = min(env('DRONE_RETRY_BACKOFF') * (2 ** attempt), env('DRONE_RETRY_BACKOFF_MAX'))
+    return random.uniform(0, ceiling)
+
+
+class DroneClient:
+    """
+    Client for the Drone CI api of a DroneCIServer
+
+    Requests share one keep-alive connection pool per server, every call has
+    connect and read deadlines and idempotent calls are retried with jittered
+    backoff. Calls go through the shared rate limit, circuit breaker and
+    bulkhead of the server.
+
+    :rate_wait seconds a call waits on the rate limit at most, 0 fails fast,
+               DRONE_RATE_WAIT by default
+    """
+
+    def __init__(self, droneci_server, rate_wait=None):
+        self.droneci_server = droneci_server
+        self.server = droneci_server.server.rstrip('/')
+        self.session = _get_session(droneci_server)
+        self.breaker = get_breaker(droneci_server.id)
+        self.rate_wait = env('DRONE_RATE_WAIT') if rate_wait is None else rate_wait
+
+    @property
+    def repo_path(self):
+        return '/api/repos/%s/%s' % (env('BUILD_DEPLOY_ORG'), env('BUILD_DEPLOY_REPO'))
+
+    def request(self, method, path, params=None, timeout=None, retries=None):
+        method = method.upper()
+        url = self.server + path
+        if timeout is None:
+            timeout = (env('DRONE_CONNECT_TIMEOUT'), env('DRONE_READ_TIMEOUT'))
+        if retries is None:
+            retries = env('DRONE_MAX_RETRIES') if method in IDEMPOTENT_METHODS else 0
+
+        attempt = 0
+        while True:
+            result, retry, unsent = self._guarded_send(method, url, params, timeout)
+            # requests that never reached drone are safe to send again
+            retry = retry and (method in IDEMPOTENT_METHODS or unsent)
+            if not retry or attempt >= retries:
+                return result
+
+            delay = _backoff(attempt)
+            logger.warning("Drone %s %s failed with %s, retrying in %.2fs", method, path, result.error, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _guarded_send(self, method, url, params, timeout):
+        """
+        _send through the bulkhead, circuit breaker and rate limit of the server
+        Rejected calls do not take a rate limit token, that costs a database update
+        """
+        if not self.breaker.acquire():
+            return rejected_result('BulkheadFull', self.droneci_server), False, True
+        try:
+            if not self.breaker.allow():
+                return rejected_result('CircuitOpen', self.droneci_server), False, True
+            if not ratelimit.acquire(self.droneci_server, self.rate_wait):
+                self.breaker.forget()
+                return rejected_result('RateLimited', self.droneci_server), False, True
+            started = time.monotonic()
+            outcome = self._send(method, url, params, timeout)
+            self.breaker.record(is_failure(outcome[0]), time.monotonic() - started)
+            return outcome
+        finally:
+            self.breaker.release()
+
+    def _send(self, method, url, params, timeout):
+        """
+        Sends one request
+        Returns the result, whether the failure is worth a retry and
+        whether the request surely never reached drone
+        """
+        try:
+            with outbound('drone'):
+                response = self.session.request(method=method, url=url, params=params, timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.ConnectTimeout as ect:
+            return DroneResult(error='ConnectTimeout', message=str(ect)), True, True
+        except requests.exceptions.Timeout as et:
+            return DroneResult(error='TIMEOUT', message=json.dumps(str(et))), True, False
+        except requests.exceptions.HTTPError as eh:
+            response = eh.response
+            return DroneResult(status_code=response.status_code,
+                               data=_decode(response),
+                               error='HTTPError',
+                               message=json.dumps(str(eh))), response.status_code in RETRY_STATUS_CODES, False
+        except requests.exceptions.ConnectionError as errc:
+            return DroneResult(error='ConnectTimeout', message=str(errc)), True, False
+        except requests.exceptions.RequestException as err:
+            return DroneResult(error='GENErr', message=json.dumps(str(err))), False, False
+
+        return DroneResult(status_code=response.status_code, data=_decode(response)), False, False
+
+    def build(self, build_no):
+        """
+        Build details
+        GET /api/repos/<org>/<repo>/builds/<build_no>
+        """
+        return self.request('GET', '%s/builds/%s' % (self.repo_path, build_no))
+
+    def create_build(self, params):
+        """
+        Starts a new build of BUILD_DEPLOY_BRANCH
+        POST /api/repos/<org>/<repo>/builds
+
+        :params build parameters as (name, value) pairs
+        """
+        query = [('branch', env('BUILD_DEPLOY_BRANCH'))] + list(params)
+        return self.request('POST', '%s/builds' % self.repo_path, params=query)
+
+    def promote(self, build_no, target, params):
+        """
+        Promotes a build to target
+        POST /api/repos/<org>/<repo>/builds/<build_no>/promote
+
+        :params promotion parameters as (name, value) pairs
+        """
+        query = [('target', target)] + list(params)
+        return self.request('POST', '%s/builds/%s/promote' % (self.repo_path, build_no), params=query)
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from urllib.parse import urlencode
+
+import httpx
+
+from api import ratelimit
+from api.breaker import get_breaker, is_failure
+from api.drone import DroneResult, IDEMPOTENT_METHODS, RETRY_STATUS_CODES, rejected_result, _backoff, _decode
+from api.instrumentation import outbound
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+# one keep-alive client per DroneCIServer and event loop
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _get_client(droneci_server):
+    """
+    Returns the pooled async client of a DroneCIServer for the running loop
+    A changed server url or token gets a fresh client
+    """
+    loop = asyncio.get_running_loop()
+    key = (droneci_server.id, droneci_server.server, droneci_server.token)
+
+    with _clients_lock:
+        clients = _clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            # drop clients of the same server with outdated url or token
+            for stale in [k for k in clients if k[0] == droneci_server.id]:
+                loop.create_task(clients.pop(stale).aclose())
+
+            client = httpx.AsyncClient(
+                headers={"Authorization": "Bearer %s" % droneci_server.token},
+                limits=httpx.Limits(max_connections=env('DRONE_POOL_MAXSIZE'),
+                                    max_keepalive_connections=env('DRONE_POOL_MAXSIZE')),
+            )
+            clients[key] = client
+
+    return client
+
+
+class AsyncDroneClient:
+    """
+    asyncio client for the Drone CI api of a DroneCIServer
+
+    Same contract as DroneClient, waiting on drone does not hold a thread.
+    """
+
+    def __init__(self, droneci_server, rate_wait=None):
+        self.droneci_server = droneci_server
+        self.server = droneci_server.server.rstrip('/')
+        self.client = _get_client(droneci_server)
+        self.breaker = get_breaker(droneci_server.id)
+        self.rate_wait = env('DRONE_RATE_WAIT') if rate_wait is None else rate_wait
+
+    @property
+    def repo_path(self):
+        return '/api/repos/%s/%s' % (env('BUILD_DEPLOY_ORG'), env('BUILD_DEPLOY_REPO'))
+
+    async def request(self, method, path, params=None, timeout=None, retries=None):
+        method = method.upper()
+        url = self.server + path
+        if timeout is None:
+            timeout = httpx.Timeout(env('DRONE_READ_TIMEOUT'), connect=env('DRONE_CONNECT_TIMEOUT'))
+        if retries is None:
+            retries = env('DRONE_MAX_RETRIES') if method in IDEMPOTENT_METHODS else 0
+
+        attempt = 0
+        while True:
+            result, retry, unsent = await self._guarded_send(method, url, params, timeout)
+            # requests that never reached drone are safe to send again
+            retry = retry and (method in IDEMPOTENT_METHODS or unsent)
+            if not retry or attempt >= retries:
+                return result
+
+            delay = _backoff(attempt)
+            logger.warning("Drone %s %s failed with %s, retrying in %.2fs",
+                           method, path.split('?')[0], result.error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _guarded_send(self, method, url, params, timeout):
+        """
+        _send through the bulkhead, circuit breaker and rate limit of the server
+        Rejected calls do not take a rate limit token, that costs a database update
+        """
+        if not await self.breaker.async_acquire():
+            return rejected_result('BulkheadFull', self.droneci_server), False, True
+        try:
+            if not self.breaker.allow():
+                return rejected_result('CircuitOpen', self.droneci_server), False, True
+            try:
+                acquired = await ratelimit.async_acquire(self.droneci_server, self.rate_wait)
+            except asyncio.CancelledError:
+                self.breaker.forget()
+                raise
+            if not acquired:
+                self.breaker.forget()
+                return rejected_result('RateLimited', self.droneci_server), False, True
+            started = time.monotonic()
+            try:
+                outcome = await self._send(method, url, params, timeout)
+            except asyncio.CancelledError:
+                self.breaker.forget()
+                raise
+            self.breaker.record(is_failure(outcome[0]), time.monotonic() - started)
+            return outcome
+        finally:
+            self.breaker.async_release()
+
+    async def _send(self, method, url, params, timeout):
+        """
+        Sends one request
+        Returns the result, whether the failure is worth a retry and
+        whether the request surely never reached drone
+        """
+        try:
+            with outbound('drone'):
+                response = await self.client.request(method, url, params=params, timeout=timeout)
+            response.raise_for_status()
+        except (httpx.ConnectTimeout, httpx.ConnectError) as ect:
+            return DroneResult(error='ConnectTimeout', message=str(ect)), True, True
+        except httpx.TimeoutException as et:
+            return DroneResult(error='TIMEOUT', message=json.dumps(str(et))), True, False
+        except httpx.HTTPStatusError as eh:
+            response = eh.response
+            return DroneResult(status_code=response.status_code,
+                               data=_decode(response),
+                               error='HTTPError',
+                               message=json.dumps(str(eh))), response.status_code in RETRY_STATUS_CODES, False
+        except httpx.NetworkError as errc:
+            return DroneResult(error='ConnectTimeout', message=str(errc)), True, False
+        except httpx.HTTPError as err:
+            return DroneResult(error='GENErr', message=json.dumps(str(err))), False, False
+
+        return DroneResult(status_code=response.status_code, data=_decode(response)), False, False
+
+    async def build(self, build_no):
+        """
+        Build details
+        GET /api/repos/<org>/<repo>/builds/<build_no>
+        """
+        return await self.request('GET', '%s/builds/%s' % (self.repo_path, build_no))
+
+    async def create_build(self, params):
+        """
+        Starts a new build of BUILD_DEPLOY_BRANCH
+        POST /api/repos/<org>/<repo>/builds
+
+        :params build parameters as (name, value) pairs
+        """
+        query = urlencode([('branch', env('BUILD_DEPLOY_BRANCH'))] + list(params))
+        return await self.request('POST', '%s/builds?%s' % (self.repo_path, query))
+
+    async def promote(self, build_no, target, params):
+        """
+        Promotes a build to target
+        POST /api/repos/<org>/<repo>/builds/<build_no>/promote
+
+        :params promotion parameters as (name, value) pairs
+        """
+        query = urlencode([('target', target)] + list(params))
+        return await self.request('POST', '%s/builds/%s/promote?%s' % (self.repo_path, build_no, query))
+
+    async def _open_stream(self, url, read_timeout):
+        """
+        Sends a GET whose body is read as it arrives, through the circuit breaker and rate limit
+        Returns the response with status 200, None otherwise
+
+        Open streams are not counted by the bulkhead of the server.
+        """
+        if not self.breaker.allow():
+            return None
+        try:
+            acquired = await ratelimit.async_acquire(self.droneci_server, self.rate_wait)
+        except asyncio.CancelledError:
+            self.breaker.forget()
+            raise
+        if not acquired:
+            self.breaker.forget()
+            return None
+
+        timeout = httpx.Timeout(read_timeout, connect=env('DRONE_CONNECT_TIMEOUT'))
+        try:
+            with outbound('drone'):
+                response = await self.client.send(self.client.build_request('GET', url, timeout=timeout),
+                                                  stream=True)
+        except httpx.HTTPError as e:
+            self.breaker.record(True, 0)
+            logger.warning("Drone stream %s failed: %s", url, e)
+            return None
+        except asyncio.CancelledError:
+            self.breaker.forget()
+            raise
+
+        self.breaker.record(response.status_code >= 500 or response.status_code == 429, 0)
+        if response.status_code != 200:
+            await response.aclose()
+            return None
+        return response
+
+    async def logs(self, build_no, stage, step):
+        """
+        Log lines of a finished step
+        GET /api/repos/<org>/<repo>/builds/<build_no>/logs/<stage>/<step>
+
+        Yields the lines as they are read, the log is not held in memory.
+        Skipped steps have no log and yield nothing.
+        """
+        url = '%s%s/builds/%s/logs/%s/%s' % (self.server, self.repo_path, build_no, stage, step)
+        response = await self._open_stream(url, env('DRONE_READ_TIMEOUT'))
+        if response is None:
+            return
+        decoder = ArrayDecoder()
+        try:
+            async for text in response.aiter_text():
+                for line in decoder.feed(text):
+                    if isinstance(line, dict):
+                        yield line
+        except ValueError:
+            logger.warning("Drone log of build %s step %s.%s is not a list of lines", build_no, stage, step)
+        except httpx.HTTPError as e:
+            logger.warning("Drone log of build %s step %s.%s broke: %s", build_no, stage, step, e)
+        finally:
+            await response.aclose()
+
+    async def stream_logs(self, build_no, stage, step):
+        """
+        Follows the live log of a running step
+        GET /api/stream/<org>/<repo>/<build_no>/<stage>/<step>
+
+        Yields log lines as drone sends them and None for its keep-alive pings.
+        Ends once drone closes the stream or stops answering.
+        """
+        url = '%s/api/stream/%s/%s/%s/%s/%s' % (self.server, env('BUILD_DEPLOY_ORG'), env('BUILD_DEPLOY_REPO'),
+                                                 build_no, stage, step)
+        response = await self._open_stream(url, env('DRONE_LOG_READ_TIMEOUT'))
+        if response is None:
+            return
+        try:
+            async for line in response.aiter_lines():
+                if line.startswith(':'):
+                    yield None
+                elif line.startswith('data:'):
+                    try:
+                        data = json.loads(line[5:])
+                    except ValueError:
+                        # drone ends the stream with data: eof
+                        return
+                    if not isinstance(data, dict):
+                        return
+                    yield data
+        except httpx.HTTPError as e:
+            logger.warning("Drone log stream of build %s step %s.%s broke: %s", build_no, stage, step, e)
+        finally:
+            await response.aclose()
+
+
+class ArrayDecoder:
+    """
+    Decodes the items of a JSON array as its text arrives
+    Raises ValueError once the text is not an array
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.started = False
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, text):
+        """
+        Returns the items completed by text
+        """
+        self.buffer += text
+        items = []
+        while True:
+            rest = self.buffer.lstrip(' \t\r\n,' if self.started else ' \t\r\n')
+            if not self.started:
+                if not rest:
+                    break
+                if rest[0] != '[':
+                    raise ValueError('Not a JSON array')
+                self.started = True
+                self.buffer = rest[1:]
+                continue
+            if not rest or rest[0] == ']':
+                self.buffer = rest
+                break
+            try:
+                item, end = self.decoder.raw_decode(rest)
+            except ValueError:
+                # the rest of the item did not arrive yet
+                self.buffer = rest
+                break
+            items.append(item)
+            self.buffer = rest[end:]
+        return items
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from api.drone import DroneResult, FINISHED_STATUSES
+from backend.settings import env
+
+# how often a pod waiting on another pod's lookup checks the cache
+POLL_INTERVAL = 0.05
+
+# in flight lookups of this process, threads wait on the first caller
+_flights = {}
+_flights_lock = threading.Lock()
+# in flight lookups of this process per event loop
+_async_flights = weakref.WeakKeyDictionary()
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+def build_cache_key(droneci_server, build_no):
+    return 'drone:build:%s:%s/%s:%s' % (droneci_server.id, env('BUILD_DEPLOY_ORG'),
+                                        env('BUILD_DEPLOY_REPO'), build_no)
+
+
+def build_ttl(data):
+    """
+    Seconds to keep a build, finished builds do not change anymore
+    """
+    if data.get('status') in FINISHED_STATUSES:
+        return env('DRONE_STATUS_TTL_FINISHED')
+    return env('DRONE_STATUS_TTL_RUNNING')
+
+
+def remember_build(droneci_server, data):
+    """
+    Caches build details drone returned outside of a lookup
+    """
+    if isinstance(data, dict) and 'number' in data:
+        cache.set(build_cache_key(droneci_server, data['number']), data, build_ttl(data))
+
+
+def _lock_timeout():
+    return int(env('DRONE_CONNECT_TIMEOUT') + env('DRONE_READ_TIMEOUT')) + 1
+
+
+def _fetch(client, build_no, key):
+    """
+    Fetches a build from drone unless another pod already does
+    """
+    lock_key = key + ':lock'
+    if not cache.add(lock_key, 1, _lock_timeout()):
+        # another pod is fetching, wait for its result
+        deadline = time.monotonic() + _lock_timeout()
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                return DroneResult(status_code=200, data=data)
+            if cache.get(lock_key) is None:
+                break
+        # the other pod failed or gave up, fetch without the lock
+        return client.build(build_no)
+
+    try:
+        result = client.build(build_no)
+        if result.ok and isinstance(result.data, dict):
+            cache.set(key, result.data, build_ttl(result.data))
+        return result
+    finally:
+        cache.delete(lock_key)
+
+
+def cached_build(client, build_no):
+    """
+    Build details from the status cache or drone
+
+    Concurrent lookups of the same build share one drone request, within the
+    process and, through the cache lock, between pods sharing CACHE_URL.
+
+    :client DroneClient of the build's DroneCIServer
+    """
+    key = build_cache_key(client.droneci_server, build_no)
+    data = cache.get(key)
+    if data is not None:
+        return DroneResult(status_code=200, data=data)
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if flight.event.wait(_lock_timeout()):
+            return flight.result
+        return client.build(build_no)
+
+    try:
+        flight.result = _fetch(client, build_no, key)
+        return flight.result
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.event.set()
+
+
+async def _async_fetch(client, build_no, key):
+    """
+    Fetches a build from drone unless another pod already does
+    """
+    lock_key = key + ':lock'
+    if not await sync_to_async(cache.add)(lock_key, 1, _lock_timeout()):
+        # another pod is fetching, wait for its result
+        deadline = time.monotonic() + _lock_timeout()
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            data = await sync_to_async(cache.get)(key)
+            if data is not None:
+                return DroneResult(status_code=200, data=data)
+            if await sync_to_async(cache.get)(lock_key) is None:
+                break
+        # the other pod failed or gave up, fetch without the lock
+        return await client.build(build_no)
+
+    try:
+        result = await client.build(build_no)
+        if result.ok and isinstance(result.data, dict):
+            await sync_to_async(cache.set)(key, result.data, build_ttl(result.data))
+        return result
+    finally:
+        await sync_to_async(cache.delete)(lock_key)
+
+
+async def async_cached_build(client, build_no):
+    """
+    cached_build for AsyncDroneClient
+    """
+    key = build_cache_key(client.droneci_server, build_no)
+    data = await sync_to_async(cache.get)(key)
+    if data is not None:
+        return DroneResult(status_code=200, data=data)
+
+    flights = _async_flights.setdefault(asyncio.get_running_loop(), {})
+    task = flights.get(key)
+    if task is None:
+        task = flights[key] = asyncio.ensure_future(_async_fetch(client, build_no, key))
+        task.add_done_callback(lambda done: flights.pop(key, None))
+
+    # a cancelled caller must not cancel the lookup of the others
+    return await asyncio.shield(task)
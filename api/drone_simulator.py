@@ -0,0 +1,376 @@
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
+
+# steps every simulated build runs through
+STEPS = ('clone', 'build', 'publish')
+# log lines written by every step
+LOG_LINES = 5
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+}
+
+BUILDS_PATH = re.compile(r'^/api/repos/[^/]+/[^/]+/builds$')
+BUILD_PATH = re.compile(r'^/api/repos/[^/]+/[^/]+/builds/(\d+)$')
+PROMOTE_PATH = re.compile(r'^/api/repos/[^/]+/[^/]+/builds/(\d+)/promote$')
+LOGS_PATH = re.compile(r'^/api/repos/[^/]+/[^/]+/builds/(\d+)/logs/(\d+)/(\d+)$')
+STREAM_PATH = re.compile(r'^/api/stream/[^/]+/[^/]+/(\d+)/(\d+)/(\d+)$')
+
+
+def parse_distribution(spec):
+    """
+    Returns a sampler of seconds for a distribution spec
+
+    fixed:<seconds>, uniform:<low>,<high>, exponential:<mean> or
+    lognormal:<median>,<sigma>, a number is fixed
+    """
+    if isinstance(spec, (int, float)):
+        spec = 'fixed:%s' % spec
+    name, _, args = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+    try:
+        values = [float(value) for value in args.split(',')]
+        if name == 'fixed':
+            value, = values
+            return lambda rng: value
+        if name == 'uniform':
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if name == 'exponential':
+            mean, = values
+            return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        if name == 'lognormal':
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    except ValueError:
+        pass
+    raise ValueError('Invalid distribution %r' % spec)
+
+
+class SimulatedBuild:
+    """
+    Build of the simulator, pending for queued_for seconds, then running for
+    duration seconds and then ending with outcome unless its status is pinned
+    """
+
+    def __init__(self, number, params, queued_for, duration, outcome, event='custom', deploy_to='', parent=0,
+                 status=None):
+        self.number = number
+        self.params = params
+        self.created = time.time()
+        self.queued_for = queued_for
+        self.duration = duration
+        self.outcome = outcome
+        self.event = event
+        self.deploy_to = deploy_to
+        self.parent = parent
+        self.status = status
+
+    def progress(self, now):
+        """
+        Status and seconds the build has been running for
+        """
+        elapsed = now - self.created - self.queued_for
+        if self.status is not None:
+            if self.status == 'pending':
+                return 'pending', 0
+            if self.status == 'running':
+                return 'running', max(0, min(elapsed, self.duration / 2))
+            return self.status, self.duration
+        if elapsed < 0:
+            return 'pending', 0
+        if elapsed < self.duration:
+            return 'running', elapsed
+        return self.outcome, self.duration
+
+    def step_progress(self, step, now):
+        """
+        Status of a step and the number of its log lines written so far
+        """
+        status, elapsed = self.progress(now)
+        share = self.duration / len(STEPS)
+        step_elapsed = elapsed - (step - 1) * share
+        if status == 'pending' or step_elapsed < 0 or (status == 'running' and step_elapsed == 0):
+            return 'pending', 0
+        if status == 'running' and step_elapsed < share:
+            return 'running', min(LOG_LINES, int(step_elapsed / share * LOG_LINES) if share else LOG_LINES)
+        if status not in ('running', 'success') and step == len(STEPS):
+            return status, LOG_LINES
+        return 'success', LOG_LINES
+
+    def log_lines(self, step, count):
+        return [{'pos': pos, 'out': '%s: line %d\n' % (STEPS[step - 1], pos), 'time': pos}
+                for pos in range(count)]
+
+    def as_dict(self, now):
+        status, elapsed = self.progress(now)
+        started = int(self.created + self.queued_for) if status != 'pending' else 0
+        finished = int(self.created + self.queued_for + self.duration) \
+            if status not in ('pending', 'running') else 0
+        steps = []
+        for number, name in enumerate(STEPS, 1):
+            step_status, _ = self.step_progress(number, now)
+            steps.append({'number': number, 'name': name, 'status': step_status})
+        return {
+            'id': 100000 + self.number,
+            'number': self.number,
+            'parent': self.parent,
+            'status': status,
+            'event': self.event,
+            'deploy_to': self.deploy_to,
+            'params': self.params,
+            'created': int(self.created),
+            'started': started,
+            'finished': finished,
+            'updated': int(now),
+            'stages': [{'number': 1, 'name': 'default', 'status': status, 'steps': steps}],
+        }
+
+
+class DroneSimulator:
+    """
+    Simulated Drone CI api for tests, benchmarks and local development
+
+    Serves the builds, build, promote, logs and log stream endpoints the
+    backend uses over keep-alive HTTP. Builds go through pending and running
+    to success, or failure with failure_rate. Answers are delayed by the
+    latency distribution, a request fails with 500 at error_rate, with 429 at
+    rate_limit_rate and is never answered at timeout_rate. Every request is
+    recorded in requests.
+
+    :latency delay distribution of answers, see parse_distribution
+    :build_duration running time distribution of builds
+    :queue_delay seconds new builds are pending
+    :hang seconds a timed out request is held before the connection is closed
+    :seed seed of the random faults, latencies and outcomes
+    :record_to file every request is written to as a JSON line
+    """
+
+    def __init__(self, latency=0, error_rate=0.0, rate_limit_rate=0.0, timeout_rate=0.0, hang=30.0,
+                 build_duration=5, queue_delay=0.0, failure_rate=0.0, seed=None, record_limit=100000,
+                 record_to=None):
+        self.latency = parse_distribution(latency)
+        self.build_duration = parse_distribution(build_duration)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.queue_delay = queue_delay
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.record_to = record_to
+        self.requests = deque(maxlen=record_limit)
+        self.builds = {}
+        self.last_number = 0
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.server = None
+
+    def add_build(self, status=None, params=None, event='custom', deploy_to='', parent=0):
+        """
+        Creates a build, a status pins it instead of simulating its lifecycle
+        """
+        with self.lock:
+            self.last_number += 1
+            outcome = 'failure' if self.random.random() < self.failure_rate else 'success'
+            build = SimulatedBuild(self.last_number, params or {}, self.queue_delay,
+                                   self.build_duration(self.random), outcome, event=event,
+                                   deploy_to=deploy_to, parent=parent, status=status)
+            self.builds[build.number] = build
+        return build
+
+    def finish_build(self, number, status='success'):
+        self.builds[number].status = status
+
+    def fault(self):
+        """
+        Fault injected into the next request, if any
+        """
+        with self.lock:
+            draw = self.random.random()
+            delay = self.latency(self.random)
+        if draw < self.timeout_rate:
+            return 'timeout', delay
+        if draw < self.timeout_rate + self.rate_limit_rate:
+            return 429, delay
+        if draw < self.timeout_rate + self.rate_limit_rate + self.error_rate:
+            return 500, delay
+        return None, delay
+
+    def record(self, method, path, params, status, started):
+        entry = {
+            'at': started,
+            'method': method,
+            'path': path,
+            'params': params,
+            'status': status,
+            'latency': round(time.time() - started, 6),
+        }
+        self.requests.append(entry)
+        if self.record_to is not None:
+            self.record_to.write(json.dumps(entry) + '\n')
+            self.record_to.flush()
+
+    def requests_to(self, method, pattern):
+        """
+        Recorded requests with the method and a path matching the regex pattern
+        """
+        return [entry for entry in list(self.requests)
+                if entry['method'] == method and re.search(pattern, entry['path'])]
+
+    def route(self, method, path, params):
+        """
+        Answers an api call
+        Returns the status code and body, a None body streams the log of a step
+        """
+        now = time.time()
+        match = BUILDS_PATH.match(path)
+        if match:
+            if method == 'POST':
+                build_params = {name: value for name, value in params.items() if name != 'branch'}
+                return 200, self.add_build(params=build_params).as_dict(now)
+            if method == 'GET':
+                builds = sorted(self.builds.values(), key=lambda build: -build.number)[:25]
+                return 200, [build.as_dict(now) for build in builds]
+            return 405, {'message': 'Method Not Allowed'}
+
+        match = BUILD_PATH.match(path) or PROMOTE_PATH.match(path) or LOGS_PATH.match(path) or STREAM_PATH.match(path)
+        if not match:
+            return 404, {'message': 'Not Found'}
+        build = self.builds.get(int(match.group(1)))
+        if build is None:
+            return 404, {'message': 'Not Found'}
+
+        if match.re is BUILD_PATH and method == 'GET':
+            return 200, build.as_dict(now)
+        if match.re is PROMOTE_PATH and method == 'POST':
+            if not params.get('target'):
+                return 400, {'message': 'Missing target'}
+            promote_params = {name: value for name, value in params.items() if name != 'target'}
+            return 200, self.add_build(params=promote_params, event='promote', deploy_to=params['target'],
+                                       parent=build.number).as_dict(now)
+        if match.re in (LOGS_PATH, STREAM_PATH) and method == 'GET':
+            stage, step = int(match.group(2)), int(match.group(3))
+            if stage != 1 or not 1 <= step <= len(STEPS):
+                return 404, {'message': 'Not Found'}
+            if match.re is STREAM_PATH:
+                return 200, None
+            step_status, lines = build.step_progress(step, now)
+            if step_status == 'pending':
+                return 404, {'message': 'Not Found'}
+            return 200, build.log_lines(step, lines)
+        return 405, {'message': 'Method Not Allowed'}
+
+    async def stream_log(self, writer, path):
+        """
+        Writes the log lines of a step as drone does, until the step ended
+        """
+        number, _, step = (int(group) for group in STREAM_PATH.match(path).groups())
+        build = self.builds[number]
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n: ping\n\n')
+        sent = 0
+        while True:
+            step_status, lines = build.step_progress(step, time.time())
+            for line in build.log_lines(step, lines)[sent:]:
+                writer.write(('data: %s\n\n' % json.dumps(line)).encode())
+            sent = max(sent, lines)
+            await writer.drain()
+            if step_status not in ('pending', 'running'):
+                break
+            await asyncio.sleep(0.05)
+        writer.write(b'event: error\ndata: eof\n\n')
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                started = time.time()
+                lines = head.decode('latin-1').split('\r\n')
+                method, target, _ = lines[0].split(' ', 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                if headers.get('content-length'):
+                    await reader.readexactly(int(headers['content-length']))
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query, keep_blank_values=True))
+
+                fault, delay = self.fault()
+                if fault == 'timeout':
+                    self.record(method, url.path, params, None, started)
+                    await asyncio.sleep(self.hang)
+                    return
+                await asyncio.sleep(delay)
+
+                if fault is not None:
+                    status, body = fault, {'message': REASONS[fault]}
+                elif not headers.get('authorization', '').startswith('Bearer '):
+                    status, body = 401, {'message': 'Unauthorized'}
+                else:
+                    status, body = self.route(method, url.path, params)
+                self.record(method, url.path, params, status, started)
+
+                if body is None:
+                    await self.stream_log(writer, url.path)
+                    return
+                payload = json.dumps(body).encode()
+                extra = b'Retry-After: 1\r\n' if status == 429 else b''
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n%sContent-Length: %d\r\n\r\n%s'
+                             % (status, REASONS[status].encode(), extra, len(payload), payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Serves the simulator from a background thread
+        Returns its url
+        """
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, host, port, backlog=1024))
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return 'http://%s:%d' % (host, self.server.sockets[0].getsockname()[1])
+
+    async def shutdown(self):
+        self.server.close()
+        # connections held open by clients or hanging requests
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.loop = None
+
+    def serve_forever(self, host='127.0.0.1', port=8080):
+        async def serve():
+            self.server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+            async with self.server:
+                await self.server.serve_forever()
+        asyncio.run(serve())
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+
+from django.db import connections, transaction
+
+from api.locks import lock_key
+from api.models import BlockChain, BlockChainBuildDeploy
+from api.renderers import sse_comment, sse_event
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+# postgres channel of status events
+CHANNEL = 'api_status'
+
+BLOCK_CHAIN = 'blockchain'
+BUILD_DEPLOY = 'build_deploy'
+
+
+# postgres sequence numbering status events, the same cursors in every process
+SEQUENCE = 'api_status_event_seq'
+
+
+class EventHub:
+    """
+    Recent status events received by the process and the requests waiting for them
+
+    Events carry their cursor, numbered by SEQUENCE when published with
+    postgres, so a cursor from one process is valid in every other. Events
+    after complete_since are all kept, a cursor before it may have missed
+    events dropped from the buffer or published while the listener was not
+    listening.
+    """
+
+    def __init__(self, size):
+        self.events = deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.complete_since = 0
+        self.last_cursor = 0
+        # event loops and asyncio events of the coroutines waiting
+        self.async_waiters = set()
+
+    def cursor(self):
+        """
+        Cursor of now, later events come after it
+        """
+        return max(self.last_cursor, self.complete_since)
+
+    def push(self, event):
+        """
+        Adds an event, events without a cursor are numbered by the process
+        """
+        with self.condition:
+            cursor = event.get('cursor') or self.cursor() + 1
+            if cursor <= self.last_cursor:
+                # delivered twice, cursors only increase
+                return
+            if len(self.events) == self.events.maxlen:
+                self.complete_since = self.events[0]['cursor']
+            self.last_cursor = cursor
+            self.events.append(dict(event, cursor=cursor))
+            self.wake()
+
+    def reset(self, cursor=None):
+        """
+        Marks events up to cursor, the latest one by default, as possibly missed
+        """
+        with self.condition:
+            self.complete_since = max(self.cursor() if cursor is None else cursor, self.complete_since)
+            self.wake()
+
+    def wake(self):
+        """
+        Wakes every waiter, called with the condition held
+        """
+        self.condition.notify_all()
+        for loop, woken in self.async_waiters:
+            try:
+                loop.call_soon_threadsafe(woken.set)
+            except RuntimeError:
+                # the loop closed meanwhile
+                pass
+
+    def ready(self, cursor, match, deadline):
+        """
+        Result of a wait for events after cursor that match, None while there is none yet
+        """
+        if cursor < self.complete_since:
+            return [], None
+        events = [event for event in self.events if event['cursor'] > cursor and match(event)]
+        if events or deadline - time.monotonic() <= 0:
+            # a client may come from a process further ahead
+            return events, max(self.cursor(), cursor)
+        return None
+
+    def wait(self, cursor, match, timeout):
+        """
+        Waits up to timeout for events after cursor that match
+        Returns the events and the cursor to wait after next,
+        a None cursor means events after cursor may have been missed
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                result = self.ready(cursor, match, deadline)
+                if result is not None:
+                    return result
+                self.condition.wait(deadline - time.monotonic())
+
+    async def async_wait(self, cursor, match, timeout):
+        """
+        wait for coroutines, waiting does not hold a thread
+        """
+        deadline = time.monotonic() + timeout
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        while True:
+            with self.condition:
+                result = self.ready(cursor, match, deadline)
+                if result is not None:
+                    return result
+                waiter[1].clear()
+                self.async_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    self.async_waiters.discard(waiter)
+
+
+hub = EventHub(env('EVENTS_BUFFER_SIZE'))
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class Listener(threading.Thread):
+    """
+    Relays the status events postgres notifies CHANNEL listeners of to the hub
+    Listens on its own connection and connects again once it is lost
+    """
+
+    def __init__(self, using='default'):
+        super().__init__(name='api-events-listener', daemon=True)
+        self.using = using
+        self.listening = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("Listening for status events failed")
+            hub.reset()
+            time.sleep(1)
+
+    def listen(self):
+        wrapper = connections[self.using]
+        connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN %s' % CHANNEL)
+                # events published before listening are unknown
+                cursor.execute('SELECT coalesce(pg_sequence_last_value(%s), 0)', [SEQUENCE])
+                hub.reset(cursor.fetchone()[0])
+            self.listening.set()
+            while True:
+                if select.select([connection], [], [], 60) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    try:
+                        hub.push(json.loads(notify.payload))
+                    except ValueError:
+                        logger.warning("Invalid status event %r", notify.payload)
+        finally:
+            connection.close()
+
+
+def start_listener(using='default'):
+    """
+    Starts the listener of the process once, databases other than postgres
+    only have the events published by the process itself
+    """
+    global _listener
+    if connections[using].vendor != 'postgresql':
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = Listener(using)
+            _listener.start()
+    _listener.listening.wait(5)
+
+
+def notify(event, using='default'):
+    """
+    Numbers a status event with SEQUENCE and notifies CHANNEL listeners of it
+
+    Publishers take turns, listeners get the events in the order of their
+    cursors and a cursor seen by a client is never followed by a smaller one.
+    """
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock_key(CHANNEL)])
+        cursor.execute("SELECT pg_notify(%s, jsonb_set(%s::jsonb, '{cursor}', to_jsonb(nextval(%s)))::text)",
+                       [CHANNEL, json.dumps(event), SEQUENCE])
+
+
+def publish(event, using='default'):
+    """
+    Publishes a status event once the current transaction commits
+    """
+    if connections[using].vendor == 'postgresql':
+        transaction.on_commit(lambda: notify(event, using), using=using)
+    else:
+        transaction.on_commit(lambda: hub.push(event), using=using)
+
+
+def status_event(instance):
+    """
+    Status event of a BlockChain or BlockChainBuildDeploy
+    owner is the owner of the blockchain, user endpoints only get events of their blockchains
+    """
+    if isinstance(instance, BlockChain):
+        return {
+            'type': BLOCK_CHAIN,
+            'id': instance.id,
+            'status': instance.status,
+            'owner': instance.owner_id,
+        }
+
+    if BlockChainBuildDeploy.block_chain.is_cached(instance):
+        owner = instance.block_chain.owner_id
+    else:
+        owner = BlockChain.all_with_deleted.filter(id=instance.block_chain_id).values_list('owner_id', flat=True).first()
+    return {
+        'type': BUILD_DEPLOY,
+        'id': instance.id,
+        'job_type': instance.type,
+        'block_chain': instance.block_chain_id,
+        'status': instance.status,
+        'owner': owner,
+    }
+
+
+def publish_status(instance):
+    publish(status_event(instance))
+
+
+def parse_cursor(cursor):
+    """
+    Cursor of an events request, now by default
+    Raises ValueError for an invalid one
+    """
+    return int(cursor) if cursor else hub.cursor()
+
+
+async def stream_events(cursor, match):
+    """
+    Server-sent events of the status events after cursor that match
+    Every event has its cursor as id, a reset event means events may have been missed
+
+    The stream ends after EVENTS_STREAM_TIMEOUT, the client reconnects with Last-Event-ID.
+    """
+    deadline = time.monotonic() + env('EVENTS_STREAM_TIMEOUT')
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events, next_cursor = await hub.async_wait(cursor, match, min(remaining, 15))
+        if next_cursor is None:
+            next_cursor = hub.cursor()
+            yield sse_event({'cursor': next_cursor}, event='reset', event_id=next_cursor)
+        for event in events:
+            yield sse_event(event, event='status', event_id=event['cursor'])
+        if not events:
+            yield sse_comment('ping')
+        cursor = next_cursor
@@ -0,0 +1,120 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.models import BlockChain, BlockChainBuildDeploy, Organization
+from api.pagination import keyset_batches, parse_timestamp
+from backend.settings import env
+
+# exported models by export name
+EXPORTS = {
+    'blockchains': BlockChain,
+    'organizations': Organization,
+    'builds-deploys': BlockChainBuildDeploy,
+}
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def is_secret(field):
+    """
+    Columns only exported when asked for by name
+    """
+    return 'private_key' in field.name
+
+
+def export_fields(model):
+    """
+    Exportable columns of a model by name, foreign keys are exported as ids
+    """
+    return {field.name: field for field in model._meta.concrete_fields}
+
+
+def select_fields(model, names=None):
+    """
+    Returns the names of the columns to export, all but the secret ones by default
+
+    :names comma separated column names, secret columns are exported if named
+    """
+    fields = export_fields(model)
+    if not names:
+        return [name for name, field in fields.items() if not is_secret(field)]
+    selected = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in fields]
+    if unknown:
+        raise ExportError('Unknown fields: %s' % ', '.join(unknown))
+    return selected
+
+
+def filter_queryset(model, queryset, params):
+    """
+    Filters rows by the query parameters named after columns, and created_at with since and until
+    """
+    fields = export_fields(model)
+    for name, value in params.items():
+        if name in ('since', 'until'):
+            if 'created_at' not in fields:
+                raise ExportError('%s is not supported by this export' % name)
+            timestamp = parse_timestamp(value)
+            if timestamp is None:
+                raise ExportError('Invalid %s %s' % (name, value))
+            lookup = 'created_at__gte' if name == 'since' else 'created_at__lt'
+            queryset = queryset.filter(**{lookup: timestamp})
+        elif name in fields and not is_secret(fields[name]):
+            # foreign keys are filtered by id
+            try:
+                queryset = queryset.filter(**{fields[name].attname: fields[name].to_python(value)})
+            except (ValidationError, ValueError):
+                raise ExportError('Invalid %s %s' % (name, value))
+    return queryset
+
+
+class _Echo:
+    """
+    File like object csv.writer writes rows to, returning them instead of buffering
+    """
+
+    def write(self, value):
+        return value
+
+
+def ndjson_rows(names, rows):
+    for row in rows:
+        yield json.dumps({name: row[name] for name in names}, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_rows(names, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow([row[name] for name in names])
+
+
+def export_rows(queryset, names):
+    """
+    Rows of an export as dicts, read in EXPORT_CHUNK_SIZE keyset batches on id
+    """
+    columns = names if 'id' in names else ['id'] + names
+    for batch in keyset_batches(queryset.values(*columns), env('EXPORT_CHUNK_SIZE')):
+        yield from batch
+
+
+def stream_export(queryset, names, output):
+    """
+    Lines of an export, the rows of one batch are in memory at a time
+    """
+    rows = export_rows(queryset, names)
+    if output == CSV:
+        return csv_rows(names, rows)
+    return ndjson_rows(names, rows)
@@ -0,0 +1,99 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def parse_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def select_related_paths(related, prefix=''):
+    """
+    Lookups of a nested Query.select_related dict
+    """
+    for name, children in related.items():
+        yield prefix + name
+        yield from select_related_paths(children, prefix + name + '__')
+
+
+def prune_queryset(queryset, fields, keep=()):
+    """
+    Defers the columns and drops the joins none of the serializer fields read
+
+    :fields bound serializer fields that are rendered
+    :keep model fields always loaded
+    """
+    model_fields = {}
+    for field in queryset.model._meta.concrete_fields:
+        model_fields[field.name] = model_fields[field.attname] = field
+
+    needed = set(keep)
+    for field in fields:
+        # fields reading the whole object, like method fields, may need any column
+        if field.source == '*':
+            return queryset
+        needed.add(field.source_attrs[0])
+    needed = {model_fields[name].name if name in model_fields else name for name in needed}
+
+    related = queryset.query.select_related
+    if isinstance(related, dict):
+        paths = [path for path in select_related_paths(related) if path.split('__')[0] in needed]
+        queryset = queryset.select_related(None)
+        if paths:
+            queryset = queryset.select_related(*paths)
+
+    deferred = [field.name for field in queryset.model._meta.concrete_fields
+                if not field.primary_key and field.name not in needed]
+    return queryset.defer(*deferred) if deferred else queryset
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets for reads of model viewsets
+
+    ?fields=<name,...> only renders the named fields
+    ?exclude=<name,...> renders all but the named fields
+
+    Columns of fields not rendered are deferred and unused select_related
+    joins dropped, so they are neither fetched nor serialized.
+    """
+    # columns pagination and object permissions read
+    always_loaded_fields = ('created_at', 'owner', 'created_by')
+
+    def sparse_field_names(self, fields):
+        """
+        Names of the serializer fields to render, None when all are
+        """
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        params = request.query_params
+        if FIELDS_PARAM not in params and EXCLUDE_PARAM not in params:
+            return None
+        requested = parse_names(params.get(FIELDS_PARAM, '')) or list(fields)
+        excluded = parse_names(params.get(EXCLUDE_PARAM, ''))
+        for param, names in ((FIELDS_PARAM, requested), (EXCLUDE_PARAM, excluded)):
+            unknown = [name for name in names if name not in fields]
+            if unknown:
+                raise ValidationError({param: 'Unknown fields: %s' % ', '.join(unknown)})
+        return [name for name in fields if name in requested and name not in excluded]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = serializer.child.fields if isinstance(serializer, ListSerializer) else serializer.fields
+        names = self.sparse_field_names(fields)
+        if names is not None:
+            for name in [name for name in fields if name not in names]:
+                fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        names = self.sparse_field_names(serializer.fields)
+        if names is None:
+            return queryset
+        return prune_queryset(queryset, [serializer.fields[name] for name in names], self.always_loaded_fields)
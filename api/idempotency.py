@@ -0,0 +1,113 @@
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.db import transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.models import IdempotencyKey
+from backend.settings import env
+
+# requests in progress for longer are taken to have died with their process
+ABANDONED_AFTER = timedelta(minutes=5)
+
+
+def request_hash(request):
+    """
+    SHA-256 of the method, path with query and body of a request
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.get_full_path().encode())
+    try:
+        digest.update(request.body)
+    except RawPostDataException:
+        # multipart bodies are read as a stream
+        pass
+    return digest.hexdigest()
+
+
+def claim_key(user, key, digest):
+    """
+    Claims an idempotency key for a request
+    Returns the claimed IdempotencyKey and None, or None and the
+    (status code, body, location) to answer the request with instead
+
+    Keys are kept for IDEMPOTENCY_KEY_TTL seconds. A key sent again while its
+    request is in progress gets 409, a key reused for another request 422.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        record, created = IdempotencyKey.objects.select_for_update().get_or_create(
+            user=user, key=key, defaults={'request_hash': digest, 'created_at': now})
+        if created:
+            IdempotencyKey.objects.filter(created_at__lt=now - timedelta(seconds=env('IDEMPOTENCY_KEY_TTL'))).delete()
+            return record, None
+
+        expired = record.created_at < now - timedelta(seconds=env('IDEMPOTENCY_KEY_TTL'))
+        abandoned = record.status_code is None and record.created_at < now - ABANDONED_AFTER
+        if expired or abandoned:
+            record.request_hash = digest
+            record.status_code = None
+            record.response = None
+            record.location = ''
+            record.created_at = now
+            record.save()
+            return record, None
+
+    if record.request_hash != digest:
+        return None, (status.HTTP_422_UNPROCESSABLE_ENTITY,
+                      {"detail": "Idempotency-Key was used for another request!"}, '')
+    if record.status_code is None:
+        return None, (status.HTTP_409_CONFLICT,
+                      {"detail": "A request with this Idempotency-Key is in progress!"}, '')
+    return None, (record.status_code, record.response, record.location)
+
+
+def store_response(record, status_code, data, location=''):
+    """
+    Stores the response to the request of a claimed key
+    Server errors are not stored, the request may be sent again
+    """
+    if status_code >= 500:
+        record.delete()
+        return
+    record.status_code = status_code
+    record.response = data
+    record.location = location or ''
+    record.save(update_fields=['status_code', 'response', 'location'])
+
+
+def idempotent(action):
+    """
+    Lets clients retry a viewset action safely with an Idempotency-Key header
+    The first response to a key is stored and returned to the requests sent again with it
+    """
+    @functools.wraps(action)
+    def wrapped_action(self, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if not key:
+            return action(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"detail": "Idempotency-Key is too long!"}, status=status.HTTP_400_BAD_REQUEST)
+
+        record, replay = claim_key(request.user, key, request_hash(request))
+        if replay is not None:
+            status_code, data, location = replay
+            headers = {'Idempotent-Replayed': 'true'}
+            if location:
+                headers['Location'] = location
+            return Response(data, status=status_code, headers=headers)
+
+        try:
+            response = action(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        store_response(record, response.status_code, getattr(response, 'data', None), response.get('Location'))
+        return response
+
+    return wrapped_action
@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from backend.settings import env
+
+# outbound calls timed per request
+OUTBOUND_KINDS = ('drone', 'geo')
+# columns of a request sample
+METRICS = ('wall', 'db', 'queries', 'duplicates') + OUTBOUND_KINDS
+PERCENTILES = (50, 90, 99)
+
+# metrics of the request being handled, also seen by sync_to_async threads
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# statistics per url name
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """
+    Time, queries and outbound calls of one request
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.statements = set()
+        self.duplicates = 0
+        self.outbound = dict.fromkeys(OUTBOUND_KINDS, 0.0)
+
+    def record_query(self, sql, duration):
+        self.db += duration
+        self.queries += 1
+        # the same statement run again, likely once per row of a list
+        if sql in self.statements:
+            self.duplicates += 1
+        else:
+            self.statements.add(sql)
+
+    def sample(self):
+        return (time.perf_counter() - self.started, self.db, self.queries, self.duplicates) + \
+            tuple(self.outbound[kind] for kind in OUTBOUND_KINDS)
+
+
+def percentile(ordered, p):
+    # nearest rank
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))]
+
+
+class EndpointStats:
+    """
+    Samples of the last REQUEST_STATS_WINDOW requests of an endpoint
+    Summaries are computed when read, recording only appends a sample
+    """
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.samples = deque(maxlen=window)
+
+    def record(self, sample, status_code):
+        with self.lock:
+            self.count += 1
+            if status_code >= 500:
+                self.errors += 1
+            self.samples.append(sample)
+
+    def as_dict(self):
+        with self.lock:
+            samples = list(self.samples)
+            summary = {'count': self.count, 'errors': self.errors, 'window': len(samples)}
+        for index, metric in enumerate(METRICS):
+            ordered = sorted(sample[index] for sample in samples)
+            values = {'p%s' % p: percentile(ordered, p) for p in PERCENTILES} if ordered else {}
+            values['max'] = ordered[-1] if ordered else None
+            if metric not in ('queries', 'duplicates'):
+                values = {name: round(value, 4) if value is not None else None for name, value in values.items()}
+            summary[metric] = values
+        return summary
+
+
+def record_request(endpoint, sample, status_code):
+    with _stats_lock:
+        stats = _stats.get(endpoint)
+        if stats is None:
+            stats = _stats[endpoint] = EndpointStats(env('REQUEST_STATS_WINDOW'))
+    stats.record(sample, status_code)
+
+
+def get_stats():
+    """
+    Summaries of the endpoints of this process by url name
+    """
+    with _stats_lock:
+        endpoints = dict(_stats)
+    return {endpoint: stats.as_dict() for endpoint, stats in sorted(endpoints.items())}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# connections opened by any thread, like the ones of sync_to_async
+connection_created.connect(install_query_recorder)
+
+
+@contextmanager
+def outbound(kind):
+    """
+    Times an outbound call of the current request
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.outbound[kind] += time.perf_counter() - started
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return 'unmatched'
+    return match.url_name
+
+
+class RequestStatsMiddleware:
+    """
+    Records wall time, database time, query and duplicate query counts and the
+    time of outbound Drone CI and geo location calls of every request, per url name
+
+    Streamed responses are timed until their first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # mark the instance as coroutine function like MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        for connection in connections.all():
+            install_query_recorder(connection)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record_request(endpoint_name(request), metrics.sample(), response.status_code)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        record_request(endpoint_name(request), metrics.sample(), response.status_code)
+        return response
@@ -0,0 +1,433 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from api.breaker import OPEN, get_breaker
+from api.drone import DroneClient, ACTIVE_STATUSES, FINISHED_STATUSES, REJECTED_ERRORS
+from api.drone_cache import remember_build
+from api.models import BlockChain, BlockChainBuildDeploy, DroneCIServer, DroneJob, LATEST_JOB_FIELDS
+from api.params import config_fingerprint, job_params
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+# statuses of the latest job that are reused instead of a new placeholder
+REUSABLE_STATUSES = {
+    BlockChainBuildDeploy.BUILD: ['success', 'running', 'failure', 'created'],
+    BlockChainBuildDeploy.DEPLOY: ['success', 'deploying', 'failure', 'created'],
+    BlockChainBuildDeploy.TERMINATE: ['success', 'terminating', 'failure', 'created'],
+}
+
+# remote statuses that do not allow to start a new job
+BLOCKING_STATUSES = ['success', 'running', 'pending']
+# remote statuses that do not allow to upgrade a blockchain with a new job
+UPGRADE_BLOCKING_STATUSES = ['running', 'pending']
+
+# drone promotion target of deploy and terminate jobs
+PROMOTE_TARGETS = {
+    BlockChainBuildDeploy.DEPLOY: 'live',
+    BlockChainBuildDeploy.TERMINATE: 'live-terminate',
+}
+
+# local status of a job once drone accepted it
+SUBMITTED_STATUS = {
+    BlockChainBuildDeploy.BUILD: 'running',
+    BlockChainBuildDeploy.DEPLOY: 'deploying',
+    BlockChainBuildDeploy.TERMINATE: 'terminating',
+}
+
+# local statuses of jobs drone is working on
+IN_PROGRESS_STATUSES = sorted(set(ACTIVE_STATUSES) | set(SUBMITTED_STATUS.values()))
+# local statuses of jobs drone has not finished yet
+UNFINISHED_STATUSES = IN_PROGRESS_STATUSES + ['created']
+
+JOB_NAMES = {
+    BlockChainBuildDeploy.BUILD: 'build',
+    BlockChainBuildDeploy.DEPLOY: 'deployment',
+    BlockChainBuildDeploy.TERMINATE: 'termination job',
+}
+
+# drone answers to a submission that mean it was not processed
+SUBMIT_RETRY_STATUS_CODES = (429, 503)
+
+# latencies below are treated as equal, servers are then compared by queue depth
+SCHEDULER_LATENCY_FLOOR = 0.05
+
+
+class NoDroneCIServer(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'No Drone CI server is accepting builds!'
+    default_code = 'no_droneci_server'
+
+
+def queue_depths():
+    """
+    Number of jobs in progress by DroneCIServer id
+    """
+    return dict(BlockChainBuildDeploy.objects.filter(status__in=IN_PROGRESS_STATUSES)
+                .order_by().values_list('droneci_server_id').annotate(Count('id')))
+
+
+def pick_server():
+    """
+    Returns the DroneCIServer to start the next build on
+
+    Servers that are not drained are ranked by their jobs in progress weighted
+    with the recent latency of their api, servers with an open circuit
+    breaker only get builds when all servers have one.
+    """
+    servers = list(DroneCIServer.objects.filter(drained=False))
+    if not servers:
+        raise NoDroneCIServer()
+    depths = queue_depths()
+
+    def rank(droneci_server):
+        breaker = get_breaker(droneci_server.id).as_dict()
+        depth = depths.get(droneci_server.id, 0)
+        latency = max(breaker['latency'] or 0, SCHEDULER_LATENCY_FLOOR)
+        return breaker['state'] == OPEN, (depth + 1) * latency, depth, droneci_server.id
+
+    return min(servers, key=rank)
+
+
+def job_server(parent=None):
+    """
+    Returns the DroneCIServer to submit a job to
+    Deploy and terminate jobs run where their build is, builds are scheduled
+
+    :parent build to deploy or terminate
+    """
+    if parent is not None:
+        return parent.droneci_server
+    return pick_server()
+
+
+def same_config_build(block_chain):
+    """
+    Returns the latest build if it succeeded with the current blockchain configuration
+    An older build of the same configuration was replaced and does not count
+    """
+    build = latest_job(block_chain, BlockChainBuildDeploy.BUILD)
+    if build is None or build.status != 'success' or build.fingerprint != config_fingerprint(block_chain):
+        return None
+    return build
+
+
+def latest_job(block_chain, job_type, *related):
+    """
+    Returns the latest BlockChainBuildDeploy of a type of a blockchain, if any
+    Follows the pointer of the blockchain row, the instance may be outdated
+
+    :related relations to select with the job
+    """
+    pointer = BlockChain.all_with_deleted.filter(id=block_chain.id).values(LATEST_JOB_FIELDS[job_type])
+    return BlockChainBuildDeploy.objects.select_related(*related).filter(id=Subquery(pointer)).first()
+
+
+def point_latest_job(build_deploy):
+    """
+    Points the blockchain of a new BlockChainBuildDeploy at it unless it points at a later job
+    """
+    field = LATEST_JOB_FIELDS.get(build_deploy.type)
+    if field is None:
+        return
+    BlockChain.all_with_deleted.filter(Q(**{field: None}) | Q(**{field + '__lt': build_deploy.id}),
+                                       id=build_deploy.block_chain_id).update(**{field: build_deploy.id})
+
+
+def repoint_latest_job(block_chain_id, job_type):
+    """
+    Points a blockchain whose latest job of a type was deleted at the one before
+    """
+    field = LATEST_JOB_FIELDS.get(job_type)
+    if field is None:
+        return
+    latest = BlockChainBuildDeploy.objects.filter(block_chain=OuterRef('pk'), type=job_type) \
+        .order_by('-id').values('id')[:1]
+    BlockChain.all_with_deleted.filter(id=block_chain_id, **{field: None}).update(**{field: Subquery(latest)})
+
+
+def lock_block_chain(block_chain):
+    """
+    Locks the BlockChain row until the transaction ends
+    """
+    BlockChain.all_with_deleted.select_for_update().filter(id=block_chain.id).values_list('id').first()
+
+
+def get_or_create_placeholder(block_chain, job_type, user, parent=None, upgrade=False):
+    """
+    Returns the placeholder BlockChainBuildDeploy object of the next job
+    The latest job of the type is reused unless it ended unexpectedly
+
+    :block_chain BlockChain of the job
+    :job_type BlockChainBuildDeploy type
+    :user user starting the job
+    :parent build to deploy or terminate
+    :upgrade do not reuse a successful job, the job replaces it
+    """
+    with transaction.atomic():
+        # concurrent callers wait for the placeholder of the first one
+        lock_block_chain(block_chain)
+        latest = latest_job(block_chain, job_type)
+        if latest is not None and latest.status in REUSABLE_STATUSES[job_type]:
+            if not (upgrade and latest.status == 'success'):
+                return latest
+
+        placeholder = BlockChainBuildDeploy(
+            build_id=0,
+            build_no=0,
+            block_chain=block_chain,
+            created_by=user,
+            droneci_server=job_server(parent),
+            status='created',
+            type=job_type,
+            owner=user
+        )
+        if parent is not None:
+            placeholder.parent_build_id = parent.id
+            placeholder.parent_build_number = parent.build_no
+        placeholder.save()
+
+    return placeholder
+
+
+def mark_submitted(build_deploy, data, droneci_server=None):
+    """
+    Updates placeholder BlockChainBuildDeploy object with the build drone created
+    Returns False if data is not a drone build
+
+    :droneci_server DroneCIServer the job was submitted to
+    """
+    if not isinstance(data, dict) or 'id' not in data or 'number' not in data:
+        return False
+
+    if droneci_server is not None:
+        build_deploy.droneci_server = droneci_server
+    build_deploy.build_id = data['id']
+    build_deploy.build_no = data['number']
+    build_deploy.status = SUBMITTED_STATUS[build_deploy.type]
+    build_deploy.save()
+
+    return True
+
+
+def drone_timestamp(value):
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def apply_drone_build(build_deploy, data):
+    """
+    Updates BlockChainBuildDeploy object with drone build details
+    Returns the changed fields, outdated details change nothing
+
+    :build_deploy BlockChainBuildDeploy object of the build
+    :data drone build details
+    """
+    number = data.get('number')
+    if not number or number < build_deploy.build_no:
+        return []
+
+    drone_status = data.get('status')
+    if drone_status in ACTIVE_STATUSES:
+        job_status = SUBMITTED_STATUS.get(build_deploy.type, drone_status)
+    else:
+        job_status = drone_status
+    # events can arrive out of order, a finished build stays finished
+    if number == build_deploy.build_no and build_deploy.status in FINISHED_STATUSES \
+            and job_status not in FINISHED_STATUSES:
+        return []
+
+    values = {
+        'build_id': data.get('id', build_deploy.build_id),
+        'build_no': number,
+        'status': job_status,
+        'started_at': drone_timestamp(data.get('started')),
+        'finished_at': drone_timestamp(data.get('finished')),
+    }
+    changed = []
+    for field, value in values.items():
+        if getattr(build_deploy, field) != value:
+            setattr(build_deploy, field, value)
+            changed.append(field)
+
+    return changed
+
+
+def save_drone_build(pk, data):
+    """
+    Updates BlockChainBuildDeploy object with drone build details under a row lock
+    Returns the object, None if it does not exist
+
+    :pk BlockChainBuildDeploy ID
+    :data drone build details
+    """
+    with transaction.atomic():
+        build_deploy = BlockChainBuildDeploy.objects.select_for_update() \
+            .select_related('droneci_server').filter(id=pk).first()
+        if build_deploy is None:
+            return None
+
+        changed = apply_drone_build(build_deploy, data)
+        if changed:
+            build_deploy.save(update_fields=changed + ['updated_at'])
+
+    return build_deploy
+
+
+def enqueue_job(block_chain, job_type, user, upgrade=False, worker=''):
+    """
+    Queues the start of a job for the run_drone_jobs workers
+    Returns the unfinished job of the blockchain and type instead if there is one,
+    repeated requests do not start the job again
+
+    :upgrade replace a successful job of the blockchain instead of refusing to start
+    :worker claims the new job for a worker that runs it right away
+    """
+    with transaction.atomic():
+        # concurrent requests wait for the job of the first one
+        lock_block_chain(block_chain)
+        job = DroneJob.objects.filter(block_chain=block_chain, type=job_type,
+                                      status__in=DroneJob.UNFINISHED_STATUSES).first()
+        if job is not None:
+            if upgrade and not job.upgrade and job.status == DroneJob.QUEUED:
+                job.upgrade = True
+                job.save(update_fields=['upgrade', 'updated_at'])
+            return job
+
+        now = timezone.now()
+        if worker:
+            return DroneJob.objects.create(block_chain=block_chain, type=job_type, created_by=user, upgrade=upgrade,
+                                           run_after=now, status=DroneJob.RUNNING, locked_by=worker, locked_at=now,
+                                           attempts=1)
+        return DroneJob.objects.create(block_chain=block_chain, type=job_type, created_by=user,
+                                       upgrade=upgrade, run_after=now)
+
+
+def claim_jobs(worker, limit=1):
+    """
+    Claims due DroneJob objects for a worker
+    Jobs of workers that stopped responding are claimed again after DRONE_JOB_LOCK_TIMEOUT
+
+    Rows locked by other workers are skipped instead of waited for, workers
+    never block each other.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=env('DRONE_JOB_LOCK_TIMEOUT'))
+    with transaction.atomic():
+        jobs = list(DroneJob.objects.select_for_update(skip_locked=True)
+                    .filter(Q(status=DroneJob.QUEUED, run_after__lte=now) |
+                            Q(status=DroneJob.RUNNING, locked_at__lt=stale))
+                    .order_by('run_after', 'id')[:limit])
+        for job in jobs:
+            job.status = DroneJob.RUNNING
+            job.locked_by = worker
+            job.locked_at = now
+            job.attempts += 1
+            job.updated_at = now
+        DroneJob.objects.bulk_update(jobs, ['status', 'locked_by', 'locked_at', 'attempts', 'updated_at'])
+    return jobs
+
+
+def start_job(drone_job):
+    """
+    Starts the job of a DroneJob on drone
+    Returns whether drone accepted it, the response body and whether
+    another attempt may succeed
+    """
+    block_chain = drone_job.block_chain
+    job_type = drone_job.type
+
+    build = None
+    if job_type != BlockChainBuildDeploy.BUILD:
+        build = latest_job(block_chain, BlockChainBuildDeploy.BUILD, 'droneci_server')
+        if build is None:
+            return False, {"detail": "Blockchain has no build yet!"}, False
+
+    # create placeholder object
+    build_deploy = get_or_create_placeholder(block_chain, job_type, drone_job.created_by, parent=build,
+                                             upgrade=drone_job.upgrade)
+    drone_job.build_deploy = build_deploy
+
+    # get remote status of the latest job with drone api
+    response_status = DroneClient(build_deploy.droneci_server).build(build_deploy.build_no)
+    # a missing build is fine, an unreachable server is not
+    if response_status.status_code is None:
+        return False, response_status.as_dict(), True
+    job_status = response_status.get('status')
+    if job_status in (UPGRADE_BLOCKING_STATUSES if drone_job.upgrade else BLOCKING_STATUSES):
+        return False, {
+            "detail": "Can not start a new %s! Current status: %s" % (JOB_NAMES[job_type], job_status)
+        }, False
+
+    # submit to the server recorded on the placeholder, builds were scheduled when it was created
+    droneci_server = build_deploy.droneci_server
+    drone = DroneClient(droneci_server)
+    params = job_params(block_chain, build_deploy)
+    if job_type == BlockChainBuildDeploy.BUILD:
+        response = drone.create_build(params)
+    else:
+        response = drone.promote(build.build_no, PROMOTE_TARGETS[job_type], params)
+    if not response.ok:
+        # only submissions drone surely did not process are sent again
+        retry = response.error in REJECTED_ERRORS or response.status_code in SUBMIT_RETRY_STATUS_CODES
+        return False, response.as_dict(), retry
+
+    # check if request returns None data
+    if response.data is None:
+        return False, {"detail": "Request returned %s! I have a bad feeling about this." % response.data}, False
+
+    # update placeholder BlockChainBuildDeploy object with real data
+    if job_type == BlockChainBuildDeploy.BUILD:
+        build_deploy.fingerprint = config_fingerprint(block_chain)
+    mark_submitted(build_deploy, response.data, droneci_server)
+    remember_build(droneci_server, response.data)
+
+    return True, response.data, False
+
+
+def job_retry_delay(attempts):
+    return min(env('DRONE_JOB_RETRY_DELAY') * (2 ** (attempts - 1)), env('DRONE_JOB_RETRY_DELAY_MAX'))
+
+
+def run_drone_job(drone_job):
+    """
+    Runs a claimed DroneJob and records the outcome
+    Failures worth another attempt queue the job again with backoff,
+    up to DRONE_JOB_MAX_ATTEMPTS attempts
+    """
+    try:
+        submitted, result, retry = start_job(drone_job)
+    except NoDroneCIServer as exc:
+        submitted, result, retry = False, {"detail": str(exc.detail)}, True
+    return finish_job(drone_job, submitted, result, retry)
+
+
+def finish_job(drone_job, submitted, result, retry=False):
+    """
+    Records the outcome of an attempt to start a claimed DroneJob
+    """
+    now = timezone.now()
+    if submitted:
+        drone_job.status = DroneJob.SUBMITTED
+        drone_job.finished_at = now
+    elif retry and drone_job.attempts < env('DRONE_JOB_MAX_ATTEMPTS'):
+        drone_job.status = DroneJob.QUEUED
+        drone_job.run_after = now + timedelta(seconds=job_retry_delay(drone_job.attempts))
+        logger.warning("Drone job %s failed, attempt %s, retrying at %s", drone_job.id, drone_job.attempts,
+                       drone_job.run_after)
+    else:
+        drone_job.status = DroneJob.FAILED
+        drone_job.finished_at = now
+    drone_job.result = result
+    drone_job.locked_by = ''
+    drone_job.locked_at = None
+    drone_job.save(update_fields=['status', 'result', 'build_deploy', 'run_after', 'finished_at',
+                                  'locked_by', 'locked_at', 'updated_at'])
+    return drone_job
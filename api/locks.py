@@ -0,0 +1,41 @@
+import hashlib
+from contextlib import contextmanager
+
+from django.db import DatabaseError, connections
+
+
+def lock_key(name):
+    """
+    Signed 64 bit advisory lock key of a lock name
+    """
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(name, using='default'):
+    """
+    Session level postgres advisory lock
+    Yields whether the lock was acquired, without waiting for it
+
+    The lock is released on exit or when the database connection is lost.
+    Databases without advisory locks always acquire it.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+
+    key = lock_key(name)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+            except DatabaseError:
+                # a lost session already released the lock
+                pass
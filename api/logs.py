@@ -0,0 +1,132 @@
+import asyncio
+import sys
+import time
+
+from api.drone import FINISHED_STATUSES
+from api.renderers import sse_comment, sse_event
+from backend.settings import env
+
+# offset of a step whose lines were all sent
+STEP_DONE = sys.maxsize
+
+
+def parse_event_id(value):
+    """
+    Returns the (stage, step, pos) of a log line event id, None if it is not one
+    """
+    try:
+        stage, step, pos = (int(part) for part in value.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return stage, step, pos
+
+
+def build_steps(build):
+    """
+    (stage, step, status) of the steps of a drone build in order
+    """
+    steps = []
+    for stage in build.get('stages') or []:
+        for step in stage.get('steps') or []:
+            steps.append((stage['number'], step['number'], step.get('status')))
+    return sorted(steps)
+
+
+def line_event(stage, step, line):
+    return sse_event({
+        'stage': stage,
+        'step': step,
+        'pos': line['pos'],
+        'out': line.get('out', ''),
+        'time': line.get('time'),
+    }, event='line', event_id='%s.%s.%s' % (stage, step, line['pos']))
+
+
+async def before(lines, deadline):
+    """
+    Items of an async iterator until deadline, waiting for the next one included
+    """
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                yield await asyncio.wait_for(lines.__anext__(), remaining)
+            except (StopAsyncIteration, asyncio.TimeoutError):
+                return
+    finally:
+        await lines.aclose()
+
+
+async def stream_build_logs(drone, build_no, after=None):
+    """
+    Server-sent events of the log lines of a drone build
+
+    Lines are sent in step order with the id <stage>.<step>.<pos>, a client
+    resumes after the line it got last. Logs of finished steps are read from
+    the logs api and running steps are relayed from the drone log stream line
+    by line as they arrive, so only the line being sent is held in memory and a
+    slow client slows down the reads from drone. The stream ends with an end
+    event once the build finished or at DRONE_LOG_STREAM_TIMEOUT, also while
+    waiting for drone, the client reconnects with Last-Event-ID to follow on.
+
+    :drone AsyncDroneClient of the server that runs the build
+    :build_no drone build number
+    :after (stage, step, pos) of the last line the client got
+    """
+    deadline = time.monotonic() + env('DRONE_LOG_STREAM_TIMEOUT')
+    poll_interval = env('DRONE_LOG_POLL_INTERVAL')
+    # last line sent
+    cursor = after or (0, 0, -1)
+
+    yield ('retry: %d\n\n' % (poll_interval * 1000)).encode()
+    while True:
+        try:
+            result = await asyncio.wait_for(drone.build(build_no), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            return
+        if not result.ok:
+            yield sse_event(result.as_dict(), event='error')
+            return
+
+        # steps that did not run in a finished build never will
+        build_finished = result.get('status') in FINISHED_STATUSES
+        for stage, step, step_status in build_steps(result.data):
+            if (stage, step) < cursor[:2]:
+                continue
+            offset = cursor[2] if (stage, step) == cursor[:2] else -1
+            if offset == STEP_DONE:
+                continue
+
+            if step_status in FINISHED_STATUSES or build_finished:
+                async for line in before(drone.logs(build_no, stage, step), deadline):
+                    if line['pos'] > offset:
+                        yield line_event(stage, step, line)
+                        offset = line['pos']
+                if time.monotonic() >= deadline:
+                    return
+                cursor = (stage, step, STEP_DONE)
+                continue
+
+            if step_status == 'running':
+                async for line in before(drone.stream_logs(build_no, stage, step), deadline):
+                    if line is None:
+                        yield sse_comment('ping')
+                    elif line['pos'] > offset:
+                        yield line_event(stage, step, line)
+                        offset = line['pos']
+                        cursor = (stage, step, offset)
+                if time.monotonic() >= deadline:
+                    return
+            # later steps wait for this one, look at the build again
+            break
+        else:
+            if build_finished:
+                yield sse_event({'status': result.get('status')}, event='end')
+                return
+
+        if time.monotonic() + poll_interval >= deadline:
+            return
+        await asyncio.sleep(poll_interval)
+        yield sse_comment('ping')
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from api.drone import DroneClient
+from api.drone_cache import remember_build
+from api.events import publish_status
+from api.jobs import UNFINISHED_STATUSES, apply_drone_build
+from api.locks import advisory_lock
+from api.models import BlockChainBuildDeploy
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'api.reconcile_builds'
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1/rate seconds apart
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_at = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0, self.next_at - now)
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait:
+            time.sleep(wait)
+
+
+class Command(BaseCommand):
+    help = 'Keeps unfinished build, deploy and terminate jobs in sync with Drone CI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Reconcile one batch and exit')
+        parser.add_argument('--interval', type=float, default=env('DRONE_RECONCILE_INTERVAL'),
+                            help='Seconds between sweeps')
+        parser.add_argument('--batch-size', type=int, default=env('DRONE_RECONCILE_BATCH_SIZE'),
+                            help='Jobs looked up per sweep')
+        parser.add_argument('--rate', type=float, default=env('DRONE_RECONCILE_RATE'),
+                            help='Drone lookups per second and DroneCIServer')
+        parser.add_argument('--concurrency', type=int, default=env('DRONE_RECONCILE_CONCURRENCY'),
+                            help='Concurrent Drone lookups per DroneCIServer')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # sweeps walk the unfinished jobs by id so long running ones do not starve the rest
+        self.after_id = 0
+
+    def handle(self, *args, **options):
+        while True:
+            # the lock lives in the session, start from a usable connection
+            close_old_connections()
+            # only one replica reconciles, the others keep trying to take over
+            with advisory_lock(LOCK_NAME) as leader:
+                if leader:
+                    self.lead(options)
+                else:
+                    logger.debug("Another replica is reconciling")
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def lead(self, options):
+        while True:
+            started = time.monotonic()
+            try:
+                updated = self.reconcile(options['batch_size'], options['rate'], options['concurrency'])
+                logger.info("Reconciled %s jobs in %.2fs", updated, time.monotonic() - started)
+            except Exception:
+                logger.exception("Reconciling jobs failed")
+                if options['once']:
+                    raise
+                # the session and with it the lock may be gone, elect again
+                return
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def reconcile(self, batch_size, rate, concurrency):
+        """
+        Looks up the next batch of unfinished jobs
+        Returns the number of updated jobs
+        """
+        jobs = list(BlockChainBuildDeploy.objects.select_related('droneci_server')
+                    .filter(status__in=UNFINISHED_STATUSES, build_no__gt=0, id__gt=self.after_id)
+                    .order_by('id')[:batch_size])
+        # start over once the end is reached
+        self.after_id = jobs[-1].id if len(jobs) == batch_size else 0
+        if not jobs:
+            return 0
+
+        by_server = {}
+        for job in jobs:
+            by_server.setdefault(job.droneci_server_id, []).append(job)
+
+        builds = {}
+        with ThreadPoolExecutor(max_workers=len(by_server)) as executor:
+            for result in executor.map(lambda server_jobs: self.fetch(server_jobs, rate, concurrency),
+                                       by_server.values()):
+                builds.update(result)
+
+        return self.write(builds)
+
+    def fetch(self, jobs, rate, concurrency):
+        """
+        Fetches drone builds of jobs that share a DroneCIServer
+        Returns the builds by job id
+        """
+        # lookups can wait on the shared rate limit, the next sweep is that far away
+        client = DroneClient(jobs[0].droneci_server, rate_wait=env('DRONE_RECONCILE_INTERVAL'))
+        limiter = RateLimiter(rate)
+
+        def lookup(job):
+            limiter.wait()
+            result = client.build(job.build_no)
+            if not result.ok:
+                logger.warning("Drone lookup of job %s failed: %s", job.id, result.error)
+                return job.id, None
+            return job.id, result.data
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            builds = {job_id: data for job_id, data in executor.map(lookup, jobs) if isinstance(data, dict)}
+
+        for data in builds.values():
+            remember_build(client.droneci_server, data)
+        return builds
+
+    def write(self, builds):
+        """
+        Applies drone builds to their jobs
+        Jobs are locked and re-read so newer webhook updates are not overwritten
+        """
+        if not builds:
+            return 0
+
+        with transaction.atomic():
+            jobs = BlockChainBuildDeploy.objects.select_for_update().filter(id__in=builds)
+            changed_jobs = []
+            fields = set()
+            now = timezone.now()
+            for job in jobs:
+                changed = apply_drone_build(job, builds[job.id])
+                if changed:
+                    job.updated_at = now
+                    fields.update(changed)
+                    changed_jobs.append(job)
+
+            if changed_jobs:
+                BlockChainBuildDeploy.objects.bulk_update(changed_jobs, sorted(fields) + ['updated_at'])
+                # bulk updates send no post_save
+                for job in changed_jobs:
+                    if job.status != job._saved_status:
+                        publish_status(job)
+                        job._saved_status = job.status
+
+        return len(changed_jobs)
@@ -0,0 +1,65 @@
+import logging
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from api.jobs import claim_jobs, run_drone_job
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Starts queued build, deploy and terminate jobs on Drone CI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=env('DRONE_JOB_WORKERS'),
+                            help='Jobs run concurrently')
+        parser.add_argument('--poll-interval', type=float, default=env('DRONE_JOB_POLL_INTERVAL'),
+                            help='Seconds between looks at an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stopping.set())
+            signal.signal(signal.SIGINT, lambda signum, frame: self.stopping.set())
+
+        name = '%s:%s' % (socket.gethostname(), os.getpid())
+        workers = [threading.Thread(target=self.work, args=('%s:%s' % (name, n), options), daemon=True)
+                   for n in range(max(1, options['workers']))]
+        for worker in workers:
+            worker.start()
+        # wake up for signals while the workers run
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(0.5)
+
+    def work(self, name, options):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    jobs = claim_jobs(name)
+                except Exception:
+                    logger.exception("Claiming jobs failed")
+                    jobs = []
+
+                if not jobs:
+                    if options['once']:
+                        return
+                    self.stopping.wait(options['poll_interval'])
+                    continue
+
+                for job in jobs:
+                    try:
+                        run_drone_job(job)
+                    except Exception:
+                        # the job is claimed again once its lock times out
+                        logger.exception("Running drone job %s failed", job.id)
+        finally:
+            connection.close()
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.drone_simulator import DroneSimulator, parse_distribution
+
+
+def distribution(spec):
+    parse_distribution(spec)
+    return spec
+
+
+class Command(BaseCommand):
+    help = 'Serves a simulated Drone CI api with latency and fault injection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8080)
+        parser.add_argument('--latency', type=distribution, default='0',
+                            help='Answer delay, fixed:<s>, uniform:<low>,<high>, exponential:<mean> '
+                                 'or lognormal:<median>,<sigma>')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                            help='Share of requests failing with 429')
+        parser.add_argument('--timeout-rate', type=float, default=0.0, help='Share of requests never answered')
+        parser.add_argument('--hang', type=float, default=30.0,
+                            help='Seconds unanswered requests are held before their connection is closed')
+        parser.add_argument('--build-duration', type=distribution, default='5',
+                            help='Running time of builds, same format as --latency')
+        parser.add_argument('--queue-delay', type=float, default=0.0, help='Seconds new builds are pending')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of builds that fail')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--record', metavar='FILE', help='Writes every request to FILE as a JSON line')
+
+    def handle(self, *args, **options):
+        for option in ('error_rate', 'rate_limit_rate', 'timeout_rate', 'failure_rate'):
+            if not 0 <= options[option] <= 1:
+                raise CommandError('--%s must be between 0 and 1' % option.replace('_', '-'))
+
+        record_to = open(options['record'], 'a') if options['record'] else None
+        simulator = DroneSimulator(latency=options['latency'], error_rate=options['error_rate'],
+                                   rate_limit_rate=options['rate_limit_rate'], timeout_rate=options['timeout_rate'],
+                                   hang=options['hang'], build_duration=options['build_duration'],
+                                   queue_delay=options['queue_delay'], failure_rate=options['failure_rate'],
+                                   seed=options['seed'], record_to=record_to)
+        self.stdout.write('Simulating Drone CI at http://%s:%s' % (options['host'], options['port']))
+        try:
+            simulator.serve_forever(options['host'], options['port'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if record_to is not None:
+                record_to.close()
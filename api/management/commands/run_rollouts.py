@@ -0,0 +1,52 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.locks import advisory_lock
+from api.rollouts import advance_rollouts
+from backend.settings import env
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'api.run_rollouts'
+
+
+class Command(BaseCommand):
+    help = 'Advances fleet version rollouts wave by wave'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Advance rollouts once and exit')
+        parser.add_argument('--interval', type=float, default=env('ROLLOUT_INTERVAL'),
+                            help='Seconds between advances')
+
+    def handle(self, *args, **options):
+        while True:
+            # the lock lives in the session, start from a usable connection
+            close_old_connections()
+            # only one replica advances rollouts, the others keep trying to take over
+            with advisory_lock(LOCK_NAME) as leader:
+                if leader:
+                    self.lead(options)
+                else:
+                    logger.debug("Another replica is advancing rollouts")
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
+
+    def lead(self, options):
+        while True:
+            try:
+                advance_rollouts()
+            except Exception:
+                logger.exception("Advancing rollouts failed")
+                if options['once']:
+                    raise
+                # the session and with it the lock may be gone, elect again
+                return
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -1,2 +1,23 @@
-from django.contrib.auth.base_user import BaseUserManager
-from django.utils.translation import ugettext_lazy as _
+from django.db import models
+from django.utils import timezone
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+
+    def soft_delete(self, user):
+        """
+        Marks the rows deleted by user, keeping them in the table
+        """
+        return self.update(deleted=True, deleted_at=timezone.now(), deleted_by=user)
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """
+    Manager of the rows not soft deleted, use all_with_deleted for every row
+
+    Related objects are loaded with the base manager, a job still reaches
+    its deleted blockchain.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted=False)
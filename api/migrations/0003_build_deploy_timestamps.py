@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_contact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchainbuilddeploy',
+            name='finished_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='blockchainbuilddeploy',
+            name='started_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_build_deploy_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='droneciserver',
+            name='drained',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_droneciserver_drained'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroneJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.PositiveIntegerField(choices=[(1, 'Build'), (2, 'Deploy'), (3, 'Update'), (4, 'Terminate')])),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('submitted', 'Submitted'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField()),
+                ('locked_by', models.CharField(blank=True, default='', max_length=128)),
+                ('locked_at', models.DateTimeField(default=None, null=True)),
+                ('result', models.JSONField(default=None, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(default=None, null=True)),
+                ('block_chain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drone_jobs', to='api.blockchain')),
+                ('build_deploy', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='drone_jobs', to='api.blockchainbuilddeploy')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drone_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dronejob',
+            index=models.Index(fields=['status', 'run_after'], name='api_dronejob_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0005_drone_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='', max_length=128)),
+                ('selector', models.JSONField(default=dict)),
+                ('changes', models.JSONField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('paused', 'Paused'), ('halted', 'Halted'), ('cancelled', 'Cancelled'), ('completed', 'Completed')], default='running', max_length=16)),
+                ('wave_size', models.PositiveIntegerField(default=10)),
+                ('cluster_concurrency', models.PositiveIntegerField(default=5)),
+                ('failure_threshold', models.FloatField(default=0.1)),
+                ('halted_reason', models.CharField(blank=True, default='', max_length=512)),
+                ('resumed_at', models.DateTimeField(default=None, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(default=None, null=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollouts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dronejob',
+            name='upgrade',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='RolloutTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('k8s_cluster', models.CharField(max_length=64)),
+                ('wave', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('building', 'Building'), ('deploying', 'Deploying'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=16)),
+                ('previous', models.JSONField(default=None, null=True)),
+                ('error', models.JSONField(default=None, null=True)),
+                ('started_at', models.DateTimeField(default=None, null=True)),
+                ('finished_at', models.DateTimeField(default=None, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('block_chain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollout_targets', to='api.blockchain')),
+                ('build_job', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.dronejob')),
+                ('deploy_job', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.dronejob')),
+                ('rollout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='api.rollout')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='rollouttarget',
+            index=models.Index(fields=['rollout', 'status', 'wave'], name='api_rollouttarget_progress_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rollouttarget',
+            constraint=models.UniqueConstraint(fields=('rollout', 'block_chain'), name='api_rollouttarget_unique_block_chain'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_rollout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchainbuilddeploy',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    """
+    Fails all but the oldest unfinished job of a blockchain and type
+    """
+    DroneJob = apps.get_model('api', 'DroneJob')
+    kept = set()
+    for job in DroneJob.objects.filter(status__in=['queued', 'running']).order_by('id'):
+        if (job.block_chain_id, job.type) in kept:
+            job.status = 'failed'
+            job.result = {"detail": "Duplicate of an earlier job of the blockchain"}
+            job.save(update_fields=['status', 'result'])
+        else:
+            kept.add((job.block_chain_id, job.type))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0007_build_deploy_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('request_hash', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(default=None, null=True)),
+                ('response', models.JSONField(default=None, null=True)),
+                ('location', models.CharField(blank=True, default='', max_length=1024)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dronejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('block_chain', 'type'), name='api_dronejob_one_unfinished'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='idempotencykey',
+            index=models.Index(fields=['created_at'], name='api_idempotencykey_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='api_idempotencykey_unique_key'),
+        ),
+    ]
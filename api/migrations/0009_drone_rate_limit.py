@@ -0,0 +1,31 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroneRateBucket',
+            fields=[
+                ('droneci_server', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rate_bucket', serialize=False, to='api.droneciserver')),
+                ('tat', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='droneciserver',
+            name='rate_burst',
+            field=models.PositiveIntegerField(default=40),
+        ),
+        migrations.AddField(
+            model_name='droneciserver',
+            name='rate_limit',
+            field=models.FloatField(default=20.0),
+        ),
+    ]
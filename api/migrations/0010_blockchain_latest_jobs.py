@@ -0,0 +1,46 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_latest_jobs(apps, schema_editor):
+    """
+    Points blockchains at their latest job of each type, one update per type
+    """
+    BlockChain = apps.get_model('api', 'BlockChain')
+    BlockChainBuildDeploy = apps.get_model('api', 'BlockChainBuildDeploy')
+    for job_type, field in [(1, 'latest_build'), (2, 'latest_deploy'), (4, 'latest_terminate')]:
+        latest = BlockChainBuildDeploy.objects.filter(block_chain=models.OuterRef('pk'), type=job_type) \
+            .order_by('-id').values('id')[:1]
+        BlockChain.objects.update(**{field: models.Subquery(latest)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_drone_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchain',
+            name='latest_build',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.blockchainbuilddeploy'),
+        ),
+        migrations.AddField(
+            model_name='blockchain',
+            name='latest_deploy',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.blockchainbuilddeploy'),
+        ),
+        migrations.AddField(
+            model_name='blockchain',
+            name='latest_terminate',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.blockchainbuilddeploy'),
+        ),
+        migrations.AddIndex(
+            model_name='blockchainbuilddeploy',
+            index=models.Index(fields=['block_chain', 'type', 'id'], name='api_bcbd_chain_type_id'),
+        ),
+        migrations.RunPython(set_latest_jobs, migrations.RunPython.noop),
+    ]
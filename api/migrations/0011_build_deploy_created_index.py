@@ -0,0 +1,17 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_blockchain_latest_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blockchainbuilddeploy',
+            index=models.Index(fields=['type', 'created_at', 'id'], name='api_bcbd_type_created_id'),
+        ),
+    ]
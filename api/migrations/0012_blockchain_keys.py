@@ -0,0 +1,159 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# BlockChain fields moved to BlockChainKeys and their max_length
+REMOVED_FIELDS = [
+    ('faucet_public_key', 64),
+    ('landing_public_key', 64),
+    ('canary_beta_public_key', 64),
+    ('canary_live_public_key', 64),
+    ('canary_test_public_key', 64),
+    ('genesis_beta_public_key', 64),
+    ('genesis_beta_account', 65),
+    ('genesis_beta_work', 16),
+    ('genesis_beta_signature', 128),
+    ('genesis_dev_public_key', 64),
+    ('genesis_dev_private_key', 64),
+    ('genesis_dev_account', 65),
+    ('genesis_dev_work', 16),
+    ('genesis_dev_signature', 128),
+    ('genesis_live_public_key', 64),
+    ('genesis_live_account', 65),
+    ('genesis_live_work', 16),
+    ('genesis_live_signature', 128),
+    ('genesis_test_public_key', 64),
+    ('genesis_test_account', 65),
+    ('genesis_test_work', 16),
+    ('genesis_test_signature', 128),
+    ('beta_pre_conf_rep_account_0', 65),
+    ('beta_pre_conf_rep_account_1', 65),
+    ('beta_pre_conf_rep_public_key_0', 64),
+    ('beta_pre_conf_rep_public_key_1', 64),
+    ('beta_pre_conf_rep_private_key_0', 64),
+    ('beta_pre_conf_rep_private_key_1', 64),
+    ('live_pre_conf_rep_account_0', 65),
+    ('live_pre_conf_rep_account_1', 65),
+    ('live_pre_conf_rep_account_2', 65),
+    ('live_pre_conf_rep_account_3', 65),
+    ('live_pre_conf_rep_account_4', 65),
+    ('live_pre_conf_rep_account_5', 65),
+    ('live_pre_conf_rep_account_6', 65),
+    ('live_pre_conf_rep_account_7', 65),
+    ('live_pre_conf_rep_public_key_0', 64),
+    ('live_pre_conf_rep_public_key_1', 64),
+    ('live_pre_conf_rep_public_key_2', 64),
+    ('live_pre_conf_rep_public_key_3', 64),
+    ('live_pre_conf_rep_public_key_4', 64),
+    ('live_pre_conf_rep_public_key_5', 64),
+    ('live_pre_conf_rep_public_key_6', 64),
+    ('live_pre_conf_rep_public_key_7', 64),
+    ('live_pre_conf_rep_private_key_0', 64),
+    ('live_pre_conf_rep_private_key_1', 64),
+    ('live_pre_conf_rep_private_key_2', 64),
+    ('live_pre_conf_rep_private_key_3', 64),
+    ('live_pre_conf_rep_private_key_4', 64),
+    ('live_pre_conf_rep_private_key_5', 64),
+    ('live_pre_conf_rep_private_key_6', 64),
+    ('live_pre_conf_rep_private_key_7', 64),
+]
+
+
+def copy_keys(apps, schema_editor):
+    """
+    Moves the key material of every blockchain to its BlockChainKeys
+    """
+    BlockChain = apps.get_model('api', 'BlockChain')
+    BlockChainKeys = apps.get_model('api', 'BlockChainKeys')
+    fields = [name for name, _ in REMOVED_FIELDS]
+    batch = []
+    for values in BlockChain.objects.order_by('id').values('id', *fields).iterator(chunk_size=500):
+        batch.append(BlockChainKeys(block_chain_id=values.pop('id'), **values))
+        if len(batch) == 500:
+            BlockChainKeys.objects.bulk_create(batch)
+            batch = []
+    BlockChainKeys.objects.bulk_create(batch)
+
+
+def restore_keys(apps, schema_editor):
+    BlockChain = apps.get_model('api', 'BlockChain')
+    BlockChainKeys = apps.get_model('api', 'BlockChainKeys')
+    fields = [name for name, _ in REMOVED_FIELDS]
+    for keys in BlockChainKeys.objects.values('block_chain_id', *fields).iterator(chunk_size=500):
+        BlockChain.objects.filter(id=keys.pop('block_chain_id')).update(**keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_build_deploy_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockChainKeys',
+            fields=[
+                ('block_chain', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='keys', serialize=False, to='api.blockchain')),
+                ('faucet_public_key', models.CharField(max_length=64)),
+                ('landing_public_key', models.CharField(max_length=64)),
+                ('canary_beta_public_key', models.CharField(max_length=64)),
+                ('canary_live_public_key', models.CharField(max_length=64)),
+                ('canary_test_public_key', models.CharField(max_length=64)),
+                ('genesis_beta_public_key', models.CharField(max_length=64)),
+                ('genesis_beta_account', models.CharField(max_length=65)),
+                ('genesis_beta_work', models.CharField(max_length=16)),
+                ('genesis_beta_signature', models.CharField(max_length=128)),
+                ('genesis_dev_public_key', models.CharField(max_length=64)),
+                ('genesis_dev_private_key', models.CharField(max_length=64)),
+                ('genesis_dev_account', models.CharField(max_length=65)),
+                ('genesis_dev_work', models.CharField(max_length=16)),
+                ('genesis_dev_signature', models.CharField(max_length=128)),
+                ('genesis_live_public_key', models.CharField(max_length=64)),
+                ('genesis_live_account', models.CharField(max_length=65)),
+                ('genesis_live_work', models.CharField(max_length=16)),
+                ('genesis_live_signature', models.CharField(max_length=128)),
+                ('genesis_test_public_key', models.CharField(max_length=64)),
+                ('genesis_test_account', models.CharField(max_length=65)),
+                ('genesis_test_work', models.CharField(max_length=16)),
+                ('genesis_test_signature', models.CharField(max_length=128)),
+                ('beta_pre_conf_rep_account_0', models.CharField(max_length=65)),
+                ('beta_pre_conf_rep_account_1', models.CharField(max_length=65)),
+                ('beta_pre_conf_rep_public_key_0', models.CharField(max_length=64)),
+                ('beta_pre_conf_rep_public_key_1', models.CharField(max_length=64)),
+                ('beta_pre_conf_rep_private_key_0', models.CharField(max_length=64)),
+                ('beta_pre_conf_rep_private_key_1', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_account_0', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_1', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_2', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_3', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_4', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_5', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_6', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_account_7', models.CharField(max_length=65)),
+                ('live_pre_conf_rep_public_key_0', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_1', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_2', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_3', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_4', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_5', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_6', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_public_key_7', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_0', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_1', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_2', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_3', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_4', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_5', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_6', models.CharField(max_length=64)),
+                ('live_pre_conf_rep_private_key_7', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.RunPython(copy_keys, restore_keys),
+        # a default lets the fields be added back when unapplied
+        *[migrations.AlterField(model_name='blockchain', name=name,
+                                field=models.CharField(max_length=max_length, default=''))
+          for name, max_length in REMOVED_FIELDS],
+        *[migrations.RemoveField(model_name='blockchain', name=name) for name, _ in REMOVED_FIELDS],
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.8 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+def clear_deleted_at(apps, schema_editor):
+    """
+    deleted_at of organizations was updated on every save, only deleted ones keep it
+    """
+    Organization = apps.get_model('api', 'Organization')
+    Organization.objects.filter(deleted=False).update(deleted_at=None)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_blockchain_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='organization',
+            name='deleted_at',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.RunPython(clear_deleted_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='blockchain',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['owner', 'id'], name='api_blockchain_live_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['owner', 'id'], name='api_org_live_owner_idx'),
+        ),
+    ]
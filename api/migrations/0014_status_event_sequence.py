@@ -0,0 +1,25 @@
+from django.db import migrations
+
+SEQUENCE = 'api_status_event_seq'
+
+
+def create_sequence(apps, schema_editor):
+    # status events are only published with postgres NOTIFY
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS %s' % SEQUENCE)
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS %s' % SEQUENCE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
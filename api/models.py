@@ -3,6 +3,8 @@ from django.contrib.auth.models import User
 from django.contrib.auth.models import AbstractUser
 from encrypted_model_fields.fields import EncryptedCharField
 
+from api.managers import SoftDeleteManager, SoftDeleteQuerySet
+
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
@@ -32,16 +34,23 @@ class Organization(models.Model):
     created_at = models.DateTimeField(auto_now=False, auto_now_add=True)
     created_by = models.ForeignKey(User, null=False, on_delete=models.CASCADE, related_name='organization_created_by')
     deleted = models.BooleanField(null=False, default=False)
-    deleted_at = models.DateTimeField(auto_now=True, null=True)
+    deleted_at = models.DateTimeField(null=True, default=None)
     deleted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='organization_delete_by', null=True)
     updated_at = models.DateTimeField(auto_now=True)
     owner = models.ForeignKey(User, null=True, on_delete=models.CASCADE, related_name='organization_owner')
 
+    # live organizations, soft deleted ones only through all_with_deleted
+    objects = SoftDeleteManager()
+    all_with_deleted = SoftDeleteQuerySet.as_manager()
+
     def __str__(self):
         return "%s - %s" % (self.id, self.name)
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='api_org_live_owner_idx', condition=models.Q(deleted=False)),
+        ]
 
 
 class Profile(models.Model):
@@ -97,6 +106,81 @@ class BlockChain(models.Model):
     domain_svc = models.CharField(max_length=256, blank=False, default='verigasvc.com')
     enable_custom_domain = models.BooleanField(blank=False, default=False)
     custom_domain = models.CharField(max_length=256, blank=True, default='')
+    k8s_cluster = models.CharField(max_length=64, blank=False, default='k8s0')
+    nano_network = models.CharField(max_length=64, blank=False, default='live')
+    nault_version = models.CharField(max_length=64, blank=False, default='v1.15.0')
+    nault_price_url = models.CharField(max_length=1024, blank=False, default='None')
+    nault_store_key = models.CharField(max_length=128, blank=True, default='None')
+    nault_hid_rep_help = models.BooleanField(default=True)
+    ninja_version = models.CharField(max_length=64, blank=False, default='663a5b24e2a8e1d423fc3311a6945cc0d234953e')
+    proxy_version = models.CharField(max_length=64, blank=False, default='v1.4.4')
+    proxy_price_url = models.CharField(max_length=1024, blank=False, default='None')
+    supply_multiplier = models.CharField(max_length=128, choices=SUPPLY_MULTIPLIER, default=BILLION)
+    work_threshold = models.CharField(max_length=128, choices=WORK_THRESHOLD,default=NANO)
+    work_threshold_default = models.CharField(max_length=64, blank=False, default='fffffff800000000')
+    work_receive_threshold_default = models.CharField(max_length=64, blank=False, default='fffffe0000000000')
+    live_node_peering_port = models.CharField(max_length=5, blank=False, default='7075')
+    beta_node_peering_port = models.CharField(max_length=5, blank=False, default='54000')
+    test_node_peering_port = models.CharField(max_length=5, blank=False, default='44000')
+    live_rpc_port = models.CharField(max_length=5, blank=False, default='7076')
+    beta_rpc_port = models.CharField(max_length=5, blank=False, default='55000')
+    test_rpc_port = models.CharField(max_length=5, blank=False, default='45000')
+    logging = models.CharField(max_length=100, blank=True, default='INFO')
+    node_version = models.CharField(max_length=100, blank=False)
+    binary_public = models.BooleanField(blank=False, default=False)
+    s3_bucket_name = models.CharField(max_length=256, blank=True, default='')
+    number_of_peers = models.IntegerField(blank=False, default=2)
+    status = models.PositiveIntegerField(choices=STATUS, default=CREATED)
+    deleted = models.BooleanField(null=False, default=False)
+    deleted_at = models.DateTimeField(null=True, default=None)
+    deleted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blockchain_delete_by', null=True)
+    created_at = models.DateTimeField(auto_now=False, auto_now_add=True)
+    created_by = models.ForeignKey(User, null=False, on_delete=models.CASCADE, related_name='blockchain_created_by')
+    updated_at = models.DateTimeField(auto_now=True)
+    organization = models.ForeignKey(Organization, blank=True, null=True, on_delete=models.CASCADE)
+    owner = models.ForeignKey(User, null=True, on_delete=models.CASCADE, related_name='blockchain_owner')
+    # latest BlockChainBuildDeploy of each type, kept up to date by signals
+    latest_build = models.ForeignKey('BlockChainBuildDeploy', null=True, blank=True, default=None,
+                                     on_delete=models.SET_NULL, related_name='+')
+    latest_deploy = models.ForeignKey('BlockChainBuildDeploy', null=True, blank=True, default=None,
+                                      on_delete=models.SET_NULL, related_name='+')
+    latest_terminate = models.ForeignKey('BlockChainBuildDeploy', null=True, blank=True, default=None,
+                                         on_delete=models.SET_NULL, related_name='+')
+
+    # live blockchains, soft deleted ones only through all_with_deleted
+    objects = SoftDeleteManager()
+    all_with_deleted = SoftDeleteQuerySet.as_manager()
+
+    def __str__(self):
+        return "%s - %s" % (self.id, self.abbreviation)
+
+    def save(self, *args, **kwargs):
+        # latest job pointers only move forward with conditional updates,
+        # saving an outdated instance must not move them back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in LATEST_JOB_FIELDS.values()]
+        super().save(*args, **kwargs)
+
+    def __int__(self):
+        return self.id
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='api_blockchain_live_owner_idx',
+                         condition=models.Q(deleted=False)),
+        ]
+
+
+class BlockChainKeys(models.Model):
+    """
+    Genesis, representative and canary key material of a blockchain
+
+    Kept apart from BlockChain so lists and lookups of blockchains do not
+    load it, it is read for build parameters and detail views only.
+    """
+    block_chain = models.OneToOneField(BlockChain, on_delete=models.CASCADE, primary_key=True, related_name='keys')
     faucet_public_key = models.CharField(max_length=64, blank=False)
     landing_public_key = models.CharField(max_length=64, blank=False)
     canary_beta_public_key = models.CharField(max_length=64, blank=False)
@@ -149,48 +233,9 @@ class BlockChain(models.Model):
     live_pre_conf_rep_private_key_5 = models.CharField(max_length=64, blank=False)
     live_pre_conf_rep_private_key_6 = models.CharField(max_length=64, blank=False)
     live_pre_conf_rep_private_key_7 = models.CharField(max_length=64, blank=False)
-    k8s_cluster = models.CharField(max_length=64, blank=False, default='k8s0')
-    nano_network = models.CharField(max_length=64, blank=False, default='live')
-    nault_version = models.CharField(max_length=64, blank=False, default='v1.15.0')
-    nault_price_url = models.CharField(max_length=1024, blank=False, default='None')
-    nault_store_key = models.CharField(max_length=128, blank=True, default='None')
-    nault_hid_rep_help = models.BooleanField(default=True)
-    ninja_version = models.CharField(max_length=64, blank=False, default='663a5b24e2a8e1d423fc3311a6945cc0d234953e')
-    proxy_version = models.CharField(max_length=64, blank=False, default='v1.4.4')
-    proxy_price_url = models.CharField(max_length=1024, blank=False, default='None')
-    supply_multiplier = models.CharField(max_length=128, choices=SUPPLY_MULTIPLIER, default=BILLION)
-    work_threshold = models.CharField(max_length=128, choices=WORK_THRESHOLD,default=NANO)
-    work_threshold_default = models.CharField(max_length=64, blank=False, default='fffffff800000000')
-    work_receive_threshold_default = models.CharField(max_length=64, blank=False, default='fffffe0000000000')
-    live_node_peering_port = models.CharField(max_length=5, blank=False, default='7075')
-    beta_node_peering_port = models.CharField(max_length=5, blank=False, default='54000')
-    test_node_peering_port = models.CharField(max_length=5, blank=False, default='44000')
-    live_rpc_port = models.CharField(max_length=5, blank=False, default='7076')
-    beta_rpc_port = models.CharField(max_length=5, blank=False, default='55000')
-    test_rpc_port = models.CharField(max_length=5, blank=False, default='45000')
-    logging = models.CharField(max_length=100, blank=True, default='INFO')
-    node_version = models.CharField(max_length=100, blank=False)
-    binary_public = models.BooleanField(blank=False, default=False)
-    s3_bucket_name = models.CharField(max_length=256, blank=True, default='')
-    number_of_peers = models.IntegerField(blank=False, default=2)
-    status = models.PositiveIntegerField(choices=STATUS, default=CREATED)
-    deleted = models.BooleanField(null=False, default=False)
-    deleted_at = models.DateTimeField(null=True, default=None)
-    deleted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blockchain_delete_by', null=True)
-    created_at = models.DateTimeField(auto_now=False, auto_now_add=True)
-    created_by = models.ForeignKey(User, null=False, on_delete=models.CASCADE, related_name='blockchain_created_by')
-    updated_at = models.DateTimeField(auto_now=True)
-    organization = models.ForeignKey(Organization, blank=True, null=True, on_delete=models.CASCADE)
-    owner = models.ForeignKey(User, null=True, on_delete=models.CASCADE, related_name='blockchain_owner')
 
     def __str__(self):
-        return "%s - %s" % (self.id, self.abbreviation)
-
-    def __int__(self):
-        return self.id
-
-    class Meta:
-        ordering = ['id']
+        return "%s - keys" % self.block_chain_id
 
 
 class DroneCIServer(models.Model):
@@ -198,6 +243,11 @@ class DroneCIServer(models.Model):
     description = models.TextField(max_length=2048, blank=True, default='')
     server = models.URLField(max_length=254, blank=True, default='')
     token = EncryptedCharField(max_length=254)
+    # drained servers finish their jobs but do not get new builds
+    drained = models.BooleanField(default=False)
+    # api calls per second and calls allowed at once across all processes, 0 for no limit
+    rate_limit = models.FloatField(default=20.0)
+    rate_burst = models.PositiveIntegerField(default=40)
 
     def __str__(self):
         return "%s - %s" % (self.id, self.name)
@@ -209,6 +259,16 @@ class DroneCIServer(models.Model):
         ordering = ['id']
 
 
+class DroneRateBucket(models.Model):
+    """
+    Shared token bucket of the api calls to a DroneCIServer
+    tat is the theoretical arrival time of the next call in epoch seconds
+    """
+    droneci_server = models.OneToOneField(DroneCIServer, on_delete=models.CASCADE, primary_key=True,
+                                          related_name='rate_bucket')
+    tat = models.FloatField(default=0)
+
+
 class BlockChainBuildDeploy(models.Model):
     BUILD = 1
     DEPLOY = 2
@@ -240,10 +300,28 @@ class BlockChainBuildDeploy(models.Model):
     )
     droneci_server = models.ForeignKey(DroneCIServer, on_delete=models.CASCADE,
                                        related_name='droneci_server', default=1)
+    started_at = models.DateTimeField(null=True, default=None)
+    finished_at = models.DateTimeField(null=True, default=None)
     updated_at = models.DateTimeField(auto_now=True)
+    # config_fingerprint of the blockchain a build was started with
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            # latest jobs of a type of a blockchain
+            models.Index(fields=['block_chain', 'type', 'id'], name='api_bcbd_chain_type_id'),
+            # pages of the jobs of a type
+            models.Index(fields=['type', 'created_at', 'id'], name='api_bcbd_type_created_id'),
+        ]
+
+
+# BlockChain field pointing at the latest BlockChainBuildDeploy of a type
+LATEST_JOB_FIELDS = {
+    BlockChainBuildDeploy.BUILD: 'latest_build',
+    BlockChainBuildDeploy.DEPLOY: 'latest_deploy',
+    BlockChainBuildDeploy.TERMINATE: 'latest_terminate',
+}
 
 
 class Contact(models.Model):
@@ -257,3 +335,157 @@ class Contact(models.Model):
 
     class Meta:
         ordering = ['id']
+
+
+class DroneJob(models.Model):
+    """
+    Queued start of a build, deploy or terminate job on Drone CI
+    Claimed and run by the run_drone_jobs workers
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUBMITTED = 'submitted'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUBMITTED, 'Submitted'),
+        (FAILED, 'Failed'),
+    )
+    block_chain = models.ForeignKey(BlockChain, on_delete=models.CASCADE, related_name='drone_jobs')
+    type = models.PositiveIntegerField(choices=BlockChainBuildDeploy.TYPES)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    # replaces a successful job of the blockchain, like a version upgrade
+    upgrade = models.BooleanField(default=False)
+    # placeholder of the job once a worker created it
+    build_deploy = models.ForeignKey(BlockChainBuildDeploy, on_delete=models.SET_NULL,
+                                     related_name='drone_jobs', null=True, default=None)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=128, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, default=None)
+    # drone answer or error details of the last attempt
+    result = models.JSONField(null=True, default=None)
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='drone_jobs')
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, default=None)
+
+    # statuses of jobs not handed to drone yet, one per blockchain and type
+    UNFINISHED_STATUSES = (QUEUED, RUNNING)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['block_chain', 'type'], condition=models.Q(status__in=['queued', 'running']),
+                                    name='api_dronejob_one_unfinished'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='api_dronejob_queue_idx'),
+        ]
+
+
+class Rollout(models.Model):
+    """
+    Change of BlockChain versions built and deployed across many blockchains in waves
+    Advanced by the run_rollouts command
+    """
+    RUNNING = 'running'
+    PAUSED = 'paused'
+    HALTED = 'halted'
+    CANCELLED = 'cancelled'
+    COMPLETED = 'completed'
+    STATUSES = (
+        (RUNNING, 'Running'),
+        (PAUSED, 'Paused'),
+        (HALTED, 'Halted'),
+        (CANCELLED, 'Cancelled'),
+        (COMPLETED, 'Completed'),
+    )
+    name = models.CharField(max_length=128, blank=True, default='')
+    # BlockChain field values the blockchains are selected by
+    selector = models.JSONField(default=dict)
+    # BlockChain version fields and their new values
+    changes = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUSES, default=RUNNING)
+    wave_size = models.PositiveIntegerField(default=10)
+    # blockchains upgraded at the same time per k8s cluster
+    cluster_concurrency = models.PositiveIntegerField(default=5)
+    # share of failed blockchains that halts the rollout
+    failure_threshold = models.FloatField(default=0.1)
+    halted_reason = models.CharField(max_length=512, blank=True, default='')
+    resumed_at = models.DateTimeField(null=True, default=None)
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rollouts')
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, default=None)
+
+    class Meta:
+        ordering = ['id']
+
+
+class RolloutTarget(models.Model):
+    """
+    BlockChain of a Rollout and its upgrade progress
+    """
+    PENDING = 'pending'
+    BUILDING = 'building'
+    DEPLOYING = 'deploying'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (BUILDING, 'Building'),
+        (DEPLOYING, 'Deploying'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (SKIPPED, 'Skipped'),
+    )
+    rollout = models.ForeignKey(Rollout, on_delete=models.CASCADE, related_name='targets')
+    block_chain = models.ForeignKey(BlockChain, on_delete=models.CASCADE, related_name='rollout_targets')
+    k8s_cluster = models.CharField(max_length=64)
+    wave = models.PositiveIntegerField()
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    # version field values before the upgrade
+    previous = models.JSONField(null=True, default=None)
+    build_job = models.ForeignKey(DroneJob, on_delete=models.SET_NULL, related_name='+', null=True, default=None)
+    deploy_job = models.ForeignKey(DroneJob, on_delete=models.SET_NULL, related_name='+', null=True, default=None)
+    error = models.JSONField(null=True, default=None)
+    started_at = models.DateTimeField(null=True, default=None)
+    finished_at = models.DateTimeField(null=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['rollout', 'block_chain'], name='api_rollouttarget_unique_block_chain'),
+        ]
+        indexes = [
+            models.Index(fields=['rollout', 'status', 'wave'], name='api_rollouttarget_progress_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response to a request sent with an Idempotency-Key header
+    The request sent again with the same key gets the stored response
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # SHA-256 of the method, path and body of the request
+    request_hash = models.CharField(max_length=64)
+    # None while the request is in progress
+    status_code = models.PositiveSmallIntegerField(null=True, default=None)
+    response = models.JSONField(null=True, default=None)
+    location = models.CharField(max_length=1024, blank=True, default='')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='api_idempotencykey_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='api_idempotencykey_created_idx'),
+        ]
@@ -0,0 +1,192 @@
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from backend.settings import env
+
+
+def parse_timestamp(value):
+    timestamp = parse_datetime(value)
+    if timestamp is not None and timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, timezone.utc)
+    return timestamp
+
+
+def _value(row, field):
+    # .values() querysets paginate dicts
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (created_at, id), oldest first
+
+    Pages are found with WHERE (created_at, id) > (cursor) instead of an
+    offset, rows added or removed meanwhile do not shift pages. Models
+    without created_at are paginated on id.
+
+    ?page_size=<n> rows per page, PAGE_SIZE by default and API_MAX_PAGE_SIZE at most
+    ?since=<datetime> only rows created since
+    ?cursor=<cursor> the page of a next or previous link
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    since_query_param = 'since'
+    timestamp_field = 'created_at'
+
+    def get_ordering(self, queryset):
+        try:
+            queryset.model._meta.get_field(self.timestamp_field)
+        except FieldDoesNotExist:
+            return ['id']
+        return [self.timestamp_field, 'id']
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE
+        value = request.query_params.get(self.page_size_query_param)
+        if value:
+            try:
+                page_size = int(value)
+            except ValueError:
+                raise ValidationError({self.page_size_query_param: 'A number is required.'})
+        return max(1, min(page_size, env('API_MAX_PAGE_SIZE')))
+
+    def encode_cursor(self, row, reverse):
+        position = [str(_value(row, 'id')) if field == 'id' else _value(row, field).isoformat()
+                    for field in self.ordering]
+        raw = '|'.join(['r' if reverse else 'n'] + position)
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """
+        Returns whether the cursor pages backwards and its position
+        """
+        try:
+            direction, *position = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            if direction not in ('n', 'r') or len(position) != len(self.ordering):
+                raise ValueError
+            values = []
+            for field, value in zip(self.ordering, position):
+                if field == 'id':
+                    values.append(int(value))
+                else:
+                    values.append(parse_timestamp(value))
+                    if values[-1] is None:
+                        raise ValueError
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound('Invalid cursor')
+        return direction == 'r', values
+
+    def position_filter(self, values, reverse):
+        """
+        Rows after a position, before it when paging backwards
+        """
+        lookup = 'lt' if reverse else 'gt'
+        if len(self.ordering) == 1:
+            return Q(**{'id__' + lookup: values[0]})
+        timestamp, pk = values
+        return Q(**{self.timestamp_field + '__' + lookup: timestamp}) | \
+            Q(**{self.timestamp_field: timestamp, 'id__' + lookup: pk})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        self.page_size = self.get_page_size(request)
+
+        since = request.query_params.get(self.since_query_param)
+        if since:
+            if len(self.ordering) == 1:
+                raise ValidationError({self.since_query_param: 'Not supported by this list.'})
+            timestamp = parse_timestamp(since)
+            if timestamp is None:
+                raise ValidationError({self.since_query_param: 'A datetime is required.'})
+            queryset = queryset.filter(**{self.timestamp_field + '__gte': timestamp})
+
+        reverse, position = False, None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            reverse, position = self.decode_cursor(cursor)
+            queryset = queryset.filter(self.position_filter(position, reverse))
+
+        ordering = ['-' + field for field in self.ordering] if reverse else self.ordering
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # a cursor proves rows exist on the side it came from
+        self.has_next = more if not reverse else position is not None
+        self.has_previous = more if reverse else position is not None
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def link(self, row, reverse):
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                   self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.link(self.last, False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.link(self.first, True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'integer'}},
+            {'name': self.since_query_param, 'required': False, 'in': 'query',
+             'schema': {'type': 'string', 'format': 'date-time'}},
+        ]
+
+
+def paginated_response(request, queryset, view=None):
+    """
+    Keyset paginated response of a queryset for views without a pagination class
+    """
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    return paginator.get_paginated_response(page)
+
+
+def keyset_batches(queryset, size):
+    """
+    Rows of a queryset in id order, size rows at a time
+
+    Each batch is its own WHERE id > <last id> query like the pages of
+    KeysetPagination, memory stays at one batch without a server-side cursor.
+    Rows are model instances or .values() dicts.
+    """
+    paginator = KeysetPagination()
+    paginator.ordering = ['id']
+    position = None
+    while True:
+        batch = queryset if position is None else queryset.filter(paginator.position_filter(position, False))
+        rows = list(batch.order_by('id')[:size])
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        position = [_value(rows[-1], 'id')]
@@ -0,0 +1,149 @@
+import hashlib
+from urllib.parse import urlencode
+
+from api.models import BlockChainBuildDeploy, BlockChainKeys
+from backend.settings import env
+
+
+def s3_bucket_name(block_chain):
+    if block_chain.s3_bucket_name != "None":
+        return block_chain.s3_bucket_name
+    return env('S3_BUCKET_PREFIX')+'-'+block_chain.abbreviation
+
+
+# drone build parameters and the BlockChain field or function of blockchain they come from
+BUILD_PARAMS = (
+    ('ABBREVIATION', 'abbreviation'),
+    ('BOOMPOW_VERSION', 'boompow_version'),
+    ('BOOMPOW_PAYOUT_ADDRESS', 'boompow_payout_address'),
+    ('BLOCK_NAME', 'name'),
+    ('DEBUG', 'debug'),
+    ('ENABLE_CUSTOM_DOMAIN', 'enable_custom_domain'),
+    ('CUSTOM_DOMAIN', 'custom_domain'),
+    ('DOMAINSVC', 'domain_svc'),
+    ('FAUCET_PUBLIC_KEY', 'faucet_public_key'),
+    ('LANDING_PUBLIC_KEY', 'landing_public_key'),
+    ('CANARY_BETA_PUBLIC_KEY', 'canary_beta_public_key'),
+    ('CANARY_LIVE_PUBLIC_KEY', 'canary_live_public_key'),
+    ('CANARY_TEST_PUBLIC_KEY', 'canary_test_public_key'),
+    ('GENESIS_DEV_PUBLIC_KEY', 'genesis_dev_public_key'),
+    ('GENESIS_DEV_PRIVATE_KEY', 'genesis_dev_private_key'),
+    ('GENESIS_DEV_ACCOUNT', 'genesis_dev_account'),
+    ('GENESIS_DEV_WORK', 'genesis_dev_work'),
+    ('GENESIS_DEV_SIGNATURE', 'genesis_dev_signature'),
+    ('GENESIS_BETA_PUBLIC_KEY', 'genesis_beta_public_key'),
+    ('GENESIS_BETA_ACCOUNT', 'genesis_beta_account'),
+    ('GENESIS_BETA_WORK', 'genesis_beta_work'),
+    ('GENESIS_BETA_SIGNATURE', 'genesis_beta_signature'),
+    ('GENESIS_LIVE_PUBLIC_KEY', 'genesis_live_public_key'),
+    ('GENESIS_LIVE_ACCOUNT', 'genesis_live_account'),
+    ('GENESIS_LIVE_WORK', 'genesis_live_work'),
+    ('GENESIS_LIVE_SIGNATURE', 'genesis_live_signature'),
+    ('GENESIS_TEST_PUBLIC_KEY', 'genesis_test_public_key'),
+    ('GENESIS_TEST_ACCOUNT', 'genesis_test_account'),
+    ('GENESIS_TEST_WORK', 'genesis_test_work'),
+    ('GENESIS_TEST_SIGNATURE', 'genesis_test_signature'),
+    ('BETA_PRE_CONFIGURED_REP0', 'beta_pre_conf_rep_public_key_0'),
+    ('BETA_PRE_CONFIGURED_REP1', 'beta_pre_conf_rep_public_key_1'),
+    ('LIVE_PRE_CONFIGURED_REP0', 'live_pre_conf_rep_public_key_0'),
+    ('LIVE_PRE_CONFIGURED_REP1', 'live_pre_conf_rep_public_key_1'),
+    ('LIVE_PRE_CONFIGURED_REP2', 'live_pre_conf_rep_public_key_2'),
+    ('LIVE_PRE_CONFIGURED_REP3', 'live_pre_conf_rep_public_key_3'),
+    ('LIVE_PRE_CONFIGURED_REP4', 'live_pre_conf_rep_public_key_4'),
+    ('LIVE_PRE_CONFIGURED_REP5', 'live_pre_conf_rep_public_key_5'),
+    ('LIVE_PRE_CONFIGURED_REP6', 'live_pre_conf_rep_public_key_6'),
+    ('LIVE_PRE_CONFIGURED_REP7', 'live_pre_conf_rep_public_key_7'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP0', 'live_pre_conf_rep_account_0'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP1', 'live_pre_conf_rep_account_1'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP2', 'live_pre_conf_rep_account_2'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP3', 'live_pre_conf_rep_account_3'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP4', 'live_pre_conf_rep_account_4'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP5', 'live_pre_conf_rep_account_5'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP6', 'live_pre_conf_rep_account_6'),
+    ('LIVE_PRE_CONFIGURED_ACCOUNT_REP7', 'live_pre_conf_rep_account_7'),
+    ('K8S_CLUSTER', 'k8s_cluster'),
+    ('LOGGING', 'logging'),
+    ('NANO_NETWORK', 'nano_network'),
+    ('NAULT_VERSION', 'nault_version'),
+    ('NAULT_PRICE_URL', 'nault_price_url'),
+    ('NAULT_STORE_KEY', 'nault_store_key'),
+    ('NAULT_HIDE_REP_HELP', 'nault_hid_rep_help'),
+    ('NINJA_VERSION', 'ninja_version'),
+    ('PROXY_VERSION', 'proxy_version'),
+    ('PROXY_PRICE_URL', 'proxy_price_url'),
+    ('LIVE_NODE_PEERING_PORT', 'live_node_peering_port'),
+    ('BETA_NODE_PEERING_PORT', 'beta_node_peering_port'),
+    ('TEST_NODE_PEERING_PORT', 'test_node_peering_port'),
+    ('LIVE_RPC_PORT', 'live_rpc_port'),
+    ('BETA_RPC_PORT', 'beta_rpc_port'),
+    ('TEST_RPC_PORT', 'test_rpc_port'),
+    ('NODE_VERSION', 'node_version'),
+    ('BINARY_PUBLIC', 'binary_public'),
+    ('S3_BUCKET_NAME', s3_bucket_name),
+    ('NUMBER_OF_PEERS', 'number_of_peers'),
+    ('WORK_THRESHOLD', 'work_threshold'),
+    ('WORK_THRESHOLD_DEFAULT', 'work_threshold_default'),
+    ('WORK_RECEIVE_THRESHOLD_DEFAULT', 'work_receive_threshold_default'),
+    ('SUPPLY_MULTIPLIER', 'supply_multiplier'),
+)
+
+
+# BUILD_PARAMS fields read from the BlockChainKeys of the blockchain
+KEY_FIELDS = {field.name for field in BlockChainKeys._meta.concrete_fields if not field.primary_key}
+
+
+def blockchain_params(block_chain):
+    """
+    Drone build parameters of a blockchain configuration as (name, value) pairs
+    """
+    params = []
+    for name, source in BUILD_PARAMS:
+        if callable(source):
+            value = source(block_chain)
+        else:
+            value = getattr(block_chain.keys if source in KEY_FIELDS else block_chain, source)
+        params.append((name, str(value)))
+    return params
+
+
+def config_fingerprint(block_chain):
+    """
+    SHA-256 of the blockchain configuration a build is made of
+    Equal fingerprints build the same blockchain, with the same build-deploy pipeline
+    """
+    params = sorted(blockchain_params(block_chain))
+    params += [('branch', env('BUILD_DEPLOY_BRANCH')), ('repo', env('BUILD_DEPLOY_REPO'))]
+    return hashlib.sha256(urlencode(params).encode()).hexdigest()
+
+
+def build_params(block_chain, build):
+    return blockchain_params(block_chain) + [
+        ('VERIGA_BUILD_DEPLOY_ID', str(build.id)),
+    ]
+
+
+def deploy_params(block_chain, deploy):
+    return [
+        ('ABBREVIATION', block_chain.abbreviation),
+        ('VERIGA_BUILD_DEPLOY_ID', str(deploy.id)),
+    ]
+
+
+def terminate_params(block_chain, terminate):
+    return [
+        ('ABBREVIATION', block_chain.abbreviation),
+        ('VERIGA_BUILD_DEPLOY_ID', str(terminate.id)),
+        ('VERIGA_BLOCK_CHAIN_ID', str(block_chain.id)),
+    ]
+
+
+def job_params(block_chain, build_deploy):
+    """
+    Drone parameters of a job
+    """
+    params = {
+        BlockChainBuildDeploy.BUILD: build_params,
+        BlockChainBuildDeploy.DEPLOY: deploy_params,
+        BlockChainBuildDeploy.TERMINATE: terminate_params,
+    }
+    return params[build_deploy.type](block_chain, build_deploy)
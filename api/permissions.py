@@ -13,7 +13,8 @@ class IsOwner(permissions.BasePermission):
 
     # for object level permission
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        # compares ids, not loading the owner
+        return obj.owner_id == request.user.id
 
 
 class IsUserOwner(permissions.BasePermission):
@@ -43,4 +44,4 @@ class IsCreatedBy(permissions.BasePermission):
 
     # for object level permission
     def has_object_permission(self, request, view, obj):
-        return obj.created_by == request.user
+        return obj.created_by_id == request.user.id
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+
+from api.models import DroneRateBucket
+
+logger = logging.getLogger(__name__)
+
+# waiting statistics per DroneCIServer id
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class RateLimitStats:
+    """
+    Time the calls of the process spent waiting on the rate limit of a server
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.rejected = 0
+
+    def record(self, waited, allowed):
+        with self.lock:
+            self.calls += 1
+            self.waited += waited
+            if waited:
+                self.waits += 1
+            if not allowed:
+                self.rejected += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'waits': self.waits,
+                'waited': round(self.waited, 3),
+                'rejected': self.rejected,
+            }
+
+
+def get_stats(droneci_server_id):
+    with _stats_lock:
+        stats = _stats.get(droneci_server_id)
+        if stats is None:
+            stats = _stats[droneci_server_id] = RateLimitStats()
+        return stats
+
+
+def take(droneci_server):
+    """
+    Takes a token of the shared bucket of a DroneCIServer
+    Returns 0 if it was taken, otherwise the seconds until one is available
+
+    The bucket is a GCRA: one conditional update moves the theoretical arrival
+    time on by 1/rate_limit if it is at most rate_burst calls ahead of now,
+    all processes share the row. Limiting fails open when the database does.
+    """
+    if droneci_server.rate_limit <= 0:
+        return 0
+    interval = 1.0 / droneci_server.rate_limit
+    tolerance = (max(1, droneci_server.rate_burst) - 1) * interval
+
+    try:
+        for _ in range(2):
+            now = time.time()
+            bucket = DroneRateBucket.objects.filter(droneci_server_id=droneci_server.id)
+            if bucket.filter(tat__lte=now + tolerance) \
+                    .update(tat=Greatest(F('tat'), Value(now, output_field=FloatField())) + interval):
+                return 0
+            tat = bucket.values_list('tat', flat=True).first()
+            if tat is not None:
+                return max(tat - tolerance - now, 0.001)
+            DroneRateBucket.objects.get_or_create(droneci_server_id=droneci_server.id)
+    except DatabaseError:
+        logger.exception("Rate limit of Drone CI server %s not available", droneci_server.id)
+    return 0
+
+
+def acquire(droneci_server, max_wait):
+    """
+    Waits up to max_wait seconds for a call to a DroneCIServer
+    Returns whether the call may be sent, 0 fails fast
+    """
+    waited = 0
+    while True:
+        delay = take(droneci_server)
+        if not delay or waited + delay > max_wait:
+            get_stats(droneci_server.id).record(waited, not delay)
+            return not delay
+        time.sleep(delay)
+        waited += delay
+
+
+async def async_acquire(droneci_server, max_wait):
+    """
+    acquire without holding the event loop while waiting
+    """
+    waited = 0
+    while True:
+        delay = await sync_to_async(take)(droneci_server)
+        if not delay or waited + delay > max_wait:
+            get_stats(droneci_server.id).record(waited, not delay)
+            return not delay
+        await asyncio.sleep(delay)
+        waited += delay
@@ -0,0 +1,40 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(data, event=None, event_id=None):
+    """
+    Encodes data as one server-sent event
+    """
+    lines = []
+    if event_id is not None:
+        lines.append('id: %s' % event_id)
+    if event is not None:
+        lines.append('event: %s' % event)
+    lines.append('data: %s' % json.dumps(data))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def sse_comment(text=''):
+    """
+    Server-sent event comment, clients ignore it but it keeps the connection busy
+    """
+    return (': %s\n\n' % text).encode()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views answer EventSource clients
+
+    Event streams are returned as StreamingHttpResponse, the renderer only
+    renders the responses that are not, like errors, as an error event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_event(data, event='error')
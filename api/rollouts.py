@@ -0,0 +1,261 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from api.drone import FINISHED_STATUSES
+from api.jobs import enqueue_job
+from api.models import BlockChain, BlockChainBuildDeploy, DroneJob, Rollout, RolloutTarget
+
+logger = logging.getLogger(__name__)
+
+# BlockChain fields a rollout may change
+VERSION_FIELDS = ('node_version', 'nault_version', 'proxy_version', 'boompow_version')
+# BlockChain fields a rollout may select blockchains by
+SELECTOR_FIELDS = ('k8s_cluster', 'nano_network', 'organization') + VERSION_FIELDS
+
+ACTIVE_TARGET_STATUSES = (RolloutTarget.BUILDING, RolloutTarget.DEPLOYING)
+FINISHED_TARGET_STATUSES = (RolloutTarget.SUCCEEDED, RolloutTarget.FAILED, RolloutTarget.SKIPPED)
+
+
+def select_block_chains(selector):
+    """
+    BlockChains matching a rollout selector
+    A list of values selects blockchains matching any of them
+    """
+    block_chains = BlockChain.objects.all()
+    for field, value in selector.items():
+        if isinstance(value, list):
+            block_chains = block_chains.filter(**{field + '__in': value})
+        else:
+            block_chains = block_chains.filter(**{field: value})
+    return block_chains
+
+
+def create_rollout(user, selector, changes, **options):
+    """
+    Creates a running Rollout of the selected blockchains not changed yet
+    Blockchains are split into waves of wave_size in id order
+    """
+    with transaction.atomic():
+        rollout = Rollout.objects.create(created_by=user, selector=selector, changes=changes, **options)
+        block_chains = select_block_chains(selector).exclude(Q(**changes)).order_by('id') \
+            .values_list('id', 'k8s_cluster')
+        RolloutTarget.objects.bulk_create([
+            RolloutTarget(rollout=rollout, block_chain_id=block_chain_id, k8s_cluster=k8s_cluster,
+                          wave=n // rollout.wave_size)
+            for n, (block_chain_id, k8s_cluster) in enumerate(block_chains)
+        ])
+        if not rollout.targets.exists():
+            rollout.status = Rollout.COMPLETED
+            rollout.finished_at = timezone.now()
+            rollout.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return rollout
+
+
+def progress_annotation(target_status):
+    return '%s_targets' % target_status
+
+
+def with_progress(queryset):
+    """
+    Annotates rollouts with their number of targets by status, read by rollout_progress
+    """
+    return queryset.annotate(**{
+        progress_annotation(target_status): Count('targets', filter=Q(targets__status=target_status))
+        for target_status, _ in RolloutTarget.STATUSES
+    })
+
+
+def rollout_progress(rollout):
+    """
+    Number of targets by status
+    """
+    if hasattr(rollout, progress_annotation(RolloutTarget.PENDING)):
+        return {target_status: getattr(rollout, progress_annotation(target_status))
+                for target_status, _ in RolloutTarget.STATUSES}
+    counts = dict(rollout.targets.order_by().values_list('status').annotate(Count('id')))
+    return {target_status: counts.get(target_status, 0) for target_status, _ in RolloutTarget.STATUSES}
+
+
+def job_outcome(drone_job):
+    """
+    Returns whether a DroneJob of a target is done and its error, if any
+    Submitted jobs are done once drone finished them
+    """
+    if drone_job is None:
+        return True, {"detail": "Job was deleted!"}
+    if drone_job.status == DroneJob.FAILED:
+        return True, drone_job.result
+    if drone_job.status != DroneJob.SUBMITTED:
+        return False, None
+
+    job_status = drone_job.build_deploy.status
+    if job_status == 'success':
+        return True, None
+    if job_status in FINISHED_STATUSES:
+        return True, {"detail": "Drone job ended with status %s" % job_status}
+    return False, None
+
+
+def start_target(rollout, target):
+    """
+    Applies the changes of a rollout to a target blockchain and queues its build
+    """
+    with transaction.atomic():
+        block_chain = BlockChain.all_with_deleted.select_for_update().get(id=target.block_chain_id)
+        target.previous = {field: getattr(block_chain, field) for field in rollout.changes}
+        for field, value in rollout.changes.items():
+            setattr(block_chain, field, value)
+        block_chain.save(update_fields=list(rollout.changes) + ['updated_at'])
+
+        target.build_job = enqueue_job(block_chain, BlockChainBuildDeploy.BUILD, rollout.created_by, upgrade=True)
+        target.status = RolloutTarget.BUILDING
+        target.started_at = timezone.now()
+        target.save()
+
+
+def fail_target(target, error):
+    """
+    Marks a target failed
+    A blockchain whose build failed gets its previous versions back, it still runs them
+    """
+    with transaction.atomic():
+        if target.status == RolloutTarget.BUILDING and target.previous:
+            BlockChain.all_with_deleted.filter(id=target.block_chain_id).update(**target.previous)
+        target.status = RolloutTarget.FAILED
+        target.error = error
+        target.finished_at = timezone.now()
+        target.save()
+
+
+def progress_target(rollout, target):
+    """
+    Moves a building or deploying target on once its job is done
+    """
+    if target.status == RolloutTarget.BUILDING:
+        done, error = job_outcome(target.build_job)
+        if not done:
+            return
+        if error is not None:
+            fail_target(target, error)
+            return
+        target.deploy_job = enqueue_job(target.block_chain, BlockChainBuildDeploy.DEPLOY, rollout.created_by,
+                                        upgrade=True)
+        target.status = RolloutTarget.DEPLOYING
+        target.save()
+    elif target.status == RolloutTarget.DEPLOYING:
+        done, error = job_outcome(target.deploy_job)
+        if not done:
+            return
+        if error is not None:
+            fail_target(target, error)
+            return
+        target.status = RolloutTarget.SUCCEEDED
+        target.finished_at = timezone.now()
+        target.save()
+
+
+def start_targets(rollout):
+    """
+    Starts pending targets of the current wave within the cluster concurrency
+    A wave starts once all targets of the waves before it finished
+    """
+    wave = rollout.targets.exclude(status__in=FINISHED_TARGET_STATUSES).aggregate(wave=Min('wave'))['wave']
+    if wave is None:
+        return
+
+    # targets in progress of all rollouts share the clusters
+    active = dict(RolloutTarget.objects.filter(status__in=ACTIVE_TARGET_STATUSES).order_by()
+                  .values_list('k8s_cluster').annotate(Count('id')))
+    pending = rollout.targets.filter(status=RolloutTarget.PENDING, wave=wave)
+    for target in pending:
+        if active.get(target.k8s_cluster, 0) >= rollout.cluster_concurrency:
+            continue
+        start_target(rollout, target)
+        active[target.k8s_cluster] = active.get(target.k8s_cluster, 0) + 1
+
+
+def advance_rollout(rollout):
+    """
+    Moves the targets of a rollout forward
+
+    Targets in progress are followed until done whatever the rollout status,
+    new targets only start while it runs. The rollout halts once more than
+    failure_threshold of the targets finished since it started or was resumed
+    failed, judged once at least a wave of them finished.
+    """
+    targets = rollout.targets.select_related('block_chain', 'build_job__build_deploy', 'deploy_job__build_deploy') \
+        .filter(status__in=ACTIVE_TARGET_STATUSES)
+    for target in targets:
+        progress_target(rollout, target)
+
+    rollout.refresh_from_db(fields=['status', 'resumed_at'])
+    if rollout.status != Rollout.RUNNING:
+        return
+
+    # failures before the rollout was resumed are known to whoever resumed it
+    finished_targets = rollout.targets.filter(status__in=[RolloutTarget.SUCCEEDED, RolloutTarget.FAILED])
+    if rollout.resumed_at is not None:
+        finished_targets = finished_targets.filter(finished_at__gte=rollout.resumed_at)
+    finished = finished_targets.count()
+    failed = finished_targets.filter(status=RolloutTarget.FAILED).count()
+    total = rollout.targets.count()
+    if finished >= min(rollout.wave_size, total) and failed > rollout.failure_threshold * finished:
+        halt_rollout(rollout, "%s of %s finished blockchains failed" % (failed, finished))
+        return
+
+    start_targets(rollout)
+
+    if not rollout.targets.exclude(status__in=FINISHED_TARGET_STATUSES).exists():
+        Rollout.objects.filter(id=rollout.id, status=Rollout.RUNNING) \
+            .update(status=Rollout.COMPLETED, finished_at=timezone.now(), updated_at=timezone.now())
+
+
+def advance_rollouts():
+    """
+    Advances every rollout that runs or still has targets in progress
+    """
+    rollouts = Rollout.objects.filter(Q(status=Rollout.RUNNING) | Q(targets__status__in=ACTIVE_TARGET_STATUSES)) \
+        .distinct()
+    for rollout in rollouts:
+        try:
+            advance_rollout(rollout)
+        except Exception:
+            logger.exception("Advancing rollout %s failed", rollout.id)
+
+
+def halt_rollout(rollout, reason):
+    logger.warning("Halting rollout %s: %s", rollout.id, reason)
+    Rollout.objects.filter(id=rollout.id, status=Rollout.RUNNING) \
+        .update(status=Rollout.HALTED, halted_reason=reason, updated_at=timezone.now())
+
+
+def change_rollout_status(rollout, new_status):
+    """
+    Pauses, resumes or cancels a rollout
+    Returns False if the rollout can not change to the status
+
+    Cancelling skips the pending targets, targets in progress finish.
+    """
+    allowed = {
+        Rollout.PAUSED: [Rollout.RUNNING],
+        Rollout.RUNNING: [Rollout.PAUSED, Rollout.HALTED],
+        Rollout.CANCELLED: [Rollout.RUNNING, Rollout.PAUSED, Rollout.HALTED],
+    }
+    with transaction.atomic():
+        rollout = Rollout.objects.select_for_update().get(id=rollout.id)
+        if rollout.status not in allowed[new_status]:
+            return False
+
+        rollout.status = new_status
+        if new_status == Rollout.RUNNING:
+            rollout.halted_reason = ''
+            rollout.resumed_at = timezone.now()
+        if new_status == Rollout.CANCELLED:
+            rollout.finished_at = timezone.now()
+            rollout.targets.filter(status=RolloutTarget.PENDING) \
+                .update(status=RolloutTarget.SKIPPED, finished_at=rollout.finished_at)
+        rollout.save()
+    return True
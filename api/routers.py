@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+from backend.settings import env
+
+# reads of the request being handled, also seen by sync_to_async threads
+_current = contextvars.ContextVar('replica_reads', default=None)
+
+
+class ReplicaReads:
+    """
+    Replica the reads of a request go to, one per request so they see the same lag
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.pinned = None
+        self.replica = None
+
+
+def request_user(request):
+    """
+    User of a request, None until it is authenticated
+
+    The lazy user of AuthenticationMiddleware is not evaluated, that would
+    query the database from the router. Rest framework replaces it with
+    the authenticated user.
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return user
+
+
+def pin_key(user_id):
+    return 'db-primary-pin:%s' % user_id
+
+
+def pin_to_primary(user):
+    """
+    Reads of the user go to the primary for DATABASE_REPLICA_PIN_SECONDS,
+    until replicas caught up with their writes
+    """
+    cache.set(pin_key(user.id), True, env('DATABASE_REPLICA_PIN_SECONDS'))
+
+
+def is_pinned(user):
+    return cache.get(pin_key(user.id)) is not None
+
+
+@contextmanager
+def replica_reads(request):
+    """
+    Lets the reads of a request go to a replica
+    """
+    token = _current.set(ReplicaReads(request))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads of safe requests to DATABASE_REPLICAS, everything else to the primary
+
+    Reads stay on the primary within transactions, outside requests, like in
+    workers and management commands, and while the user is pinned after a write.
+    Writes and select_for_update always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        reads = _current.get()
+        if reads is None or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if reads.pinned is None:
+            user = request_user(reads.request)
+            if user is None:
+                return DEFAULT_DB_ALIAS
+            reads.pinned = user.is_authenticated and is_pinned(user)
+        if reads.pinned:
+            return DEFAULT_DB_ALIAS
+        if reads.replica is None:
+            reads.replica = random.choice(settings.DATABASE_REPLICAS)
+        return reads.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Reads of GET, HEAD and OPTIONS requests go to replicas,
+    users writing are pinned to the primary
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # mark the instance as coroutine function like MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        if request.method in SAFE_METHODS:
+            with replica_reads(request):
+                return self.get_response(request)
+        response = self.get_response(request)
+        self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        if request.method in SAFE_METHODS:
+            with replica_reads(request):
+                return await self.get_response(request)
+        response = await self.get_response(request)
+        await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        user = request_user(request)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user)
@@ -1,10 +1,14 @@
 from rest_framework_simplejwt.serializers import TokenObtainSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from django.contrib.auth.models import User
+from django.db import transaction
 
 from api.views import Profile
-from api.models import Organization, BlockChain, BlockChainBuildDeploy, DroneCIServer, Contact
+from api.models import Organization, BlockChain, BlockChainBuildDeploy, BlockChainKeys, DroneCIServer, DroneJob, \
+    Rollout, RolloutTarget, Contact
+from api.rollouts import SELECTOR_FIELDS, VERSION_FIELDS, create_rollout, rollout_progress
 
 
 class OwnerPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
@@ -27,16 +31,143 @@ class BlockChainBuildDeploySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class DroneJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for DroneJob model
+    """
+
+    class Meta:
+        model = DroneJob
+        fields = '__all__'
+
+
+class RolloutSerializer(serializers.ModelSerializer):
+    """
+    Serializer for Rollout model
+    """
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Rollout
+        fields = '__all__'
+        read_only_fields = ['status', 'halted_reason', 'resumed_at', 'created_by', 'finished_at']
+
+    def get_progress(self, obj):
+        return rollout_progress(obj)
+
+    def validate_selector(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Selector must be an object.")
+        unknown = set(value) - set(SELECTOR_FIELDS)
+        if unknown:
+            raise serializers.ValidationError("Can not select by %s." % ', '.join(sorted(unknown)))
+        return value
+
+    def validate_changes(self, value):
+        if not isinstance(value, dict) or not value:
+            raise serializers.ValidationError("Changes must be an object with at least one field.")
+        unknown = set(value) - set(VERSION_FIELDS)
+        if unknown:
+            raise serializers.ValidationError("Can not change %s." % ', '.join(sorted(unknown)))
+        for field, version in value.items():
+            if not isinstance(version, str) or not version \
+                    or len(version) > BlockChain._meta.get_field(field).max_length:
+                raise serializers.ValidationError("Invalid %s." % field)
+        return value
+
+    def validate_failure_threshold(self, value):
+        if not 0 <= value <= 1:
+            raise serializers.ValidationError("Failure threshold must be between 0 and 1.")
+        return value
+
+    def validate_wave_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Wave size must be at least 1.")
+        return value
+
+    def validate_cluster_concurrency(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Cluster concurrency must be at least 1.")
+        return value
+
+    def create(self, validated_data):
+        user = validated_data.pop('created_by')
+        return create_rollout(user, **validated_data)
+
+
+class RolloutTargetSerializer(serializers.ModelSerializer):
+    """
+    Serializer for RolloutTarget model
+    """
+
+    class Meta:
+        model = RolloutTarget
+        fields = '__all__'
+
+
+class BlockChainKeysSerializer(serializers.ModelSerializer):
+    """
+    Serializer for BlockChainKeys model
+    """
+
+    class Meta:
+        model = BlockChainKeys
+        exclude = ['block_chain']
+
+
+class BlockChainKeysMixin:
+    """
+    Adds the BlockChainKeys fields to a BlockChain serializer as if they were fields of the blockchain
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name, field in BlockChainKeysSerializer().get_fields().items():
+            field.source = 'keys.' + name
+            fields[name] = field
+        return fields
+
+    def save_keys(self, block_chain, keys):
+        # the keys of a blockchain are created with it
+        for name, value in keys.items():
+            setattr(block_chain.keys, name, value)
+        block_chain.keys.save(update_fields=list(keys))
+
+    def create(self, validated_data):
+        keys = validated_data.pop('keys', {})
+        with transaction.atomic():
+            block_chain = super().create(validated_data)
+            self.save_keys(block_chain, keys)
+        return block_chain
+
+    def update(self, instance, validated_data):
+        keys = validated_data.pop('keys', {})
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if keys:
+                self.save_keys(instance, keys)
+        return instance
+
+
 class BlockChainSerializer(serializers.ModelSerializer):
     """
     Serializer for BolockChain model
     """
     # disabled for now for simplicity
     # build_deploy = BlockChainBuildDeploySerializer(many=True, read_only=True)
+    latest_build_status = serializers.CharField(source='latest_build.status', read_only=True, allow_null=True)
+    latest_deploy_status = serializers.CharField(source='latest_deploy.status', read_only=True, allow_null=True)
+    latest_terminate_status = serializers.CharField(source='latest_terminate.status', read_only=True,
+                                                    allow_null=True)
 
     class Meta:
         model = BlockChain
         fields = '__all__'
+        read_only_fields = ['latest_build', 'latest_deploy', 'latest_terminate']
+        extra_kwargs = {
+            # abbreviations of deleted blockchains stay taken
+            'abbreviation': {'validators': [UniqueValidator(queryset=BlockChain.all_with_deleted.all())]},
+        }
 
 
 class BlockChainUserSerializer(serializers.ModelSerializer):
@@ -44,6 +175,10 @@ class BlockChainUserSerializer(serializers.ModelSerializer):
     Serializer for BolockChain model
     """
     organization = OwnerPrimaryKeyRelatedField(model=Organization)
+    latest_build_status = serializers.CharField(source='latest_build.status', read_only=True, allow_null=True)
+    latest_deploy_status = serializers.CharField(source='latest_deploy.status', read_only=True, allow_null=True)
+    latest_terminate_status = serializers.CharField(source='latest_terminate.status', read_only=True,
+                                                    allow_null=True)
 
     class Meta:
         model = BlockChain
@@ -51,10 +186,30 @@ class BlockChainUserSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'created_by': {'read_only': True},
             'organization': {'read_only': False},
-            'owner': {'read_only': True}
+            'owner': {'read_only': True},
+            'latest_build': {'read_only': True},
+            'latest_deploy': {'read_only': True},
+            'latest_terminate': {'read_only': True},
+            'deleted': {'read_only': True},
+            'deleted_at': {'read_only': True},
+            'deleted_by': {'read_only': True},
+            # abbreviations of deleted blockchains stay taken
+            'abbreviation': {'validators': [UniqueValidator(queryset=BlockChain.all_with_deleted.all())]},
         }
 
 
+class BlockChainDetailSerializer(BlockChainKeysMixin, BlockChainSerializer):
+    """
+    Serializer for BlockChain model with its keys
+    """
+
+
+class BlockChainUserDetailSerializer(BlockChainKeysMixin, BlockChainUserSerializer):
+    """
+    Serializer for BlockChain model with its keys
+    """
+
+
 class BlockChainUserUpdatePatchSerializer(serializers.ModelSerializer):
     """
     Serializer for BlockChain model with readonly fields
@@ -151,7 +306,10 @@ class OrganizationUserSerializer(serializers.ModelSerializer):
         fields = '__all__'
         extra_kwargs = {
             'created_by': {'read_only': True},
-            'owner': {'read_only': True}
+            'owner': {'read_only': True},
+            'deleted': {'read_only': True},
+            'deleted_at': {'read_only': True},
+            'deleted_by': {'read_only': True},
         }
 
 
@@ -1,12 +1,26 @@
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
-from django.db.models.signals import post_save
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from django_rest_passwordreset.signals import reset_password_token_created
 from rest_framework.reverse import reverse
 from templated_email import send_templated_mail
 
-from api.models import Profile, BlockChain
+from api.db import check_connections, touch_connections
+from api.events import publish_status
+from api.jobs import point_latest_job, repoint_latest_job
+from api.models import Profile, BlockChain, BlockChainBuildDeploy, BlockChainKeys
+
+
+@receiver(request_started)
+def check_database_connections(sender, **kwargs):
+    check_connections()
+
+
+@receiver(request_finished)
+def touch_database_connections(sender, **kwargs):
+    touch_connections()
 
 
 @receiver(post_save, sender=User)
@@ -20,6 +34,46 @@ def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
 
 
+@receiver(post_save, sender=BlockChain)
+def create_block_chain_keys(sender, instance, created, **kwargs):
+    if created:
+        BlockChainKeys.objects.get_or_create(block_chain=instance)
+
+
+@receiver(post_init, sender=BlockChain)
+@receiver(post_init, sender=BlockChainBuildDeploy)
+def remember_status(sender, instance, **kwargs):
+    # a deferred status is not loaded for it
+    instance._saved_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=BlockChain)
+@receiver(post_save, sender=BlockChainBuildDeploy)
+def publish_status_change(sender, instance, created, **kwargs):
+    """
+    Publishes a status event when a blockchain or job is created or changes status
+    """
+    if 'status' not in instance.__dict__:
+        return
+    if created or instance.status != instance._saved_status:
+        publish_status(instance)
+    instance._saved_status = instance.status
+
+
+@receiver(post_save, sender=BlockChainBuildDeploy)
+def update_latest_job(sender, instance, created, **kwargs):
+    """
+    Keeps the latest job pointers of the blockchain of a new job up to date
+    """
+    if created:
+        point_latest_job(instance)
+
+
+@receiver(post_delete, sender=BlockChainBuildDeploy)
+def update_latest_job_deleted(sender, instance, **kwargs):
+    repoint_latest_job(instance.block_chain_id, instance.type)
+
+
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token,
                                  *args, **kwargs):
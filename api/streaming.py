@@ -0,0 +1,101 @@
+import asyncio
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
+from django.http.response import HttpResponseBase
+
+
+def is_asgi(request):
+    """
+    Whether the request is served by the ASGI server, waits there do not hold a worker
+    """
+    return isinstance(request, ASGIRequest)
+
+
+class AsyncStreamingHttpResponse(HttpResponseBase):
+    """
+    Response streaming the chunks of an async iterator, like the server-sent events of a waiting view
+
+    Only StreamingASGIHandler sends it, the async iterator is closed once the
+    client disconnects.
+    """
+    streaming = True
+
+    def __init__(self, async_content, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_content = async_content
+
+    def __iter__(self):
+        raise TypeError('%s is only served by StreamingASGIHandler' % self.__class__.__name__)
+
+
+class Connection:
+    """
+    send of an ASGI connection that also waits for the client to disconnect
+    """
+
+    def __init__(self, receive, send):
+        self.receive = receive
+        self.send = send
+
+    def __call__(self, message):
+        return self.send(message)
+
+    async def disconnected(self):
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGIHandler that also sends AsyncStreamingHttpResponse
+    """
+
+    async def __call__(self, scope, receive, send):
+        await super().__call__(scope, receive, Connection(receive, send))
+
+    async def send_response(self, response, send):
+        if not isinstance(response, AsyncStreamingHttpResponse):
+            return await super().send_response(response, send)
+
+        headers = []
+        for header, value in response.items():
+            headers.append((header.encode('ascii'), value.encode('latin1')))
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        disconnected = asyncio.ensure_future(send.disconnected())
+        content = response.async_content.__aiter__()
+        chunk = None
+        try:
+            while True:
+                chunk = asyncio.ensure_future(content.__anext__())
+                await asyncio.wait([chunk, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                if not chunk.done():
+                    # nobody reads the rest
+                    break
+                try:
+                    data = chunk.result()
+                except StopAsyncIteration:
+                    await send({'type': 'http.response.body'})
+                    break
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            if chunk is not None and not chunk.done():
+                # the cancelled chunk ends the iterator
+                chunk.cancel()
+                await asyncio.wait([chunk])
+            if hasattr(content, 'aclose'):
+                await content.aclose()
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """
+    django.core.asgi.get_asgi_application serving AsyncStreamingHttpResponse too
+    """
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
@@ -1,3 +1,909 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework.test import APIClient
+
+from api import breaker, instrumentation
+from api.db import check_connections, touch_connections, warmup_connections
+from api.drone import DroneClient
+from api.drone_async import ArrayDecoder, AsyncDroneClient
+from api.drone_simulator import DroneSimulator, SimulatedBuild, parse_distribution
+from api.events import EventHub, hub
+from api.jobs import claim_jobs, latest_job, run_drone_job
+from api.logs import stream_build_logs
+from api.models import BlockChain, BlockChainBuildDeploy, DroneCIServer, DroneJob, Organization, Rollout, \
+    RolloutTarget
+from api.params import KEY_FIELDS, blockchain_params
+from api.routers import ReplicaRouter, pin_to_primary, replica_reads
+from api.streaming import StreamingASGIHandler
+
+
+class DroneSimulatorTestCase(TestCase):
+    """
+    Runs the orchestration endpoints against a DroneSimulator
+    """
+
+    def setUp(self):
+        cache.clear()
+        breaker._breakers.clear()
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.block_chain = BlockChain.objects.create(abbreviation='TST', created_by=self.user, owner=self.user)
+
+    def simulate(self, **options):
+        simulator = DroneSimulator(seed=1, **options)
+        url = simulator.start()
+        self.addCleanup(simulator.stop)
+        self.droneci_server = DroneCIServer.objects.create(id=1, name='simulator', server=url, token='test',
+                                                           rate_limit=0)
+        return simulator
+
+    def run_jobs(self):
+        jobs = claim_jobs('test', limit=10)
+        for job in jobs:
+            run_drone_job(job)
+        return jobs
+
+    def build(self):
+        response = self.client.post(reverse('blockchain_build_build', args=[self.block_chain.id]))
+        self.assertEqual(response.status_code, 202)
+        self.run_jobs()
+        return latest_job(self.block_chain, BlockChainBuildDeploy.BUILD)
+
+    def test_distributions(self):
+        simulator = DroneSimulator(seed=1)
+        self.assertEqual(parse_distribution('fixed:0.5')(simulator.random), 0.5)
+        self.assertEqual(parse_distribution(2)(simulator.random), 2)
+        self.assertTrue(0.1 <= parse_distribution('uniform:0.1,0.2')(simulator.random) <= 0.2)
+        self.assertGreater(parse_distribution('lognormal:0.1,0.5')(simulator.random), 0)
+        with self.assertRaises(ValueError):
+            parse_distribution('normal:1')
+
+    def test_build_lifecycle(self):
+        build = SimulatedBuild(1, {}, queued_for=1, duration=3, outcome='failure')
+        self.assertEqual(build.progress(build.created + 0.5)[0], 'pending')
+        self.assertEqual(build.progress(build.created + 1.5)[0], 'running')
+        self.assertEqual(build.step_progress(1, build.created + 1.5)[0], 'running')
+        self.assertEqual(build.step_progress(3, build.created + 1.5)[0], 'pending')
+        self.assertEqual(build.progress(build.created + 5)[0], 'failure')
+        self.assertEqual(build.step_progress(3, build.created + 5), ('failure', 5))
+        build.status = 'killed'
+        self.assertEqual(build.progress(build.created)[0], 'killed')
+
+    def test_build(self):
+        simulator = self.simulate()
+        build = self.build()
+
+        self.assertEqual(build.status, 'running')
+        self.assertEqual(DroneJob.objects.get().status, DroneJob.SUBMITTED)
+        created, = simulator.requests_to('POST', r'/builds$')
+        self.assertEqual(created['params']['ABBREVIATION'], 'TST')
+        self.assertEqual(created['params']['VERIGA_BUILD_DEPLOY_ID'], str(build.id))
+        self.assertEqual(simulator.builds[build.build_no].params['ABBREVIATION'], 'TST')
+
+    def test_build_goes_to_placeholder_server(self):
+        simulator = self.simulate()
+        other = DroneCIServer.objects.create(id=2, name='drone', server='http://127.0.0.1:1', token='test')
+
+        # the scheduler would pick another server by the time the build is submitted
+        with mock.patch('api.jobs.pick_server', side_effect=[self.droneci_server, other]):
+            build = self.build()
+        self.assertEqual(build.droneci_server_id, self.droneci_server.id)
+        self.assertEqual(build.status, 'running')
+        self.assertEqual(len(simulator.requests_to('POST', r'/builds$')), 1)
+
+    def succeed(self, simulator, build):
+        simulator.finish_build(build.build_no)
+        build.status = 'success'
+        build.save()
+
+    def configure(self, node_version):
+        self.block_chain.refresh_from_db()
+        self.block_chain.node_version = node_version
+        self.block_chain.save(update_fields=['node_version'])
+
+    def test_build_unchanged(self):
+        simulator = self.simulate()
+        self.succeed(simulator, self.build())
+        self.configure('v2')
+        build = self.build()
+        self.succeed(simulator, build)
+
+        response = self.client.post(reverse('blockchain_build_build', args=[self.block_chain.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['build']['id'], build.id)
+        self.assertEqual(len(simulator.requests_to('POST', r'/builds$')), 2)
+
+    def test_build_changed(self):
+        simulator = self.simulate()
+        build = self.build()
+        self.succeed(simulator, build)
+        self.configure('v2')
+
+        rebuild = self.build()
+        self.assertNotEqual(rebuild.id, build.id)
+        self.assertEqual(rebuild.status, 'running')
+        self.assertEqual(len(simulator.requests_to('POST', r'/builds$')), 2)
+
+    def test_build_changed_back(self):
+        simulator = self.simulate()
+        self.configure('v1')
+        first = self.build()
+        self.succeed(simulator, first)
+        self.configure('v2')
+        second = self.build()
+        self.succeed(simulator, second)
+        self.configure('v1')
+
+        # the build of the first configuration was replaced since
+        rebuild = self.build()
+        self.assertNotIn(rebuild.id, (first.id, second.id))
+        self.assertEqual(len(simulator.requests_to('POST', r'/builds$')), 3)
+
+    def test_build_detail(self):
+        simulator = self.simulate()
+        build = self.build()
+
+        url = reverse('blockchain_build_detail', args=[build.id])
+        lookups = len(simulator.requests_to('GET', r'/builds/\d+$'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['build_no'], build.build_no)
+        self.assertEqual(response.data['status'], 'running')
+
+        # the row is served until a webhook or ?refresh=true updates it
+        simulator.finish_build(build.build_no, 'failure')
+        cache.clear()
+        self.assertEqual(self.client.get(url).data['status'], 'running')
+        self.assertEqual(len(simulator.requests_to('GET', r'/builds/\d+$')), lookups)
+
+        response = self.client.get(url, {'refresh': 'true'})
+        self.assertEqual(response.data['status'], 'failure')
+        self.assertIsNotNone(response.data['finished_at'])
+        self.assertEqual(BlockChainBuildDeploy.objects.get(id=build.id).status, 'failure')
+
+    def test_blockchain_status(self):
+        simulator = self.simulate()
+        build = self.build()
+        simulator.finish_build(build.build_no)
+        self.client.force_login(self.user)
+        url = reverse('async_blockchain_status', args=[self.block_chain.id])
+
+        lookups = len(simulator.requests_to('GET', r'/builds/\d+$'))
+        response = self.client.get(url)
+        self.assertEqual(response.json()['build']['status'], 'running')
+        self.assertIsNone(response.json()['deploy'])
+        self.assertEqual(len(simulator.requests_to('GET', r'/builds/\d+$')), lookups)
+
+        cache.clear()
+        response = self.client.get(url, {'refresh': 'true'})
+        self.assertEqual(response.json()['build']['status'], 'success')
+        self.assertEqual(BlockChainBuildDeploy.objects.get(id=build.id).status, 'success')
+
+    def test_deploy_and_terminate(self):
+        simulator = self.simulate()
+        build = self.build()
+        simulator.finish_build(build.build_no)
+
+        response = self.client.post(reverse('blockchain_deploy_deploy', args=[self.block_chain.id]))
+        self.assertEqual(response.status_code, 202)
+        self.run_jobs()
+        deploy = BlockChainBuildDeploy.objects.get(type=BlockChainBuildDeploy.DEPLOY)
+        self.assertEqual(deploy.status, 'deploying')
+        self.assertEqual(deploy.parent_build_id, build.id)
+        promoted = simulator.builds[deploy.build_no]
+        self.assertEqual((promoted.event, promoted.deploy_to, promoted.parent), ('promote', 'live', build.build_no))
+
+        response = self.client.post(reverse('blockchain_terminate_terminate', args=[self.block_chain.id]))
+        self.assertEqual(response.status_code, 202)
+        self.run_jobs()
+        terminate = BlockChainBuildDeploy.objects.get(type=BlockChainBuildDeploy.TERMINATE)
+        self.assertEqual(terminate.status, 'terminating')
+        self.assertEqual(simulator.builds[terminate.build_no].deploy_to, 'live-terminate')
+        self.assertEqual(simulator.builds[terminate.build_no].params['VERIGA_BLOCK_CHAIN_ID'],
+                         str(self.block_chain.id))
+
+    def test_rate_limited_submission_is_retried(self):
+        simulator = self.simulate(rate_limit_rate=1.0)
+        self.client.post(reverse('blockchain_build_build', args=[self.block_chain.id]))
+        self.run_jobs()
+
+        job = DroneJob.objects.get()
+        self.assertEqual(job.status, DroneJob.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual([entry['status'] for entry in simulator.requests_to('POST', r'/builds$')], [429])
+        self.assertFalse(simulator.builds)
+
+    def test_server_error_fails_submission(self):
+        simulator = self.simulate(error_rate=1.0)
+        self.client.post(reverse('blockchain_build_build', args=[self.block_chain.id]))
+        self.run_jobs()
+
+        self.assertEqual(DroneJob.objects.get().status, DroneJob.FAILED)
+        self.assertEqual([entry['status'] for entry in simulator.requests_to('POST', r'/builds$')], [500])
+
+    def test_timeout(self):
+        simulator = self.simulate(timeout_rate=1.0, hang=1)
+        result = DroneClient(self.droneci_server).request('GET', '/api/user', timeout=(1, 0.2), retries=0)
+
+        self.assertEqual(result.error, 'TIMEOUT')
+        self.assertEqual(simulator.requests[0]['status'], None)
+
+    def test_open_breaker_takes_no_rate_limit_token(self):
+        simulator = self.simulate()
+        client = DroneClient(self.droneci_server)
+        client.breaker._open()
+
+        with mock.patch('api.drone.ratelimit.acquire') as acquire:
+            result = client.request('GET', '/api/user', retries=0)
+        self.assertEqual(result.error, 'CircuitOpen')
+        acquire.assert_not_called()
+        self.assertEqual(len(simulator.requests), 0)
+
+    async def collect_logs(self, build_no, after=None):
+        drone = AsyncDroneClient(self.droneci_server)
+        return [event async for event in stream_build_logs(drone, build_no, after)]
+
+    def test_array_decoder(self):
+        decoder = ArrayDecoder()
+        self.assertEqual(decoder.feed(' [{"pos": 0, "out": "a,]"}, {"po'), [{'pos': 0, 'out': 'a,]'}])
+        self.assertEqual(decoder.feed('s": 1}'), [{'pos': 1}])
+        self.assertEqual(decoder.feed(']'), [])
+        with self.assertRaises(ValueError):
+            ArrayDecoder().feed('null')
+
+    async def test_finished_build_logs(self):
+        simulator = await sync_to_async(self.simulate)()
+        build = simulator.add_build(status='success')
+
+        events = await self.collect_logs(build.number, after=(1, 2, 2))
+        self.assertTrue(events[0].startswith(b'retry:'))
+        lines = [event.split(b'\n')[0] for event in events if event.startswith(b'id:')]
+        self.assertEqual(lines, [b'id: 1.2.3', b'id: 1.2.4'] + [b'id: 1.3.%d' % pos for pos in range(5)])
+        self.assertIn(b'event: end', events[-1])
+
+    def test_log_stream_needs_asgi(self):
+        self.simulate()
+        build = self.build()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('blockchain_build_deploy_logs', args=[build.id]))
+        self.assertEqual(response.status_code, 406)
+
+    async def test_log_stream_deadline(self):
+        simulator = await sync_to_async(self.simulate)()
+        build = simulator.add_build(status='running')
+
+        started = time.monotonic()
+        with mock.patch.dict(os.environ, {'DRONE_LOG_STREAM_TIMEOUT': '1'}):
+            events = await self.collect_logs(build.number)
+        # the stream of the quiet running step is not read until DRONE_LOG_READ_TIMEOUT
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertNotIn(b'event: end', events[-1])
+
+    def test_latency_and_recording(self):
+        simulator = self.simulate(latency='fixed:0.05')
+        build = simulator.add_build(status='running')
+        client = DroneClient(self.droneci_server)
+
+        self.assertEqual(client.build(build.number).get('status'), 'running')
+        self.assertEqual(client.build(build.number + 1).status_code, 404)
+        entries = list(simulator.requests)
+        self.assertEqual([(entry['method'], entry['status']) for entry in entries], [('GET', 200), ('GET', 404)])
+        self.assertTrue(all(entry['latency'] >= 0.05 for entry in entries))
+
+
+class LatestJobTestCase(TestCase):
+    """
+    Latest job pointers of blockchains
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        DroneCIServer.objects.create(id=1, name='drone', server='http://127.0.0.1:1', token='test')
+        self.block_chain = BlockChain.objects.create(abbreviation='TST', created_by=self.user, owner=self.user)
+
+    def job(self, job_type=BlockChainBuildDeploy.BUILD):
+        return BlockChainBuildDeploy.objects.create(block_chain=self.block_chain, build_id=0, build_no=0,
+                                                    created_by=self.user, owner=self.user, type=job_type)
+
+    def test_pointers(self):
+        first = self.job()
+        build = self.job()
+        deploy = self.job(BlockChainBuildDeploy.DEPLOY)
+        # an outdated instance does not move the pointers back
+        self.block_chain.name = 'Test'
+        self.block_chain.save()
+
+        self.block_chain.refresh_from_db()
+        self.assertEqual(self.block_chain.latest_build_id, build.id)
+        self.assertEqual(self.block_chain.latest_deploy_id, deploy.id)
+        self.assertIsNone(self.block_chain.latest_terminate_id)
+        self.assertEqual(latest_job(self.block_chain, BlockChainBuildDeploy.BUILD), build)
+
+        build.delete()
+        self.block_chain.refresh_from_db()
+        self.assertEqual(self.block_chain.latest_build_id, first.id)
+        self.assertEqual(self.block_chain.name, 'Test')
+
+    def test_list_latest_status(self):
+        self.job().delete()
+        deploy = self.job(BlockChainBuildDeploy.DEPLOY)
+        deploy.status = 'deploying'
+        deploy.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.assertNumQueries(1):
+            response = client.get(reverse('blockchain_list'))
+        self.assertEqual(response.data['results'][0]['latest_build_status'], None)
+        self.assertEqual(response.data['results'][0]['latest_deploy_status'], 'deploying')
+
+
+class KeysetPaginationTestCase(TestCase):
+    """
+    Cursor pagination of the job lists
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        DroneCIServer.objects.create(id=1, name='drone', server='http://127.0.0.1:1', token='test')
+        self.block_chain = BlockChain.objects.create(abbreviation='TST', created_by=self.user, owner=self.user)
+        self.jobs = [BlockChainBuildDeploy.objects.create(block_chain=self.block_chain, build_id=n, build_no=n,
+                                                          created_by=self.user, owner=self.user).id
+                     for n in range(5)]
+        # jobs created at the same time are ordered by id
+        self.created_at = timezone.now() - timedelta(hours=1)
+        BlockChainBuildDeploy.objects.filter(id__in=self.jobs[:3]).update(created_at=self.created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def test_pages(self):
+        url = reverse('blockchain_build_list', args=[self.block_chain.id])
+        pages = []
+        response = self.client.get(url, {'page_size': 2})
+        while True:
+            pages.append(self.ids(response))
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(pages, [self.jobs[:2], self.jobs[2:4], self.jobs[4:]])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), self.jobs[2:4])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), self.jobs[:2])
+        self.assertIsNone(response.data['previous'])
+
+    def test_since(self):
+        since = (self.created_at + timedelta(minutes=1)).isoformat().replace('+00:00', 'Z')
+        response = self.client.get(reverse('blockchain_build'), {'since': since})
+        self.assertEqual(self.ids(response), self.jobs[3:])
+        self.assertEqual(self.client.get(reverse('blockchain_build'), {'since': 'yesterday'}).status_code, 400)
+
+    def test_page_size_limit(self):
+        response = self.client.get(reverse('blockchain_build_deploy'), {'page_size': 3})
+        self.assertEqual(self.ids(response), self.jobs[:3])
+        with mock.patch.dict(os.environ, API_MAX_PAGE_SIZE='2'):
+            response = self.client.get(reverse('blockchain_build_deploy'), {'page_size': 3})
+        self.assertEqual(self.ids(response), self.jobs[:2])
+        self.assertEqual(self.client.get(reverse('blockchain_build'), {'cursor': 'x'}).status_code, 404)
+
+
+class ExportTestCase(TestCase):
+    """
+    Streaming exports
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        for n in range(3):
+            BlockChain.objects.create(abbreviation='T%d' % n, name='Chain %d' % n, created_by=self.user,
+                                      owner=self.user, binary_public=n == 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse('export_detail', args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('blockchains').splitlines()]
+
+        self.assertEqual([row['abbreviation'] for row in rows], ['T0', 'T1', 'T2'])
+        self.assertFalse([name for name in rows[0] if 'private_key' in name])
+        self.assertEqual(rows[0]['created_by'], self.user.id)
+
+    def test_csv_fields_and_filters(self):
+        content = self.export('blockchains', output='csv', fields='abbreviation,name', binary_public='True')
+        self.assertEqual(content.splitlines(), ['abbreviation,name', 'T1,Chain 1'])
+
+    def test_keyset_batches(self):
+        # one query per batch of two and one for the empty batch after the last full one
+        with mock.patch.dict(os.environ, EXPORT_CHUNK_SIZE='2'), self.assertNumQueries(2):
+            content = self.export('blockchains', output='csv', fields='abbreviation')
+        self.assertEqual(content.splitlines(), ['abbreviation', 'T0', 'T1', 'T2'])
+
+        BlockChain.objects.create(abbreviation='T3', created_by=self.user, owner=self.user)
+        with mock.patch.dict(os.environ, EXPORT_CHUNK_SIZE='2'), self.assertNumQueries(3):
+            self.assertEqual(len(self.export('blockchains').splitlines()), 4)
+
+    def test_invalid(self):
+        url = reverse('export_detail', args=['blockchains'])
+        self.assertEqual(self.client.get(url, {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_detail', args=['users'])).status_code, 404)
+
+
+class BlockChainKeysTestCase(TestCase):
+    """
+    Keys of blockchains in their own table
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_flattened_keys(self):
+        data = {name: 'k' for name in KEY_FIELDS}
+        data.update(abbreviation='TST', node_version='V23.0', created_by=self.user.id, genesis_dev_private_key='dev')
+        response = self.client.post(reverse('blockchain_list'), data)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['genesis_dev_private_key'], 'dev')
+        block_chain = BlockChain.objects.get()
+        self.assertEqual(block_chain.keys.genesis_dev_private_key, 'dev')
+
+        response = self.client.patch(reverse('blockchain_detail', args=[block_chain.id]),
+                                     {'genesis_dev_private_key': 'changed', 'name': 'Test'})
+        self.assertEqual(response.status_code, 200, response.data)
+        block_chain.refresh_from_db()
+        self.assertEqual((block_chain.name, block_chain.keys.genesis_dev_private_key), ('Test', 'changed'))
+        self.assertEqual(dict(blockchain_params(block_chain))['GENESIS_DEV_PRIVATE_KEY'], 'changed')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('blockchain_list'))
+        self.assertNotIn('genesis_dev_private_key', response.data['results'][0])
+
+
+class SparseFieldsTestCase(TestCase):
+    """
+    ?fields= and ?exclude= on model viewsets
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@veriga.net', email='user@veriga.net', password='user')
+        DroneCIServer.objects.create(id=1, name='drone', server='http://127.0.0.1:1', token='test')
+        self.block_chain = BlockChain.objects.create(abbreviation='TST', node_version='V23.0', name='Test',
+                                                     description='long description', created_by=self.user,
+                                                     owner=self.user)
+        BlockChainBuildDeploy.objects.create(block_chain=self.block_chain, build_id=1, build_no=1,
+                                             type=BlockChainBuildDeploy.BUILD, status='success',
+                                             created_by=self.user, owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user_blockchain_list'), {'fields': 'id,name,latest_build_status'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['results'], [{'id': self.block_chain.id, 'name': 'Test',
+                                                     'latest_build_status': 'success'}])
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('description', sql)
+        self.assertIn('api_blockchainbuilddeploy', sql)
+        self.assertNotIn('latest_deploy', sql)
+
+    def test_exclude(self):
+        url = reverse('user_blockchain_detail', args=[self.block_chain.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'exclude': 'description,genesis_dev_private_key'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('genesis_dev_private_key', response.data)
+        self.assertEqual(response.data['name'], 'Test')
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('user_blockchain_list'), {'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', str(response.data['fields']))
+
+    def test_writes_are_not_trimmed(self):
+        response = self.client.patch(reverse('user_blockchain_detail', args=[self.block_chain.id]) + '?fields=id',
+                                     {'description': 'short'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.block_chain.refresh_from_db()
+        self.assertEqual(self.block_chain.description, 'short')
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Number of queries of list and detail endpoints, independent of the number of rows
+    """
+    # url name, whether it takes the id of a blockchain, organization, rollout, ... and its query budget
+    ENDPOINTS = [
+        ('blockchain_list', None, 1),
+        ('blockchain_detail', 'block_chain', 1),
+        ('blockchain_build', None, 1),
+        ('blockchain_build_list', 'block_chain', 1),
+        ('blockchain_deploy', None, 1),
+        ('blockchain_deploy_list', 'block_chain', 1),
+        ('blockchain_terminate', None, 1),
+        ('blockchain_terminate_list', 'block_chain', 1),
+        ('blockchain_build_deploy', None, 1),
+        ('blockchain_build_deploy_detail', 'build_deploy', 1),
+        ('droneciserver_list', None, 1),
+        ('droneciserver_detail', 'droneci_server', 1),
+        ('drone_job_list', None, 1),
+        ('drone_job_detail', 'drone_job', 1),
+        ('rollout_list', None, 1),
+        ('rollout_detail', 'rollout', 2),
+        ('rollout_target_list', 'rollout', 2),
+        ('organization_list', None, 1),
+        ('organization_detail', 'organization', 1),
+        ('user_list', None, 3),
+        ('user_detail', 'user', 3),
+        ('user_profile', None, 1),
+        ('user_profile_detail', 'profile', 1),
+        ('user_blockchain_list', None, 1),
+        ('user_blockchain_detail', 'block_chain', 1),
+        ('user_organization_list', None, 1),
+        ('user_organization_detail', 'organization', 1),
+        ('user_user_detail', None, 1),
+        ('user_user_profile_detail', None, 1),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        self.droneci_server = DroneCIServer.objects.create(id=1, name='drone', server='http://127.0.0.1:1',
+                                                           token='test')
+        self.rows = 0
+        self.add_rows(1)
+        self.client = APIClient()
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            user = User.objects.create_user(username='user%s@veriga.net' % self.rows, password='user')
+            self.profile = user.profile
+            self.organization = Organization.objects.create(name='Org', created_by=user, owner=self.user)
+            self.block_chain = BlockChain.objects.create(abbreviation='T%s' % self.rows, created_by=user,
+                                                         owner=self.user, organization=self.organization)
+            for job_type, _ in BlockChainBuildDeploy.TYPES:
+                self.build_deploy = BlockChainBuildDeploy.objects.create(
+                    block_chain=self.block_chain, build_id=self.rows, build_no=self.rows, type=job_type,
+                    status='success', owner=user, created_by=user)
+            self.drone_job = DroneJob.objects.create(block_chain=self.block_chain, type=BlockChainBuildDeploy.BUILD,
+                                                     build_deploy=self.build_deploy, run_after=timezone.now(),
+                                                     created_by=user)
+            self.rollout = Rollout.objects.create(changes={'node_version': 'V23.1'}, created_by=user)
+            RolloutTarget.objects.create(rollout=self.rollout, block_chain=self.block_chain, k8s_cluster='k8s0',
+                                         wave=0, build_job=self.drone_job)
+
+    def request(self, name, arg):
+        args = [getattr(self, arg).id] if arg else []
+        # a fresh user, as authentication loads it per request
+        self.client.force_authenticate(User.objects.get(id=self.user.id))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200, (name, response.data))
+        return len(queries)
+
+    def test_budgets(self):
+        for name, arg, budget in self.ENDPOINTS:
+            with self.subTest(name):
+                self.assertEqual(self.request(name, arg), budget)
+        self.add_rows(5)
+        for name, arg, budget in self.ENDPOINTS:
+            with self.subTest(name, rows=self.rows):
+                self.assertEqual(self.request(name, arg), budget)
+
+
+class RequestStatsTestCase(TestCase):
+    """
+    Per endpoint request instrumentation
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                  password='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        instrumentation.reset_stats()
+
+    def test_stats(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('user_list')).status_code, 200)
+
+        def geo_location(url):
+            time.sleep(0.05)
+            return mock.Mock(json=mock.Mock(return_value={'country': 'NL'}))
+
+        with mock.patch('api.views.requests.get', side_effect=geo_location):
+            self.assertEqual(self.client.get(reverse('user_geo_location')).status_code, 200)
+
+        response = self.client.get(reverse('request_stats'))
+        self.assertEqual(response.status_code, 200)
+        endpoints = response.data['endpoints']
+        self.assertEqual(endpoints['user_list']['count'], 2)
+        self.assertGreaterEqual(endpoints['user_list']['queries']['p50'], 1)
+        self.assertGreaterEqual(endpoints['user_list']['wall']['max'], endpoints['user_list']['db']['max'])
+        self.assertGreaterEqual(endpoints['user_geo_location']['geo']['max'], 0.05)
+        self.assertEqual(endpoints['user_geo_location']['drone']['max'], 0)
+
+        self.assertEqual(self.client.delete(reverse('request_stats')).status_code, 204)
+        self.assertNotIn('user_list', self.client.get(reverse('request_stats')).data['endpoints'])
+
+    def test_duplicates(self):
+        metrics = instrumentation.RequestMetrics()
+        for sql in ('SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 1'):
+            metrics.record_query(sql, 0.001)
+        self.assertEqual((metrics.queries, metrics.duplicates), (4, 2))
+        self.assertEqual(instrumentation.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(instrumentation.percentile([1, 2, 3, 4], 99), 4)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+class ReplicaRouterTestCase(SimpleTestCase):
+    """
+    Reads of safe requests on replicas, read-your-writes after a write
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.user = User(id=1, username='user@veriga.net')
+
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_reads(self):
+        self.assertEqual(self.router.db_for_read(BlockChain), 'default')
+        with replica_reads(self.request(self.user)):
+            replica = self.router.db_for_read(BlockChain)
+            self.assertIn(replica, ['replica_0', 'replica_1'])
+            # one replica per request
+            self.assertEqual({self.router.db_for_read(BlockChain) for _ in range(10)}, {replica})
+            self.assertEqual(BlockChain.objects.select_for_update().db, 'default')
+            self.assertEqual(self.router.db_for_write(BlockChain), 'default')
+
+    def test_unauthenticated_user_is_not_resolved(self):
+        def get_user():
+            raise AssertionError('user resolved by the router')
+
+        with replica_reads(self.request(SimpleLazyObject(get_user))):
+            self.assertEqual(self.router.db_for_read(BlockChain), 'default')
+
+    def test_pinned_after_write(self):
+        pin_to_primary(self.user)
+        with replica_reads(self.request(self.user)):
+            self.assertEqual(self.router.db_for_read(BlockChain), 'default')
+        with replica_reads(self.request(User(id=2))):
+            self.assertNotEqual(self.router.db_for_read(BlockChain), 'default')
+
+    def test_migrations(self):
+        self.assertIs(self.router.allow_migrate('replica_0', 'api'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'api'))
+
+
+class DatabaseConnectionTestCase(SimpleTestCase):
+    """
+    Health checks and warmup of persistent connections
+    """
+
+    def connection(self, usable=True, connected=True):
+        return mock.Mock(connection=object() if connected else None, in_atomic_block=False, used_at=None,
+                         is_usable=mock.Mock(return_value=usable))
+
+    def test_health_check(self):
+        usable, dropped, closed = self.connection(), self.connection(usable=False), self.connection(connected=False)
+        with mock.patch('api.db.connections') as connections:
+            connections.all.return_value = [usable, dropped, closed]
+            check_connections()
+            with mock.patch.dict(os.environ, {'DATABASE_HEALTH_CHECKS': 'off'}):
+                check_connections()
+        usable.close.assert_not_called()
+        dropped.close.assert_called_once_with()
+        closed.is_usable.assert_not_called()
+        self.assertEqual(usable.is_usable.call_count, 1)
+
+    def test_idle_health_check(self):
+        connection = self.connection()
+        with mock.patch('api.db.connections') as connections:
+            connections.all.return_value = [connection]
+            touch_connections()
+            check_connections()
+            connection.is_usable.assert_not_called()
+            with mock.patch.dict(os.environ, {'DATABASE_HEALTH_CHECK_IDLE': '0'}):
+                check_connections()
+        connection.is_usable.assert_called_once_with()
+
+    def test_warmup(self):
+        connection = self.connection(connected=False)
+        with mock.patch('api.db.connections') as connections:
+            connections.all.return_value = [connection]
+            with mock.patch.dict(os.environ, {'DATABASE_CONN_MAX_AGE': '0'}):
+                warmup_connections()
+            connection.ensure_connection.assert_not_called()
+            warmup_connections()
+        connection.ensure_connection.assert_called_once_with()
+
+
+class SoftDeleteTestCase(TestCase):
+    """
+    Soft deleted blockchains and organizations
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin@veriga.net', email='admin@veriga.net',
+                                                   password='admin')
+        self.user = User.objects.create_user(username='user@veriga.net', email='user@veriga.net', password='user')
+        self.organization = Organization.objects.create(name='Org', created_by=self.user, owner=self.user)
+        self.block_chain = BlockChain.objects.create(abbreviation='TST', node_version='V23.0', created_by=self.user,
+                                                     owner=self.user, organization=self.organization)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_destroy(self):
+        response = self.client.delete(reverse('user_blockchain_detail', args=[self.block_chain.id]))
+        self.assertEqual(response.status_code, 204)
+        block_chain = BlockChain.all_with_deleted.get(id=self.block_chain.id)
+        self.assertTrue(block_chain.deleted)
+        self.assertEqual(block_chain.deleted_by, self.user)
+        self.assertIsNotNone(block_chain.deleted_at)
+        self.assertFalse(BlockChain.objects.exists())
+
+        self.assertEqual(self.client.get(reverse('user_blockchain_list')).data['results'], [])
+        self.assertEqual(self.client.get(reverse('user_blockchain_detail', args=[block_chain.id])).status_code, 404)
+        # abbreviations of deleted blockchains stay taken
+        response = self.client.post(reverse('user_blockchain_list'), {'abbreviation': 'TST', 'node_version': 'V23.0'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('abbreviation', response.data)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse('blockchain_list')).data['results'], [])
+        response = self.client.get(reverse('blockchain_list'), {'with_deleted': 'true'})
+        self.assertEqual([row['id'] for row in response.data['results']], [block_chain.id])
+
+    def test_admin_destroy_organization(self):
+        self.assertIsNone(self.organization.deleted_at)
+        self.client.force_authenticate(self.admin)
+        response = self.client.delete(reverse('organization_detail', args=[self.organization.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Organization.all_with_deleted.get().deleted_by, self.admin)
+        self.assertEqual(self.client.get(reverse('organization_detail', args=[self.organization.id])).status_code,
+                         404)
+        response = self.client.get(reverse('organization_detail', args=[self.organization.id]),
+                                   {'with_deleted': 'true'})
+        self.assertTrue(response.data['deleted'])
+        # relations still reach deleted rows
+        self.assertEqual(BlockChain.objects.get().organization, Organization.all_with_deleted.get())
+
+
+class EventHubTestCase(SimpleTestCase):
+    """
+    Cursors of status events published with postgres are the same in every process
+    """
+
+    def match(self, event):
+        return True
+
+    def test_published_cursors(self):
+        hub = EventHub(3)
+        hub.reset(10)
+        hub.push({'id': 1, 'cursor': 11})
+        hub.push({'id': 2, 'cursor': 13})
+        hub.push({'id': 2, 'cursor': 13})
+
+        events, cursor = hub.wait(10, self.match, 0)
+        self.assertEqual([event['cursor'] for event in events], [11, 13])
+        self.assertEqual(cursor, 13)
+        # a cursor another process already handed out
+        self.assertEqual(hub.wait(14, self.match, 0), ([], 14))
+        # events before the listener listened are unknown
+        self.assertEqual(hub.wait(9, self.match, 0), ([], None))
+
+    def test_dropped_events(self):
+        hub = EventHub(2)
+        for cursor in (1, 2, 3):
+            hub.push({'cursor': cursor})
+        self.assertEqual(hub.wait(0, self.match, 0), ([], None))
+        self.assertEqual([event['cursor'] for event in hub.wait(1, self.match, 0)[0]], [2, 3])
+
+    def test_process_cursors(self):
+        hub = EventHub(10)
+        hub.push({'id': 1})
+        hub.push({'id': 2})
+        self.assertEqual([event['cursor'] for event in hub.events], [1, 2])
+        hub.reset()
+        self.assertEqual(hub.wait(1, self.match, 0), ([], None))
+
+
+class EventViewTestCase(TestCase):
+    """
+    Status events are waited for by the async endpoints under ASGI only
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@veriga.net', email='user@veriga.net', password='user')
+        self.client.force_login(self.user)
+        # like the test client, the handler called directly must not close the connection of the test
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    def push_later(self, delay, owner):
+        asyncio.get_running_loop().call_later(delay, hub.push, {'type': 'blockchain', 'id': 1, 'owner': owner})
+
+    def test_sync_answers_at_once(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', email='admin@veriga.net',
+                                                              password='admin'))
+        started = time.monotonic()
+        response = self.client.get(reverse('event_list'), {'cursor': hub.cursor(), 'wait': 5})
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.data['events'], [])
+        self.assertEqual(response.data['cursor'], hub.cursor())
+
+    async def test_async_wait(self):
+        client = AsyncClient()
+        client.cookies = self.client.cookies
+        cursor = hub.cursor()
+        self.push_later(0.05, None)
+        self.push_later(0.1, self.user.id)
+
+        response = await client.get(reverse('async_user_event_list'), {'cursor': cursor, 'wait': 5})
+        data = json.loads(response.content)
+        self.assertEqual([event['owner'] for event in data['events']], [self.user.id])
+        self.assertEqual(data['cursor'], cursor + 2)
+
+    async def test_async_stream(self):
+        handler = StreamingASGIHandler()
+        messages = asyncio.Queue()
+        sent = []
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': reverse('async_user_event_list'),
+            'query_string': ('cursor=%s' % hub.cursor()).encode(),
+            'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream'),
+                        (b'cookie', self.client.cookies.output(header='', sep=';').strip().encode())],
+        }
+        await messages.put({'type': 'http.request'})
+
+        async def send(message):
+            sent.append(message)
+            if message.get('body', b'').startswith(b'id:'):
+                await messages.put({'type': 'http.disconnect'})
+
+        self.push_later(0.05, self.user.id)
+        await asyncio.wait_for(handler(scope, messages.get, send), 5)
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'event: status', sent[1]['body'])
+        self.assertEqual(len(sent), 2)
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework_simplejwt import views as jwt_views
 from django_rest_passwordreset import views as drp_views
-from api import views
+from api import views, async_views
+from api.models import BlockChainBuildDeploy
 
 #
 # admin
@@ -26,6 +27,12 @@ blockchain_build_deploy_detail = views.BlockChainBuildDeployViewSet.as_view({
     'patch': 'partial_update',
     'delete': 'destroy',
 })
+export_detail = views.ExportViewSet.as_view({
+    'get': 'retrieve',
+})
+event_list = views.EventViewSet.as_view({
+    'get': 'list',
+})
 # build
 blockchain_build = views.BlockChainBuildViewSet.as_view({
     'get': 'list',
@@ -98,6 +105,38 @@ droneciserver_list = views.DroneCIServerViewSet.as_view({
     'get': 'list',
     'post': 'create'
 })
+drone_job_list = views.DroneJobViewSet.as_view({
+    'get': 'list',
+})
+drone_job_detail = views.DroneJobViewSet.as_view({
+    'get': 'retrieve',
+})
+rollout_list = views.RolloutViewSet.as_view({
+    'get': 'list',
+    'post': 'create',
+})
+rollout_detail = views.RolloutViewSet.as_view({
+    'get': 'retrieve',
+})
+rollout_target_list = views.RolloutViewSet.as_view({
+    'get': 'rollout_target_list',
+})
+rollout_pause = views.RolloutViewSet.as_view({
+    'post': 'pause',
+})
+rollout_resume = views.RolloutViewSet.as_view({
+    'post': 'resume',
+})
+rollout_cancel = views.RolloutViewSet.as_view({
+    'post': 'cancel',
+})
+droneciserver_breakers = views.DroneCIServerBreakerViewSet.as_view({
+    'get': 'list',
+})
+request_stats = views.RequestStatsViewSet.as_view({
+    'get': 'list',
+    'delete': 'destroy',
+})
 droneciserver_detail = views.DroneCIServerViewSet.as_view({
     'get': 'retrieve',
     'put': 'update',
@@ -159,6 +198,9 @@ user_user_profile_detail = views.UserProfileViewSet.as_view({
     'patch': 'partial_update',
     'delete': 'destroy',
 })
+user_event_list = views.EventUserViewSet.as_view({
+    'get': 'list',
+})
 user_geo_location = views.GeoLocationUserViewSet.as_view({
     'get': 'retrieve',
 })
@@ -184,6 +226,8 @@ urlpatterns = [
     path('admin/blockchains/builds/detail/<int:pk>', blockchain_build_detail, name='blockchain_build_detail'),
     path('admin/blockchains/builds-deploys/', blockchain_build_deploy, name='blockchain_build_deploy'),
     path('admin/blockchains/builds-deploys/<int:pk>', blockchain_build_deploy_detail, name='blockchain_build_deploy_detail'),
+    path('admin/blockchains/builds-deploys/logs/<int:pk>', async_views.build_deploy_logs,
+         name='blockchain_build_deploy_logs'),
     path('admin/blockchains/deploys/', blockchain_deploy, name='blockchain_deploy'),
     path('admin/blockchains/deploys/<int:pk>', blockchain_deploy_list, name='blockchain_deploy_list'),
     path('admin/blockchains/deploys/deploy/<int:pk>', blockchain_deploy_deploy, name='blockchain_deploy_deploy'),
@@ -194,8 +238,20 @@ urlpatterns = [
     path('admin/blockchains/terminations/terminate/<int:pk>', blockchain_terminate_terminate, name='blockchain_terminate_terminate'),
     path('admin/droneciservers/', droneciserver_list, name='droneciserver_list'),
     path('admin/droneciservers/<int:pk>', droneciserver_detail, name='droneciserver_detail'),
+    path('admin/droneciservers/breakers/', droneciserver_breakers, name='droneciserver_breakers'),
+    path('admin/events/', event_list, name='event_list'),
+    path('admin/exports/<str:name>', export_detail, name='export_detail'),
+    path('admin/jobs/', drone_job_list, name='drone_job_list'),
+    path('admin/jobs/<int:pk>', drone_job_detail, name='drone_job_detail'),
+    path('admin/rollouts/', rollout_list, name='rollout_list'),
+    path('admin/rollouts/<int:pk>', rollout_detail, name='rollout_detail'),
+    path('admin/rollouts/<int:pk>/targets', rollout_target_list, name='rollout_target_list'),
+    path('admin/rollouts/<int:pk>/pause', rollout_pause, name='rollout_pause'),
+    path('admin/rollouts/<int:pk>/resume', rollout_resume, name='rollout_resume'),
+    path('admin/rollouts/<int:pk>/cancel', rollout_cancel, name='rollout_cancel'),
     path('admin/organizations/', organization_list, name='organization_list'),
     path('admin/organizations/<int:pk>', organization_detail, name='organization_detail'),
+    path('admin/stats/', request_stats, name='request_stats'),
     path('admin/users/', user_list, name='user_list'),
     path('admin/users/<int:pk>/', user_detail, name='user_detail'),
     path('admin/users/password-reset/', user_password_reset, name='user_password_reset'),
@@ -206,6 +262,7 @@ urlpatterns = [
     # user
     path('user/blockchains/', user_blockchain_list, name='user_blockchain_list'),
     path('user/blockchains/<int:pk>', user_blockchain_detail, name='user_blockchain_detail'),
+    path('user/events/', user_event_list, name='user_event_list'),
     path('user/geolocation/', user_geo_location, name='user_geo_location'),
     path('user/email/verify/', email_verify, name='email_verify'),
     path('user/email/verify-send/', email_verify_send, name='email_verify_send'),
@@ -219,5 +276,23 @@ urlpatterns = [
     path('token/', views.EmailTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', jwt_views.TokenRefreshView.as_view(), name='token_refresh'),
     path('token/verify/', jwt_views.TokenVerifyView.as_view(), name='token_verify'),
+    path('webhooks/drone/', views.DroneWebhookView.as_view(), name='drone_webhook'),
+    # async, served without holding a worker thread when running under ASGI
+    path('async/admin/blockchains/status/<int:pk>', async_views.blockchain_status,
+         name='async_blockchain_status'),
+    path('async/admin/blockchains/builds/build/<int:pk>', async_views.build_deploy_create,
+         {'job_type': BlockChainBuildDeploy.BUILD}, name='async_blockchain_build_build'),
+    path('async/admin/blockchains/builds/detail/<int:pk>', async_views.build_deploy_detail,
+         {'job_type': BlockChainBuildDeploy.BUILD}, name='async_blockchain_build_detail'),
+    path('async/admin/blockchains/deploys/deploy/<int:pk>', async_views.build_deploy_create,
+         {'job_type': BlockChainBuildDeploy.DEPLOY}, name='async_blockchain_deploy_deploy'),
+    path('async/admin/blockchains/deploys/detail/<int:pk>', async_views.build_deploy_detail,
+         {'job_type': BlockChainBuildDeploy.DEPLOY}, name='async_blockchain_deploy_detail'),
+    path('async/admin/blockchains/terminations/terminate/<int:pk>', async_views.build_deploy_create,
+         {'job_type': BlockChainBuildDeploy.TERMINATE}, name='async_blockchain_terminate_terminate'),
+    path('async/admin/blockchains/terminations/detail/<int:pk>', async_views.build_deploy_detail,
+         {'job_type': BlockChainBuildDeploy.TERMINATE}, name='async_blockchain_terminate_detail'),
+    path('async/admin/events/', async_views.event_list, name='async_event_list'),
+    path('async/user/events/', async_views.event_list, {'owned': True}, name='async_user_event_list'),
 ]
 
@@ -1,9 +1,11 @@
 import logging
+import os
 import jwt
 import requests
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
@@ -16,17 +18,79 @@ from rest_framework import viewsets, status, views
 from templated_email import send_templated_mail
 
 from api.permissions import IsOwner, IsUserOwner
-from api.models import Profile, Organization, BlockChain, BlockChainBuildDeploy, DroneCIServer, Contact
+from api.models import Profile, Organization, BlockChain, BlockChainBuildDeploy, DroneCIServer, DroneJob, Rollout, \
+    Contact, LATEST_JOB_FIELDS
 from api.serializers import CustomTokenObtainPairSerializer, UserSerializer, \
     RegisterSerializer, RegisterUserSerializer, ProfileSerializer, \
-    OrganizationSerializer, BlockChainSerializer, UserUserSerializer, \
-    UserProfileSerializer, BlockChainUserSerializer, OrganizationUserSerializer, \
-    BlockChainUserUpdatePatchSerializer, BlockChainBuildDeploySerializer, DroneCIServerSerializer, ContactSerializer
-from api.utils import request_to_drone_ci
+    OrganizationSerializer, BlockChainSerializer, BlockChainDetailSerializer, UserUserSerializer, \
+    UserProfileSerializer, BlockChainUserSerializer, BlockChainUserDetailSerializer, OrganizationUserSerializer, \
+    BlockChainUserUpdatePatchSerializer, BlockChainBuildDeploySerializer, DroneCIServerSerializer, ContactSerializer, \
+    DroneJobSerializer, RolloutSerializer, RolloutTargetSerializer
+from api.breaker import get_breaker
+from api.drone import DroneClient, verify_webhook_signature
+from api.drone_cache import cached_build, remember_build
+from api.events import hub, parse_cursor, start_listener
+from api.exports import CONTENT_TYPES, EXPORTS, NDJSON, ExportError, filter_queryset, select_fields, \
+    stream_export
+from api.fieldsets import SparseFieldsMixin
+from api.idempotency import idempotent
+from api.instrumentation import get_stats as get_request_stats, outbound, reset_stats as reset_request_stats
+from api.jobs import enqueue_job, queue_depths, same_config_build, save_drone_build
+from api.pagination import paginated_response
+from api.ratelimit import get_stats as get_rate_limit_stats
+from api.rollouts import change_rollout_status, with_progress
 from backend.settings import env
 
 logger = logging.getLogger(__name__)
 
+# query parameter values that switch an option on
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def with_deleted(request):
+    """
+    Whether an admin asked for soft deleted rows too with ?with_deleted=true
+    """
+    return request.query_params.get('with_deleted', '').lower() in TRUE_VALUES
+
+
+def soft_delete(instance, user):
+    type(instance).objects.filter(id=instance.id).soft_delete(user)
+
+
+def drone_error_response(result):
+    """
+    Response for a failed Drone CI api call
+    """
+    return Response(result.as_dict(), status=result.http_status)
+
+
+def build_deploy_response(request, build_deploy):
+    """
+    Response with a BlockChainBuildDeploy object, kept up to date by drone webhooks and the reconciler
+    ?refresh=true fetches its status from drone first
+    """
+    if build_deploy.build_no and request.query_params.get('refresh', '').lower() in TRUE_VALUES:
+        droneci_server = get_object_or_404(DroneCIServer, id=build_deploy.droneci_server_id)
+        response = cached_build(DroneClient(droneci_server), build_deploy.build_no)
+        if not response.ok:
+            return drone_error_response(response)
+        build_deploy = save_drone_build(build_deploy.id, response.data) or build_deploy
+
+    return Response(BlockChainBuildDeploySerializer(build_deploy).data)
+
+
+def job_accepted_response(request, job):
+    """
+    Response for a queued DroneJob
+    """
+    url = reverse('drone_job_detail', args=[job.id], request=request)
+    return Response({
+        "id": job.id,
+        "status": job.status,
+        "url": url,
+    }, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
 
 class APIRootView(APIView):
     """
@@ -45,12 +109,18 @@ class APIRootView(APIView):
             'admin/blockchains/terminations': reverse('blockchain_terminate', request=request,
                                                                         format=format),
             'admin/droneciservers': reverse('droneciserver_list', request=request, format=format),
+            'admin/events': reverse('event_list', request=request, format=format),
+            'admin/exports/blockchains': reverse('export_detail', args=['blockchains'], request=request),
+            'admin/exports/organizations': reverse('export_detail', args=['organizations'], request=request),
+            'admin/exports/builds-deploys': reverse('export_detail', args=['builds-deploys'], request=request),
             'admin/organizations': reverse('organization_list', request=request, format=format),
+            'admin/stats': reverse('request_stats', request=request, format=format),
             'admin/users': reverse('user_list', request=request, format=format),
             'admin/users/profiles': reverse('user_profile', request=request, format=format),
         }
         user_urls = {
             'user/blockchains': reverse('user_blockchain_list', request=request, format=format),
+            'user/events': reverse('user_event_list', request=request, format=format),
             'user/geolocation': reverse('user_geo_location', request=request, format=format),
             'user/email/verify': reverse('email_verify', request=request, format=format),
             'user/email/verify-send': reverse('email_verify_send', request=request, format=format),
@@ -94,19 +164,34 @@ class APIRootView(APIView):
 #
 # admin views - start
 #
-class BlockChainViewSet(viewsets.ModelViewSet):
+class BlockChainViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, retrieve, update, partial update and delete actions for blockchains
+    Delete marks the blockchain deleted, ?with_deleted=true lists and retrieves deleted ones too
 
     blockchain details:
     blockchains/<pk>
     """
-    queryset = BlockChain.objects.all()
-    serializer_class = BlockChainSerializer
+    queryset = BlockChain.all_with_deleted.select_related(*LATEST_JOB_FIELDS.values())
     permission_classes = [IsAdminUser]
 
+    def get_serializer_class(self):
+        # lists do not load the keys of every blockchain
+        if self.action == 'list':
+            return BlockChainSerializer
+        return BlockChainDetailSerializer
 
-class BlockChainBuildDeployViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        queryset = self.queryset.all() if self.action == 'list' else self.queryset.select_related('keys')
+        if not with_deleted(self.request):
+            queryset = queryset.filter(deleted=False)
+        return queryset
+
+    def perform_destroy(self, instance):
+        soft_delete(instance, self.request.user)
+
+
+class BlockChainBuildDeployViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, create, retrieve, update and destroy actions for BlockChainBuildDeploy
 
@@ -126,14 +211,17 @@ class BlockChainBuildViewSet(viewsets.ViewSet):
     Create, List, retrieve blockchain builds
 
     Create: Starts build for blockchain
+    Returns the latest successful build instead if the blockchain configuration did not change
     <pk> BlockChain ID
-    POST blockchains/builds/build/<pk>
+    POST blockchains/builds/build/<pk>[?force=true]
+    Requests sent again with the same Idempotency-Key header get the first response
 
     List: Lists builds for blockchain
     <pk> BlockChain ID
     GET blockchains/builds/<pk>
+    Lists are paginated oldest first, see KeysetPagination for ?cursor=, ?page_size= and ?since=
 
-    Retrieve: Retrieves build details from remote build server
+    Retrieve: Retrieves build details, ?refresh=true fetches them from the remote build server first
     <pk> BlockChainBuildDeploy ID
     GET blockchains/builds/detail/<pk>
     """
@@ -144,190 +232,37 @@ class BlockChainBuildViewSet(viewsets.ViewSet):
         pk = self.kwargs['pk']
         build_deploy = BlockChainBuildDeploy.objects.filter(block_chain=pk, type=1).values()
 
-        return Response(build_deploy)
+        return paginated_response(request, build_deploy, self)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         pk = self.kwargs['pk']
         block_chain = get_object_or_404(BlockChain, id=pk)
-        build_deploy = BlockChainBuildDeploy.objects.filter(block_chain=block_chain, type=1).last()
 
-        if block_chain.s3_bucket_name != "None":
-            s3_bucket_name = block_chain.s3_bucket_name
-        else:
-            s3_bucket_name = env('S3_BUCKET_PREFIX')+'-'+block_chain.abbreviation
-
-        # create placeholder BuildDeploy object
-        if build_deploy is None:
-            build = BlockChainBuildDeploy.objects.create(
-                build_id=0,
-                build_no=0,
-                block_chain_id=pk,
-                created_by=request.user,
-                droneci_server_id=1,
-                status='created',
-                type=1,
-                owner=request.user
-            )
-            build.save()
-        else:
-            if build_deploy.status not in ['success', 'running', 'failure', 'created']:
-                build = BlockChainBuildDeploy.objects.create(
-                    build_id=0,
-                    build_no=0,
-                    block_chain_id=pk,
-                    created_by=request.user,
-                    droneci_server_id=1,
-                    status='created',
-                    type=1,
-                    owner=request.user
-                )
-                build.save()
-            else:
-                build = BlockChainBuildDeploy.objects.filter(block_chain=block_chain, type=1).last()
-
-        # get droneci_server
-        droneci_server = get_object_or_404(DroneCIServer, id=build_deploy.droneci_server.id)
-
-        # get remote status of the build with drone api
-        url_status = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(build.build_no)
-        response_status = request_to_drone_ci(method='GET', url=url_status, token=droneci_server.token)
-        d_status = response_status.json()
-        if 'status' in d_status:
-            job_status = d_status['status']
-            logger.debug("Found the values: %s" % job_status)
-        else:
-            job_status = None
-            logger.debug("Value of build status not found!")
-
-        # check current status of the job before creating
-        if job_status in ['success', 'running', 'pending']:
-            return Response({
-                "detail": "Can not start a new build! Current status: %s" % job_status
-            })
+        # a build of the same configuration is not run again unless forced
+        force = request.query_params.get('force', '').lower() in TRUE_VALUES
+        if not force:
+            build = same_config_build(block_chain)
+            if build is not None:
+                return Response({
+                    "detail": "Blockchain configuration did not change since build %s!" % build.id,
+                    "build": BlockChainBuildDeploySerializer(build).data,
+                })
 
-        params = 'ABBREVIATION='+block_chain.abbreviation+'&' \
-                 'BOOMPOW_VERSION='+block_chain.boompow_version+'&' \
-                 'BOOMPOW_PAYOUT_ADDRESS='+block_chain.boompow_payout_address+'&' \
-                 'BLOCK_NAME='+block_chain.name+'&' \
-                 'DEBUG='+block_chain.debug+'&' \
-                 'ENABLE_CUSTOM_DOMAIN='+str(block_chain.enable_custom_domain)+'&' \
-                 'CUSTOM_DOMAIN='+block_chain.custom_domain+'&' \
-                 'DOMAINSVC='+block_chain.domain_svc+'&' \
-                 'FAUCET_PUBLIC_KEY='+block_chain.faucet_public_key+'&' \
-                 'LANDING_PUBLIC_KEY='+block_chain.landing_public_key+'&' \
-                 'CANARY_BETA_PUBLIC_KEY='+block_chain.canary_beta_public_key+'&' \
-                 'CANARY_LIVE_PUBLIC_KEY='+block_chain.canary_live_public_key+'&' \
-                 'CANARY_TEST_PUBLIC_KEY='+block_chain.canary_test_public_key+'&' \
-                 'GENESIS_DEV_PUBLIC_KEY='+block_chain.genesis_dev_public_key+'&' \
-                 'GENESIS_DEV_PRIVATE_KEY='+block_chain.genesis_dev_private_key+'&' \
-                 'GENESIS_DEV_ACCOUNT='+block_chain.genesis_dev_account+'&' \
-                 'GENESIS_DEV_WORK='+block_chain.genesis_dev_work+'&' \
-                 'GENESIS_DEV_SIGNATURE='+block_chain.genesis_dev_signature+'&' \
-                 'GENESIS_BETA_PUBLIC_KEY='+block_chain.genesis_beta_public_key+'&' \
-                 'GENESIS_BETA_ACCOUNT='+block_chain.genesis_beta_account+'&' \
-                 'GENESIS_BETA_WORK='+block_chain.genesis_beta_work+'&' \
-                 'GENESIS_BETA_SIGNATURE='+block_chain.genesis_beta_signature+'&' \
-                 'GENESIS_LIVE_PUBLIC_KEY='+block_chain.genesis_live_public_key+'&' \
-                 'GENESIS_LIVE_ACCOUNT='+block_chain.genesis_live_account+'&' \
-                 'GENESIS_LIVE_WORK='+block_chain.genesis_live_work+'&' \
-                 'GENESIS_LIVE_SIGNATURE='+block_chain.genesis_live_signature+'&' \
-                 'GENESIS_TEST_PUBLIC_KEY='+block_chain.genesis_test_public_key+'&' \
-                 'GENESIS_TEST_ACCOUNT='+block_chain.genesis_test_account+'&' \
-                 'GENESIS_TEST_WORK='+block_chain.genesis_test_work+'&' \
-                 'GENESIS_TEST_SIGNATURE='+block_chain.genesis_test_signature+'&' \
-                 'BETA_PRE_CONFIGURED_REP0='+block_chain.beta_pre_conf_rep_public_key_0+'&' \
-                 'BETA_PRE_CONFIGURED_REP1='+block_chain.beta_pre_conf_rep_public_key_1+'&' \
-                 'LIVE_PRE_CONFIGURED_REP0='+block_chain.live_pre_conf_rep_public_key_0+'&' \
-                 'LIVE_PRE_CONFIGURED_REP1='+block_chain.live_pre_conf_rep_public_key_1+'&' \
-                 'LIVE_PRE_CONFIGURED_REP2='+block_chain.live_pre_conf_rep_public_key_2+'&' \
-                 'LIVE_PRE_CONFIGURED_REP3='+block_chain.live_pre_conf_rep_public_key_3+'&' \
-                 'LIVE_PRE_CONFIGURED_REP4='+block_chain.live_pre_conf_rep_public_key_4+'&' \
-                 'LIVE_PRE_CONFIGURED_REP5='+block_chain.live_pre_conf_rep_public_key_5+'&' \
-                 'LIVE_PRE_CONFIGURED_REP6='+block_chain.live_pre_conf_rep_public_key_6+'&' \
-                 'LIVE_PRE_CONFIGURED_REP7='+block_chain.live_pre_conf_rep_public_key_7+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP0='+block_chain.live_pre_conf_rep_account_0+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP1='+block_chain.live_pre_conf_rep_account_1+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP2='+block_chain.live_pre_conf_rep_account_2+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP3='+block_chain.live_pre_conf_rep_account_3+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP4='+block_chain.live_pre_conf_rep_account_4+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP5='+block_chain.live_pre_conf_rep_account_5+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP6='+block_chain.live_pre_conf_rep_account_6+'&' \
-                 'LIVE_PRE_CONFIGURED_ACCOUNT_REP7='+block_chain.live_pre_conf_rep_account_7+'&' \
-                 'K8S_CLUSTER='+block_chain.k8s_cluster+'&' \
-                 'LOGGING='+block_chain.logging+'&' \
-                 'NANO_NETWORK='+block_chain.nano_network+'&' \
-                 'NAULT_VERSION='+block_chain.nault_version+'&' \
-                 'NAULT_PRICE_URL='+block_chain.nault_price_url+'&' \
-                 'NAULT_STORE_KEY='+block_chain.nault_store_key+'&' \
-                 'NAULT_HIDE_REP_HELP='+str(block_chain.nault_hid_rep_help)+'&' \
-                 'NINJA_VERSION='+block_chain.ninja_version+'&' \
-                 'PROXY_VERSION='+block_chain.proxy_version+'&' \
-                 'PROXY_PRICE_URL='+block_chain.proxy_price_url+'&' \
-                 'LIVE_NODE_PEERING_PORT='+block_chain.live_node_peering_port+'&' \
-                 'BETA_NODE_PEERING_PORT='+block_chain.beta_node_peering_port+'&' \
-                 'TEST_NODE_PEERING_PORT='+block_chain.test_node_peering_port+'&' \
-                 'LIVE_RPC_PORT='+block_chain.live_rpc_port+'&' \
-                 'BETA_RPC_PORT='+block_chain.beta_rpc_port+'&' \
-                 'TEST_RPC_PORT='+block_chain.test_rpc_port+'&' \
-                 'NODE_VERSION='+block_chain.node_version+'&' \
-                 'BINARY_PUBLIC='+str(block_chain.binary_public)+'&' \
-                 'S3_BUCKET_NAME='+s3_bucket_name+'&' \
-                 'NUMBER_OF_PEERS='+str(block_chain.number_of_peers)+'&' \
-                 'WORK_THRESHOLD='+str(block_chain.work_threshold)+'&' \
-                 'WORK_THRESHOLD_DEFAULT='+str(block_chain.work_threshold_default)+'&' \
-                 'WORK_RECEIVE_THRESHOLD_DEFAULT='+str(block_chain.work_receive_threshold_default)+'&' \
-                 'SUPPLY_MULTIPLIER='+str(block_chain.supply_multiplier)+'&' \
-                 'VERIGA_BUILD_DEPLOY_ID='+str(build.id)
-
-        url = droneci_server.server + \
-              '/api/repos/' + \
-              env('BUILD_DEPLOY_ORG') + \
-              '/' + \
-              env('BUILD_DEPLOY_REPO') + \
-              '/builds?branch=' + \
-              env('BUILD_DEPLOY_BRANCH') + \
-              '&' + \
-              params
-
-        response = request_to_drone_ci(method='POST', url=url, token=droneci_server.token)
-
-        # update placeholder BlockChainBuildDeploy object with real data
-        d = response.json()
-        if 'id' in d and 'number' in d:
-            build.build_id = d['id']
-            build.build_no = d['number']
-            build.status = 'running'
-            build.save()
-
-        return Response(d)
+        # a worker starts the build on drone, it replaces a successful build of another configuration
+        job = enqueue_job(block_chain, BlockChainBuildDeploy.BUILD, request.user, upgrade=True)
+        return job_accepted_response(request, job)
 
     def list(self, request, *args, **kwargs):
         build_deploy = BlockChainBuildDeploy.objects.filter(type=1).values()
 
-        return Response(build_deploy)
+        return paginated_response(request, build_deploy, self)
 
     def retrieve(self, request, *args, **kwargs):
         pk = self.kwargs['pk']
         build = get_object_or_404(BlockChainBuildDeploy, id=pk, type=1)
-        droneci_server = get_object_or_404(DroneCIServer, id=build.droneci_server.id)
 
-        url = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(build.build_no)
-
-        response = request_to_drone_ci(method='GET', url=url, token=droneci_server.token)
-
-        return Response(response.json())
+        return build_deploy_response(request, build)
 
 
 class BlockChainDeployViewSet(viewsets.ViewSet):
@@ -337,12 +272,14 @@ class BlockChainDeployViewSet(viewsets.ViewSet):
     Create: Deploy blockchain
     <pk> BlockChain ID
     POST blockchains/deploys/deploy/<pk>
+    Requests sent again with the same Idempotency-Key header get the first response
 
     List: Lists blockchain deployments
     <pk> BlockChain ID
     GET blockchains/deploys/<pk>
+    Lists are paginated oldest first, see KeysetPagination for ?cursor=, ?page_size= and ?since=
 
-    Retrieve: Retrieves blockchain deployment details
+    Retrieve: Retrieves blockchain deployment details, ?refresh=true fetches them from Drone CI first
     <pk> BlockChainBuildDeploy ID
     GET blockchains/deploys/detail/<pk>
     """
@@ -353,114 +290,23 @@ class BlockChainDeployViewSet(viewsets.ViewSet):
         pk = self.kwargs['pk']
         build_deploy = BlockChainBuildDeploy.objects.filter(block_chain=pk, type=2).values()
 
-        return Response(build_deploy)
+        return paginated_response(request, build_deploy, self)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         pk = self.kwargs['pk']
         block_chain = get_object_or_404(BlockChain, id=pk)
-        build = BlockChainBuildDeploy.objects.filter(block_chain=block_chain, type=1).last()
-        deploy = BlockChainBuildDeploy.objects.filter(block_chain=block_chain, type=2).last()
+        if block_chain.latest_build_id is None:
+            return Response({"detail": "Blockchain has no build yet!"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # can be removed if not used
-        if block_chain.s3_bucket_name != "None":
-            s3_bucket_name = block_chain.s3_bucket_name
-        else:
-            s3_bucket_name = env('S3_BUCKET_PREFIX')+'-'+block_chain.abbreviation
-
-        # create placeholder object
-        # check if object is None
-        if deploy is None:
-            # create deploy object
-            deploy = BlockChainBuildDeploy.objects.create(
-                build_id=0,
-                build_no=0,
-                block_chain_id=pk,
-                created_by=request.user,
-                droneci_server_id=1,
-                status='created',
-                type=2,
-                owner=request.user,
-                parent_build_id=build.id,
-                parent_build_number=build.build_no
-            )
-            # save object object
-            deploy.save()
-        else:
-            # check if current status of object is not in
-            if deploy.status not in ['success', 'deploying', 'failure', 'created']:
-                # create deploy object
-                deploy = BlockChainBuildDeploy.objects.create(
-                    build_id=0,
-                    build_no=0,
-                    block_chain_id=pk,
-                    created_by=request.user,
-                    droneci_server_id=1,
-                    status='created',
-                    type=2,
-                    owner=request.user,
-                    parent_build_id=build.id,
-                    parent_build_number=build.build_no
-                )
-                # save object
-                deploy.save()
-
-        # get droneci server
-        droneci_server = get_object_or_404(DroneCIServer, id=deploy.droneci_server.id)
-
-        # get remote status of the deployment with drone api
-        url_status = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(deploy.build_no)
-        response_status = request_to_drone_ci(method='GET', url=url_status, token=droneci_server.token)
-        d_status = response_status.json()
-        if 'status' in d_status:
-            job_status = d_status['status']
-            logger.debug("Found the values: %s" % job_status)
-        else:
-            job_status = None
-            logger.debug("Value of build status not found!")
-
-        if job_status in ['success', 'running', 'pending']:
-            return Response({
-                "detail": "Can not start a new deployment! Current status: %s" % job_status
-            })
-
-        params = 'ABBREVIATION=' + block_chain.abbreviation + \
-                 '&VERIGA_BUILD_DEPLOY_ID=' + str(deploy.id)
-        url = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(build.build_no) + \
-                   '/promote?target=live&' + params
-
-        # send the api request
-        response = request_to_drone_ci(method='POST', url=url, token=droneci_server.token)
-
-        # check if request returns None data
-        if 'null' in response.text:
-            return Response({"detail": "Request returned %s! I have a bad feeling about this." % response.json()})
-
-        d = response.json()
-        # create BlockChainBuildDeploy object if request-response returns valida JSON data
-        if 'id' in d and 'number' in d:
-            deploy.build_id = d['id']
-            deploy.build_no = d['number']
-            deploy.status = 'deploying'
-            deploy.save()
-
-        return Response(response.json())
+        # a worker promotes the build on drone
+        job = enqueue_job(block_chain, BlockChainBuildDeploy.DEPLOY, request.user)
+        return job_accepted_response(request, job)
 
     def list(self, request, *args, **kwargs):
         build_deploy = BlockChainBuildDeploy.objects.filter(type=2).values()
 
-        return Response(build_deploy)
+        return paginated_response(request, build_deploy, self)
 
     def restart(self, request, *args, **kwargs):
         return Response({"detail": "restart"})
@@ -468,18 +314,8 @@ class BlockChainDeployViewSet(viewsets.ViewSet):
     def retrieve(self, request, *args, **kwargs):
         pk = self.kwargs['pk']
         build = get_object_or_404(BlockChainBuildDeploy, id=pk, type=2)
-        droneci_server = get_object_or_404(DroneCIServer, id=build.droneci_server.id)
-
-        url = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(build.build_no)
-        response = request_to_drone_ci(method='GET', url=url, token=droneci_server.token)
 
-        return Response(response.json())
+        return build_deploy_response(request, build)
 
 
 class BlockChainTerminateViewset(viewsets.ViewSet):
@@ -493,12 +329,14 @@ class BlockChainTerminateViewset(viewsets.ViewSet):
     Create: Terminates blockchain and removes all data
     <pk> BlockChain ID
     POST blockchains/terminations/terminate/<pk>
+    Requests sent again with the same Idempotency-Key header get the first response
 
     List: Lists termination tasks for blockchain
     <pk> BlockChain ID
     GET blockchains/terminations/<pk>
+    Lists are paginated oldest first, see KeysetPagination for ?cursor=, ?page_size= and ?since=
 
-    Retrieve: Retrieves blockchain termination details
+    Retrieve: Retrieves blockchain termination details, ?refresh=true fetches them from Drone CI first
     <pk> BlockChainBuildDeploy ID
     GET blockchains/terminations/detail/<pk>
     """
@@ -506,129 +344,98 @@ class BlockChainTerminateViewset(viewsets.ViewSet):
         pk = self.kwargs['pk']
         build_deploy = BlockChainBuildDeploy.objects.filter(block_chain=pk, type=4).values()
 
-        return Response(build_deploy)
+        return paginated_response(request, build_deploy, self)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         pk = self.kwargs['pk']
         block_chain = get_object_or_404(BlockChain, id=pk)
-        build_deploy = BlockChainBuildDeploy.objects.filter(block_chain=block_chain)
-        build = BlockChainBuildDeploy.objects.filter(block_chain=block_chain, type=1).last()
-        terminate = BlockChainBuildDeploy.objects.filter(block_chain=block_chain, type=4).last()
-        droneci_server = get_object_or_404(DroneCIServer, id=terminate.droneci_server.id)
-
-        # can be removed if not used
-        if block_chain.s3_bucket_name != "None":
-            s3_bucket_name = block_chain.s3_bucket_name
-        else:
-            s3_bucket_name = env('S3_BUCKET_PREFIX')+'-'+block_chain.abbreviation
-
-        # create placeholder object
-        # check if object is None
-        if terminate is None:
-            # create deploy object
-            terminate = BlockChainBuildDeploy.objects.create(
-                build_id=0,
-                build_no=0,
-                block_chain_id=pk,
-                created_by=request.user,
-                status='created',
-                type=4,
-                owner=request.user,
-                parent_build_id=build.id,
-                parent_build_number=build.build_no
-            )
-            # save object object
-            terminate.save()
-        else:
-            # check if current status of object is not in
-            if terminate.status not in ['success', 'terminating', 'failure', 'created']:
-                # create deploy object
-                terminate = BlockChainBuildDeploy.objects.create(
-                    build_id=0,
-                    build_no=0,
-                    block_chain_id=pk,
-                    created_by=request.user,
-                    status='created',
-                    type=4,
-                    owner=request.user,
-                    parent_build_id=build.id,
-                    parent_build_number=build.build_no
-                )
-                # save object
-                terminate.save()
-
-        # get remote status of the deployment with drone api
-        url_status = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(terminate.build_no)
-        response_status = request_to_drone_ci(method='GET', url=url_status, token=droneci_server.token)
-        d_status = response_status.json()
-        if 'status' in d_status:
-            job_status = d_status['status']
-            logger.debug("Found the values: %s" % job_status)
-        else:
-            job_status = None
-            logger.debug("Value of build status not found!")
-
-        if job_status in ['success', 'running', 'pending']:
-            return Response({
-                "detail": "Can not start a new termination job! Current status: %s" % job_status
-            })
+        if block_chain.latest_build_id is None:
+            return Response({"detail": "Blockchain has no build yet!"}, status=status.HTTP_400_BAD_REQUEST)
 
-        params = 'ABBREVIATION=' + block_chain.abbreviation + \
-                 '&VERIGA_BUILD_DEPLOY_ID=' + str(terminate.id) + \
-                 '&VERIGA_BLOCK_CHAIN_ID=' + str(terminate.block_chain.id)
-        url = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(build.build_no) + \
-                   '/promote?target=live-terminate&' + params
-        response = request_to_drone_ci(method='POST', url=url, token=droneci_server.token)
-
-        # check if request returns None data
-        if 'null' in response.text:
-            return Response({"detail": "Request returned %s! I have a bad feeling about this." % response.json()})
-
-        d = response.json()
-        # create BlockChainBuildDeploy object if request-response returns valid JSON
-        if 'id' in d and 'number' in d:
-            terminate.build_id = d['id']
-            terminate.build_no = d['number']
-            terminate.status = 'terminating'
-            terminate.save()
-
-        return Response(response.json())
+        # a worker promotes the build on drone
+        job = enqueue_job(block_chain, BlockChainBuildDeploy.TERMINATE, request.user)
+        return job_accepted_response(request, job)
 
     def list(self, request, *args, **kwargs):
         build_deploy = BlockChainBuildDeploy.objects.filter(type=4).values()
 
-        return Response(build_deploy)
+        return paginated_response(request, build_deploy, self)
 
     def retrieve(self, request, *args, **kwargs):
         pk = self.kwargs['pk']
         terminate = get_object_or_404(BlockChainBuildDeploy, id=pk, type=4)
-        droneci_server = get_object_or_404(DroneCIServer, id=terminate.droneci_server.id)
 
-        url = droneci_server.server + \
-                   '/api/repos/' + \
-                   env('BUILD_DEPLOY_ORG') + \
-                   '/' + \
-                   env('BUILD_DEPLOY_REPO') + \
-                   '/builds/' + \
-                   str(terminate.build_no)
-        response = request_to_drone_ci(method='GET', url=url, token=droneci_server.token)
+        return build_deploy_response(request, terminate)
+
+
+class EventViewSet(viewsets.ViewSet):
+    """
+    Status changes of blockchains and their builds, deployments and terminations
+
+    List: Events after ?cursor=, without a cursor events from now on count.
+    Answers at once, waiting would hold the worker. Under ASGI,
+    GET async/admin/events/ waits for them and streams them as server-sent events.
+    GET events/[?cursor=<cursor>]
+    {"cursor": <cursor to ask after next>, "events": [...], "reset": false}
+    reset: events after the cursor may have been missed, reload what is followed
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def match(self, event):
+        return True
+
+    def list(self, request, *args, **kwargs):
+        start_listener()
+        try:
+            cursor = parse_cursor(request.query_params.get('cursor'))
+        except ValueError:
+            return Response({"detail": "Invalid cursor!"}, status=status.HTTP_400_BAD_REQUEST)
+
+        events, next_cursor = hub.wait(cursor, self.match, 0)
+        return Response({
+            "cursor": next_cursor if next_cursor is not None else hub.cursor(),
+            "events": events,
+            "reset": next_cursor is None,
+        })
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Streams every row of blockchains, organizations or builds-deploys
+
+    Retrieve: Rows as NDJSON, or CSV with ?output=csv
+    <name> blockchains, organizations or builds-deploys
+    GET exports/<name>[?output=ndjson|csv&fields=id,status&<field>=<value>&since=<datetime>&until=<datetime>]
+    fields: columns to export, all but the private keys by default
+    <field>=<value>: only rows with the value, since and until filter created_at
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def retrieve(self, request, *args, **kwargs):
+        name = self.kwargs['name']
+        model = EXPORTS.get(name)
+        if model is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        output = request.query_params.get('output', NDJSON)
+        if output not in CONTENT_TYPES:
+            return Response({"detail": "Invalid output %s!" % output}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = request.query_params.dict()
+        try:
+            fields = select_fields(model, params.pop('fields', None))
+            # soft deleted rows too, ?deleted=false leaves them out
+            queryset = filter_queryset(model, model._base_manager.all(), params)
+        except ExportError as e:
+            return Response({"detail": "%s!" % e}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(response.json())
+        response = StreamingHttpResponse(stream_export(queryset, fields, output), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (name, output)
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
-class DroneCIServerViewSet(viewsets.ModelViewSet):
+class DroneCIServerViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, retrieve, update actions for user DroneCI Servers
     """
@@ -637,31 +444,157 @@ class DroneCIServerViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class DroneJobViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    List, retrieve actions for queued build, deploy and terminate jobs
+
+    Retrieve: Progress of a job started with
+    POST blockchains/builds/build/<pk>, blockchains/deploys/deploy/<pk>
+    or blockchains/terminations/terminate/<pk>
+    <pk> DroneJob ID
+    GET jobs/<pk>
+    """
+    queryset = DroneJob.objects.all()
+    serializer_class = DroneJobSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+
+class RolloutViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
+    """
+    Create, List, retrieve, pause, resume, cancel fleet version rollouts
+
+    Create: Builds and deploys new versions of the selected blockchains in waves
+    POST rollouts/
+    {"selector": {"k8s_cluster": "k8s0", "node_version": "V23.0"},
+     "changes": {"node_version": "V23.1"},
+     "wave_size": 10, "cluster_concurrency": 5, "failure_threshold": 0.1}
+
+    Pause, resume, cancel: Changes the status of a rollout
+    <pk> Rollout ID
+    POST rollouts/<pk>/pause, rollouts/<pk>/resume, rollouts/<pk>/cancel
+
+    List targets: Progress of every blockchain of a rollout
+    <pk> Rollout ID
+    GET rollouts/<pk>/targets
+    """
+    queryset = Rollout.objects.all()
+    serializer_class = RolloutSerializer
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get_queryset(self):
+        # progress of every rollout in the query listing them
+        if self.action == 'list':
+            return with_progress(self.queryset)
+        return self.queryset.all()
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    def rollout_target_list(self, request, *args, **kwargs):
+        rollout = self.get_object()
+        serializer = RolloutTargetSerializer(rollout.targets.all(), many=True)
+        return Response(serializer.data)
+
+    def change_status(self, new_status):
+        rollout = self.get_object()
+        if not change_rollout_status(rollout, new_status):
+            return Response({"detail": "Can not change rollout from %s to %s!" % (rollout.status, new_status)},
+                            status=status.HTTP_409_CONFLICT)
+        rollout.refresh_from_db()
+        return Response(self.get_serializer(rollout).data)
+
+    def pause(self, request, *args, **kwargs):
+        return self.change_status(Rollout.PAUSED)
+
+    def resume(self, request, *args, **kwargs):
+        return self.change_status(Rollout.RUNNING)
+
+    def cancel(self, request, *args, **kwargs):
+        return self.change_status(Rollout.CANCELLED)
+
+
+class DroneCIServerBreakerViewSet(viewsets.ViewSet):
+    """
+    Circuit breaker, bulkhead, rate limit and scheduling state of DroneCI Servers
+    Every process keeps its own breakers and rate limit waiting statistics,
+    they are the ones of the answering process
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def list(self, request):
+        depths = queue_depths()
+        breakers = []
+        for droneci_server in DroneCIServer.objects.only('id', 'name', 'drained', 'rate_limit', 'rate_burst') \
+                .order_by('id'):
+            breaker = get_breaker(droneci_server.id).as_dict()
+            breaker.update({
+                'id': droneci_server.id,
+                'name': droneci_server.name,
+                'drained': droneci_server.drained,
+                'queued': depths.get(droneci_server.id, 0),
+                'rate_limit': droneci_server.rate_limit,
+                'rate_burst': droneci_server.rate_burst,
+                'rate_limited': get_rate_limit_stats(droneci_server.id).as_dict(),
+            })
+            breakers.append(breaker)
+        return Response({'pid': os.getpid(), 'breakers': breakers})
+
+
+class RequestStatsViewSet(viewsets.ViewSet):
+    """
+    Wall time, database time, queries, duplicate queries and outbound Drone CI
+    and geo location call time of requests by url name
+
+    Percentiles are over the last REQUEST_STATS_WINDOW requests of each endpoint.
+    Every process keeps its own statistics, they are the ones of the answering process
+
+    List: GET stats/
+    Reset: DELETE stats/
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def list(self, request):
+        return Response({'pid': os.getpid(), 'endpoints': get_request_stats()})
+
+    def destroy(self, request):
+        reset_request_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     list, create, retrieve, update and destroy actions for users
 
     for user details:
     users/<pk>
     """
-    queryset = User.objects.all().order_by('id')
+    queryset = User.objects.select_related('profile').prefetch_related('groups', 'user_permissions').order_by('id')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
 
 
-class OrganizationViewSet(viewsets.ModelViewSet):
+class OrganizationViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, retrieve, update, partial update and delete actions for organizations
+    Delete marks the organization deleted, ?with_deleted=true lists and retrieves deleted ones too
 
     for organization details:
     organizations/<pk>/
     """
-    queryset = Organization.objects.all().order_by('id')
+    queryset = Organization.all_with_deleted.order_by('id')
     serializer_class = OrganizationSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
 
+    def get_queryset(self):
+        if with_deleted(self.request):
+            return self.queryset.all()
+        return self.queryset.filter(deleted=False)
+
+    def perform_destroy(self, instance):
+        soft_delete(instance, self.request.user)
 
-class ProfileViewSet(viewsets.ModelViewSet):
+
+class ProfileViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, retrieve, update actions for user profiles
     """
@@ -676,7 +609,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
 #
 # user views - start
 #
-class BlockChainUserViewSet(viewsets.ModelViewSet):
+class BlockChainUserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, retrieve, update, partial update and delete actions for blockchains
 
@@ -689,12 +622,33 @@ class BlockChainUserViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action == 'update' or self.action == 'patch':
             return BlockChainUserUpdatePatchSerializer
-        return BlockChainUserSerializer
+        # lists do not load the keys of every blockchain
+        if self.action == 'list':
+            return BlockChainUserSerializer
+        return BlockChainUserDetailSerializer
 
     def get_queryset(self):
         user = self.request.user
 
-        return BlockChain.objects.filter(owner=user)
+        queryset = BlockChain.objects.filter(owner=user).select_related(*LATEST_JOB_FIELDS.values())
+        if self.action == 'list':
+            return queryset
+        return queryset.select_related('keys')
+
+    def perform_destroy(self, instance):
+        soft_delete(instance, self.request.user)
+
+
+class EventUserViewSet(EventViewSet):
+    """
+    Status changes of the blockchains of the user and their builds, deployments and terminations
+    Same as admin events, GET async/user/events/ waits for them under ASGI
+    GET user/events/[?cursor=<cursor>]
+    """
+    permission_classes = [IsAuthenticated]
+
+    def match(self, event):
+        return event.get('owner') == self.request.user.id
 
 
 class GeoLocationUserViewSet(viewsets.GenericViewSet):
@@ -705,8 +659,9 @@ class GeoLocationUserViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
 
     def retrieve(self, request, *args, **kwargs):
-        response = requests.get(env('GEO_LOCATION_API_URL') + '?apiKey='
-                                + env('GEO_LOCATION_API_KEY'))
+        with outbound('geo'):
+            response = requests.get(env('GEO_LOCATION_API_URL') + '?apiKey='
+                                    + env('GEO_LOCATION_API_KEY'))
         geo_data = response.json()
         return Response(geo_data)
 
@@ -764,7 +719,7 @@ class EmailVerifyViewSet(viewsets.GenericViewSet):
             return Response({'error': 'Invalid / Missing Token'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class OrganizationUserViewSet(viewsets.ModelViewSet):
+class OrganizationUserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     List, retrieve, update, partial update and delete actions for organizations
 
@@ -780,6 +735,9 @@ class OrganizationUserViewSet(viewsets.ModelViewSet):
 
         return Organization.objects.filter(owner=user)
 
+    def perform_destroy(self, instance):
+        soft_delete(instance, self.request.user)
+
     def create(self, request, *args, **kwargs):
         serializer = OrganizationUserSerializer(data=request.data)
         if serializer.is_valid():
@@ -788,7 +746,7 @@ class OrganizationUserViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserUserViewSet(viewsets.ModelViewSet):
+class UserUserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     Retrieve, update, partial update and delete actions for user
     """
@@ -800,7 +758,7 @@ class UserUserViewSet(viewsets.ModelViewSet):
         return self.request.user
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     Retrieve, update, partial update and delete actions for profile
     """
@@ -861,6 +819,40 @@ class ContactViewSet(viewsets.ModelViewSet):
         return Response({"success": 'Failed'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class DroneWebhookView(APIView):
+    """
+    Receives Drone CI build webhooks
+    Updates the BlockChainBuildDeploy object of the VERIGA_BUILD_DEPLOY_ID build parameter
+
+    Requests must be signed with DRONE_WEBHOOK_SECRET
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        # verify before parsing, the digest covers the raw body
+        if not verify_webhook_signature(request):
+            return Response({"detail": "Invalid signature"}, status=status.HTTP_403_FORBIDDEN)
+
+        payload = request.data if isinstance(request.data, dict) else {}
+        build = payload.get('build')
+        if payload.get('event') != 'build' or not isinstance(build, dict):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            pk = int((build.get('params') or {}).get('VERIGA_BUILD_DEPLOY_ID'))
+        except (TypeError, ValueError):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        build_deploy = save_drone_build(pk, build)
+        if build_deploy is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        remember_build(build_deploy.droneci_server, build)
+
+        return Response({"id": build_deploy.id, "status": build_deploy.status})
+
+
 class EmailTokenObtainPairView(TokenObtainPairView):
     """
     Creates JWT token pair with email authantication
@@ -17,6 +17,50 @@ env = environ.Env(
     DEBUG=(bool, False),
     DRONE_SERVER=(str, 'https://droneci.veriga.net'),
     DRONE_TOKEN=(str, ''),
+    DRONE_CONNECT_TIMEOUT=(float, 3.05),
+    DRONE_READ_TIMEOUT=(float, 10.0),
+    DRONE_MAX_RETRIES=(int, 2),
+    DRONE_RETRY_BACKOFF=(float, 0.25),
+    DRONE_RETRY_BACKOFF_MAX=(float, 2.0),
+    DRONE_POOL_MAXSIZE=(int, 10),
+    DRONE_STATUS_TTL_RUNNING=(int, 5),
+    DRONE_STATUS_TTL_FINISHED=(int, 86400),
+    DRONE_WEBHOOK_SECRET=(str, ''),
+    DRONE_WEBHOOK_MAX_SKEW=(int, 300),
+    DRONE_BREAKER_FAILURES=(int, 5),
+    DRONE_BREAKER_SLOW_CALL=(float, 5.0),
+    DRONE_BREAKER_RESET_TIMEOUT=(float, 30.0),
+    DRONE_BREAKER_HALF_OPEN_CALLS=(int, 1),
+    DRONE_BULKHEAD_SIZE=(int, 8),
+    DRONE_BULKHEAD_TIMEOUT=(float, 0.5),
+    DRONE_RATE_WAIT=(float, 1.0),
+    DRONE_JOB_WORKERS=(int, 4),
+    DRONE_JOB_POLL_INTERVAL=(float, 1.0),
+    DRONE_JOB_MAX_ATTEMPTS=(int, 5),
+    DRONE_JOB_RETRY_DELAY=(float, 5.0),
+    DRONE_JOB_RETRY_DELAY_MAX=(float, 300.0),
+    DRONE_JOB_LOCK_TIMEOUT=(int, 300),
+    ROLLOUT_INTERVAL=(float, 10.0),
+    DRONE_RECONCILE_INTERVAL=(float, 15.0),
+    DRONE_RECONCILE_BATCH_SIZE=(int, 200),
+    DRONE_RECONCILE_RATE=(float, 5.0),
+    DRONE_RECONCILE_CONCURRENCY=(int, 4),
+    DRONE_LOG_STREAM_TIMEOUT=(int, 300),
+    DRONE_LOG_READ_TIMEOUT=(float, 60.0),
+    DRONE_LOG_POLL_INTERVAL=(float, 2.0),
+    EVENTS_BUFFER_SIZE=(int, 1000),
+    EVENTS_WAIT=(float, 25.0),
+    EVENTS_STREAM_TIMEOUT=(int, 300),
+    IDEMPOTENCY_KEY_TTL=(int, 86400),
+    API_MAX_PAGE_SIZE=(int, 100),
+    EXPORT_CHUNK_SIZE=(int, 2000),
+    REQUEST_STATS_WINDOW=(int, 1000),
+    DATABASE_REPLICA_URLS=(list, []),
+    DATABASE_REPLICA_PIN_SECONDS=(int, 10),
+    DATABASE_CONN_MAX_AGE=(int, 60),
+    DATABASE_HEALTH_CHECKS=(bool, True),
+    DATABASE_HEALTH_CHECK_IDLE=(float, 30.0),
+    DATABASE_POOLED=(bool, False),
     GEO_LOCATION_API_URL=(str, ''),
     GEO_LOCATION_API_KEY=(str, ''),
     GITHUB_API_KEY=(str, ''),
@@ -83,13 +127,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'backend.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -129,6 +175,32 @@ DATABASES = {
     'default': env.db(),
 }
 
+# Read replicas, comma separated DATABASE_REPLICA_URLS
+# reads of GET requests go to them, see api.routers.ReplicaRouter
+DATABASE_REPLICAS = []
+for index, url in enumerate(env('DATABASE_REPLICA_URLS')):
+    alias = 'replica_%s' % index
+    DATABASES[alias] = env.db_url_config(url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds and checked at
+# the start of a request after DATABASE_HEALTH_CHECK_IDLE idle seconds, see api.db.check_connections
+# DATABASE_POOLED for transaction pooling proxies like pgbouncer, which do not
+# keep server side cursors between transactions
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = env('DATABASE_CONN_MAX_AGE')
+    database['DISABLE_SERVER_SIDE_CURSORS'] = env('DATABASE_POOLED')
+
+# Cache, in process by default
+# point CACHE_URL to a shared cache like pymemcache://127.0.0.1:11211
+# to share the Drone CI status cache between pods
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -193,7 +265,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
 }
 
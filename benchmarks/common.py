@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# fixture data created in the benchmark database, prints the ids as JSON
+SETUP_SCRIPT = """
+import json
+from datetime import timedelta
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.models import BlockChain, BlockChainBuildDeploy, DroneCIServer
+
+user = User.objects.create_superuser(username='bench@veriga.net', email='bench@veriga.net', password='bench')
+server = DroneCIServer.objects.create(id=1, name='bench', server=%(drone_url)r, token='bench', rate_limit=0)
+block_chains = []
+for i in range(%(block_chains)d):
+    block_chain = BlockChain.objects.create(abbreviation='B%%03d' %% i, node_version='V23.0',
+                                            created_by=user, owner=user)
+    BlockChainBuildDeploy.objects.create(block_chain=block_chain, build_id=i + 1, build_no=i + 1,
+                                         droneci_server=server, owner=user, created_by=user,
+                                         status='success', type=BlockChainBuildDeploy.BUILD)
+    block_chains.append(block_chain.id)
+# outlasts runs longer than the access token lifetime
+token = RefreshToken.for_user(user).access_token
+token.set_exp(lifetime=timedelta(hours=1))
+print(json.dumps({
+    'token': str(token),
+    'block_chains': block_chains,
+    'builds': list(BlockChainBuildDeploy.objects.values_list('id', flat=True)),
+}))
+"""
+
+
+def bench_env(workdir, **extra):
+    """
+    Environment of a throwaway backend instance backed by a sqlite database
+    """
+    env = dict(os.environ)
+    env.update({
+        'DJANGO_SETTINGS_MODULE': 'backend.settings',
+        'SECRET_KEY': 'benchmark',
+        'DEBUG': 'off',
+        'ALLOWED_HOSTS': '127.0.0.1,localhost',
+        'DATABASE_URL': env.get('BENCH_DATABASE_URL', 'sqlite:///%s' % os.path.join(workdir, 'bench.db')),
+        'FIELD_ENCRYPTION_KEY': 'm1iHgUAtn6O_XatSye0RkZrKZaAh0Y3AyFj7ACECJtY=',
+    })
+    env.update({key: str(value) for key, value in extra.items()})
+    return env
+
+
+def manage(env, *args):
+    return subprocess.run([sys.executable, 'manage.py'] + list(args), cwd=BASE_DIR, env=env,
+                          check=True, capture_output=True, text=True).stdout
+
+
+def setup_data(env, drone_url, block_chains=1):
+    manage(env, 'migrate', '--noinput')
+    output = manage(env, 'shell', '-c', SETUP_SCRIPT % {'drone_url': drone_url, 'block_chains': block_chains})
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@contextlib.contextmanager
+def serve(env, mode, port, workers=3):
+    """
+    Runs the backend with gunicorn
+    mode wsgi uses sync workers like the Dockerfile, asgi uses uvicorn workers
+    """
+    command = [sys.executable, '-m', 'gunicorn', '--bind', '127.0.0.1:%d' % port,
+               '--workers', str(workers), '--log-level', 'warning']
+    if mode == 'asgi':
+        command += ['-k', 'uvicorn.workers.UvicornWorker', 'backend.asgi']
+    else:
+        command += ['backend.wsgi']
+
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                httpx.get('http://127.0.0.1:%d/' % port, timeout=1)
+                break
+            except httpx.HTTPError:
+                if time.time() > deadline:
+                    raise RuntimeError('%s server did not start' % mode)
+                time.sleep(0.2)
+        yield 'http://127.0.0.1:%d' % port
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def _load(urls, token, concurrency):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120,
+                                 headers={'Authorization': 'Bearer %s' % token}) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                url = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return latencies, errors, elapsed
+
+
+def load(urls, token, concurrency):
+    """
+    Sends GET requests to urls with concurrency in flight
+    Returns latencies, error count and elapsed seconds
+    """
+    return asyncio.run(_load(urls, token, concurrency))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def report(label, latencies, errors, elapsed):
+    print('%-28s n=%-5d err=%-4d rps=%-8.1f p50=%-8.1fms p99=%-8.1fms' % (
+        label, len(latencies), errors, len(latencies) / elapsed,
+        percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
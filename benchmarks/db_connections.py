@@ -0,0 +1,51 @@
+"""
+Per request vs persistent database connections benchmark of list endpoints
+
+Serves the backend with sync gunicorn workers once per DATABASE_CONN_MAX_AGE,
+0 opens a connection for every request, and sends bursts of concurrent
+requests to the list endpoints. Point BENCH_DATABASE_URL to an empty postgres
+database to measure connecting and authenticating to it, sqlite connects
+to a local file and barely shows a difference.
+
+usage: python -m benchmarks.db_connections [--conn-max-age 0 60] [--concurrency 10 50]
+"""
+import argparse
+import tempfile
+
+from benchmarks.common import bench_env, setup_data, serve, load, report
+
+# list endpoints of the dashboard
+ENDPOINTS = [
+    '/api/admin/blockchains/',
+    '/api/admin/blockchains/builds/',
+    '/api/admin/organizations/',
+    '/api/user/blockchains/',
+    '/api/user/organizations/',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conn-max-age', type=int, nargs='+', default=[0, 60])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--requests', type=int, default=20, help='requests per concurrent client')
+    parser.add_argument('--block-chains', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--pooled', action='store_true', help='serve with DATABASE_POOLED')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data = setup_data(bench_env(workdir), 'http://127.0.0.1:1', block_chains=args.block_chains)
+        for conn_max_age in args.conn_max_age:
+            env = bench_env(workdir, DATABASE_CONN_MAX_AGE=conn_max_age, DATABASE_POOLED=args.pooled)
+            with serve(env, 'wsgi', args.port, workers=args.workers) as url:
+                for path in ENDPOINTS:
+                    for concurrency in args.concurrency:
+                        urls = [url + path] * (concurrency * args.requests)
+                        report('age=%d %s c=%d' % (conn_max_age, path, concurrency),
+                               *load(urls, data['token'], concurrency))
+
+
+if __name__ == '__main__':
+    main()
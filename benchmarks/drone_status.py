@@ -0,0 +1,53 @@
+"""
+Sync WSGI vs ASGI benchmark of drone backed build status requests
+
+Serves the backend once with sync gunicorn workers (WSGI) and once with
+uvicorn workers (ASGI) against a simulated Drone, then sends bursts of
+concurrent build status refreshes to the sync and the async endpoint.
+Drone is a DroneSimulator answering after a fixed latency. The status cache
+is off and requests go round robin over --builds builds, so every request
+waits on drone rather than on another request's lookup.
+
+usage: python -m benchmarks.drone_status [--concurrency 50 100 250 500] [--latency 0.2] [--builds 500]
+"""
+import argparse
+import tempfile
+
+from api.drone_simulator import DroneSimulator
+from benchmarks.common import bench_env, setup_data, serve, load, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 100, 250, 500])
+    parser.add_argument('--requests', type=int, default=2, help='requests per concurrent client')
+    parser.add_argument('--latency', type=float, default=0.2, help='drone latency in seconds')
+    parser.add_argument('--builds', type=int, default=500, help='builds the requests go round robin over')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    simulator = DroneSimulator(latency='fixed:%s' % args.latency)
+    drone_url = simulator.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # enough pooled drone connections and bulkhead slots for the async workers to not queue,
+        # running builds are not cached so every refresh asks drone
+        env = bench_env(workdir, DRONE_POOL_MAXSIZE=max(args.concurrency),
+                        DRONE_BULKHEAD_SIZE=max(args.concurrency), DRONE_STATUS_TTL_RUNNING=0)
+        data = setup_data(env, drone_url, block_chains=args.builds)
+        builds = data['builds']
+        # the fixture build numbers 1 to --builds, running for the whole benchmark
+        for _ in builds:
+            simulator.add_build(status='running')
+
+        for mode, path in [('wsgi', '/api/admin/blockchains/builds/detail/%d?refresh=true'),
+                           ('asgi', '/api/async/admin/blockchains/builds/detail/%d?refresh=true')]:
+            with serve(env, mode, args.port, workers=args.workers) as url:
+                for concurrency in args.concurrency:
+                    urls = [url + path % builds[i % len(builds)] for i in range(concurrency * args.requests)]
+                    report('%s c=%d' % (mode, concurrency), *load(urls, data['token'], concurrency))
+
+
+if __name__ == '__main__':
+    main()
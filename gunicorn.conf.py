@@ -0,0 +1,15 @@
+"""
+Gunicorn settings, read from the working directory by gunicorn
+"""
+
+
+def post_worker_init(worker):
+    """
+    Connects sync workers to the database before they take requests
+    Other workers serve requests from threads with their own connections
+    """
+    from gunicorn.workers.sync import SyncWorker
+
+    if isinstance(worker, SyncWorker):
+        from api.db import warmup_connections
+        warmup_connections()
@@ -0,0 +1,26 @@
+{{- define "backend.env" -}}
+- name: DEBUG
+  value: "{{ .Values.app.debug }}"
+- name: SECRET_KEY
+  value: "{{ .Values.app.secretKey }}"
+- name: DATABASE_URL
+  value: "{{ .Values.app.databaseURL }}"
+- name: ALLOWED_HOSTS
+  value: "{{ .Values.app.allowedHosts }}"
+- name: EMAIL_URL
+  value: "{{ .Values.app.emailURL }}"
+- name: GEO_LOCATION_API_URL
+  value: "{{ .Values.app.geoLocationAPIURL }}"
+- name: GEO_LOCATION_API_KEY
+  value: "{{ .Values.app.geoLocationAPIKey }}"
+- name: GITHUB_API_KEY
+  value: "{{ .Values.app.githubAPIKey }}"
+- name: DRONE_TOKEN
+  value: "{{ .Values.app.droneToken }}"
+- name: DRONE_WEBHOOK_SECRET
+  value: "{{ .Values.app.droneWebhookSecret }}"
+- name: BUILD_DEPLOY_REPO
+  value: "{{ .Values.app.buildDeployRepo }}"
+- name: FIELD_ENCRYPTION_KEY
+  value: "{{ .Values.app.fieldEncryptionKey }}"
+{{- end }}